@@ -1,11 +1,24 @@
 import os
-from typing import List, Dict
-import psycopg2.extras
+from typing import List, Dict, Tuple, Optional, Iterator
+import numpy as np
 import psycopg2
 from dotenv import load_dotenv
+from migrations import apply_migrations
+from analytics import NetworkAnalytics, print_report as print_statistics_report
+from city_search import CitySearchIndex, KIND_TITLES
+from spatial import AirportLocator, routes_by_distance
+from route_planner import RoutePlanner
+from query_cache import QueryCache, cached_method
+from pagination import paginate
+from records import Airport, AirportCursor, Record, Route, RouteBatch, RouteBatchCursor, RouteCursor, FLIGHT_RESULT
+from instrumentation import start_json_dump, stop_json_dump
+from statements import PooledStatementSession, StatementSession
+from config import QUERY_CACHE, db_params_from_env
+from city_routes import FlightSource, JOIN_SOURCE, VIEW_SOURCE, city_condition, flight_source, refresh_city_routes
+from repository import AirtravelRepository, open_repository
 
 class airtravelDatabase:
-    def __init__(self, db_params: Dict[str, str] = None):
+    def __init__(self, db_params: Dict[str, str] = None, pooled: bool = False):
         load_dotenv()
 
         if db_params is None:
@@ -13,22 +26,35 @@ class airtravelDatabase:
         else:
             self.db_params = db_params
 
-        self.connection = None
+        # Соединение в режиме autocommit/read-only с подготовленными запросами (см. statements.py);
+        # pooled - пул таких соединений для поиска из нескольких потоков (окна app.py)
+        if pooled:
+            self.session = PooledStatementSession(self.db_params)
+        else:
+            self.session = StatementSession(self.db_params)
+        self._locator = None
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_source = None
+        self._cursor_number = 0
+        self.cache = QueryCache(**QUERY_CACHE)
 
     def get_db_params_from_dotenv(self) -> Dict[str, str]:
-        params = {
-            'host': os.environ.get("HOST"),
-            'database': os.environ.get("DATABASE"),
-            'user': os.environ.get("USER_NAME"),
-            'password': os.environ.get("PASSWORD"),
-            'port': os.environ.get("PORT")
-        }
+        return db_params_from_env()
 
-        return params
+    @property
+    def connection(self):
+        """
+        Соединение сеанса; потерянное соединение открывается заново.
+        У сеанса на пуле (pooled=True) одного соединения нет: соединение
+        выдает session.transaction()
+        """
+        return self.session.ensure_connected()
 
     def connect(self):
         try:
-            self.connection = psycopg2.connect(**self.db_params)
+            self.session.connect()
             print("Успешное подключение к PostgreSQL")
             return True
 
@@ -38,34 +64,137 @@ class airtravelDatabase:
 
     def disconnect(self):
         """Закрытие соединения с базой данных"""
-        if self.connection:
-            self.connection.close()
+        if self.session.is_open():
+            self.session.close()
             print("Соединение с базой данных закрыто")
 
+    def invalidate_cache(self):
+        """Сброс кэша запросов и построенных по данным индексов (после перезагрузки данных)"""
+        self.cache.invalidate()
+        self._locator = None
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_source = None
+
+    def refresh_city_routes(self) -> bool:
+        """Пересчет представления city_routes после перезагрузки данных"""
+        try:
+            with self.session.transaction(readonly=False) as connection:
+                refresh_city_routes(connection)
+        except psycopg2.Error as e:
+            print(f"Не удалось пересчитать city_routes: {e}")
+            return False
+        self.invalidate_cache()
+        return True
+
+    def _get_flight_source(self) -> FlightSource:
+        """Поиск рейсов идет по city_routes, если представление создано и заполнено"""
+        if self._flight_source is None:
+            try:
+                with self.session.transaction() as connection:
+                    self._flight_source = flight_source(connection)
+            except psycopg2.Error as e:
+                print(f"Ошибка выполнения запроса: {e}")
+                return JOIN_SOURCE
+        return self._flight_source
+
+    def apply_migrations(self) -> bool:
+        """Применение версионированных миграций схемы (индексы для поиска)"""
+        try:
+            with self.session.transaction(readonly=False) as connection:
+                apply_migrations(connection)
+            return True
+        except psycopg2.Error as e:
+            print(f"Не удалось применить миграции схемы: {e}")
+            return False
+
+    def _get_locator(self) -> AirportLocator:
+        """Пространственный индекс по аэропортам (строится один раз по одной выборке)"""
+        if self._locator is None:
+            query = """
+            SELECT id, city, country, iata, icao, latitude, longitude
+            FROM airports
+            """
+            with self.session.transaction() as connection, \
+                    connection.cursor(cursor_factory=AirportCursor) as cursor:
+                cursor.execute(query)
+                self._locator = AirportLocator(cursor.fetchall())
+        return self._locator
+
+    def _get_route_lengths(self) -> Tuple[List[Tuple], np.ndarray]:
+        """Все маршруты и их длины по большому кругу (считаются один раз, векторно)"""
+        if self._route_lengths is None:
+            with self.session.transaction() as connection, connection.cursor() as cursor:
+                cursor.execute("SELECT airline, src_airport, dst_airport FROM routes")
+                routes = cursor.fetchall()
+            self._route_lengths = (routes, self._get_locator().route_lengths_km(routes))
+        return self._route_lengths
+
     def get_airports_by_coordinates(self, lat_min: float, lat_max: float,
-                                    lon_min: float, lon_max: float) -> List[Dict]:
+                                    lon_min: float, lon_max: float) -> List[Airport]:
 
         """
-        Поиск аэропортов в диапазоне географических координат
+        Поиск аэропортов в диапазоне географических координат.
+        Если lon_min > lon_max, диапазон проходит через 180-й меридиан
         """
-        query = """
-        SELECT id, city, country, iata, icao, latitude, longitude
-        FROM airports
-        WHERE latitude BETWEEN %s AND %s 
-        AND longitude BETWEEN %s AND %s
-        ORDER BY country, city
+        try:
+            return self._get_locator().airports_in_box(lat_min, lat_max, lon_min, lon_max)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return []
+
+    def get_airports_within_radius(self, lat: float, lon: float, radius_km: float) -> List[Airport]:
+        """
+        Поиск аэропортов в радиусе radius_km от точки (по большому кругу)
+        """
+        try:
+            return self._get_locator().airports_within_radius(lat, lon, radius_km)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return []
+
+    def get_nearest_airports(self, lat: float, lon: float, k: int = 10) -> List[Airport]:
+        """
+        Поиск k ближайших к точке аэропортов
+        """
+        try:
+            return self._get_locator().nearest_airports(lat, lon, k)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return []
+
+    def get_routes_by_distance(self, min_km: float = 0.0, max_km: float = None, limit: int = 100) -> List[Dict]:
+        """
+        Маршруты с длиной по большому кругу от min_km до max_km (км), от самых длинных
         """
+        try:
+            routes, lengths = self._get_route_lengths()
+            return routes_by_distance(routes, lengths, min_km, max_km, limit)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return []
+
+    def city_index(self) -> CitySearchIndex:
+        """Индекс подсказок по городам, аэропортам и кодам (загружается из БД один раз)"""
+        if self._city_index is None:
+            with self.session.transaction() as connection:
+                self._city_index = CitySearchIndex.from_connection(connection)
+        return self._city_index
 
+    def suggest_cities(self, text: str, limit: int = 10) -> List[Dict]:
+        """
+        Подсказки городов по началу или неточному написанию города, аэропорта, кода IATA/ICAO
+        (индекс строится один раз, дальше поиск идет без обращений к БД)
+        """
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute(query, (lat_min, lat_max, lon_min, lon_max))
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+            return self.city_index().search(text, limit)
         except psycopg2.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
             return []
 
-    def find_airport_by_city_country(self, city: str, country: str) -> List[Dict]:
+    @cached_method
+    def find_airport_by_city_country(self, city: str, country: str) -> List[Airport]:
         """
         Поиск аэропорта по городу и стране
         """
@@ -76,89 +205,231 @@ class airtravelDatabase:
         """
 
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute(query, (city, country))
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+            return self.session.fetch(query, (city, country), cursor_factory=AirportCursor)
         except psycopg2.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
             return []
 
-    def get_flights_by_city(self, city: str, country: str, flight_type: str = 'both') -> List[Dict]:
+    def find_airports_by_cities(self, cities: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Airport]]:
+        """
+        Пакетный поиск аэропортов для списка пар (город, страна) одним запросом.
+        Возвращает словарь: пара из входного списка -> найденные аэропорты
+        """
+        if not cities:
+            return {}
+        query, params = self._airports_by_cities_query(cities)
+
+        try:
+            rows = self.session.fetch(query, params, cursor_factory=AirportCursor)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            rows = []
+
+        return self._group_by_key(cities, rows, ('key_city', 'key_country'))
+
+    @staticmethod
+    def _airports_by_cities_query(cities: List[Tuple[str, str]]) -> Tuple[str, Tuple]:
+        """Все пары передаются двумя параметрами-массивами и соединяются с airports на сервере"""
+        query = """
+        SELECT k.city as key_city, k.country as key_country,
+               a.id, a.city, a.country, a.iata, a.icao, a.latitude, a.longitude
+        FROM (SELECT DISTINCT LOWER(city) as city, LOWER(country) as country
+              FROM unnest(%s::text[], %s::text[]) AS input(city, country)) k
+        JOIN airports a ON LOWER(a.city) = k.city AND LOWER(a.country) = k.country
+        """
+        return query, ([city for city, _ in cities], [country for _, country in cities])
+
+    @staticmethod
+    def _group_by_key(keys: List[Tuple], rows: List, key_columns: Tuple[str, ...]) -> Dict[Tuple, List]:
+        """
+        Раскладка строк пакетного запроса по входным ключам (сравнение без учета регистра).
+        Служебные колонки ключа из строк убираются; для ключей без строк - пустой список.
+        Строки - записи (records.py) или словари (AsyncAirtravelDatabase)
+        """
+        grouped: Dict[Tuple, List] = {}
+        for row in rows:
+            key = tuple(row[column] for column in key_columns)
+            if isinstance(row, Record):
+                row = row.without(key_columns)
+            else:
+                row = {name: value for name, value in row.items() if name not in key_columns}
+            grouped.setdefault(key, []).append(row)
+
+        # Записи неизменяемы и могут быть общими; словари копируются для каждого ключа
+        return {
+            key: [row if isinstance(row, Record) else dict(row)
+                  for row in grouped.get(tuple((value or '').lower() for value in key), [])]
+            for key in keys
+        }
+
+    @cached_method
+    def get_flights_by_city(self, city: str, country: str, flight_type: str = 'both') -> RouteBatch:
         """
         Поиск всех рейсов в или из заданного города
         flight_type: 'departure', 'arrival', 'both'
         """
-        if flight_type == 'departure':
-            query = """
-            SELECT r.airline, r.src_airport, r.dst_airport, 
-                   a1.city as src_city, a1.country as src_country,
-                   a2.city as dst_city, a2.country as dst_country
-            FROM routes r
-            JOIN airports a1 ON r.src_airport = a1.iata
-            JOIN airports a2 ON r.dst_airport = a2.iata
-            WHERE LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)
-            """
-        elif flight_type == 'arrival':
-            query = """
-            SELECT r.airline, r.src_airport, r.dst_airport, 
-                   a1.city as src_city, a1.country as src_country,
-                   a2.city as dst_city, a2.country as dst_country
-            FROM routes r
-            JOIN airports a1 ON r.src_airport = a1.iata
-            JOIN airports a2 ON r.dst_airport = a2.iata
-            WHERE LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s)
-            """
-        else:  # both
-            query = """
-            SELECT r.airline, r.src_airport, r.dst_airport, 
-                   a1.city as src_city, a1.country as src_country,
-                   a2.city as dst_city, a2.country as dst_country
-            FROM routes r
-            JOIN airports a1 ON r.src_airport = a1.iata
-            JOIN airports a2 ON r.dst_airport = a2.iata
-            WHERE (LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s))
-               OR (LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s))
+        query, params = self._flights_by_city_query(city, country, flight_type, self._get_flight_source())
+
+        try:
+            # Рейсов у крупного города тысячи: результат хранится по колонкам (RouteBatch)
+            return self.session.fetch(query, params, cursor_factory=RouteBatchCursor)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return RouteBatch(FLIGHT_RESULT._fields)
+
+    @staticmethod
+    def _flights_by_city_query(city: str, country: str, flight_type: str,
+                               source: FlightSource = JOIN_SOURCE, with_ids: bool = False) -> Tuple[str, Tuple]:
+        """
+        SQL и параметры поиска рейсов по городу для заданного типа рейсов.
+        source - соединение routes с airports или представление city_routes
+        """
+        condition, params = city_condition(source, city, country, flight_type)
+        ids = f", {source.ids}" if with_ids else ""
+
+        query = f"""
+            SELECT {source.columns}{ids}
+            FROM {source.from_clause}
+            WHERE ({condition})
             """
+        return query, params
+
+    @staticmethod
+    def _flights_page_query(city: str, country: str, flight_type: str, limit: int, after: Tuple = None,
+                            source: FlightSource = JOIN_SOURCE) -> Tuple[str, Tuple]:
+        """SQL одной страницы рейсов по городу: сортировка и продолжение по ключу source.key"""
+        query, params = airtravelDatabase._flights_by_city_query(city, country, flight_type, source, with_ids=True)
+        if after is not None:
+            query += f"  AND ({source.key}) > (%s, %s, %s, %s, %s)\n"
+            params += tuple(after)
+        query += f"            ORDER BY {source.key}\n            LIMIT %s"
+        return query, params + (limit + 1,)
+
+    def iter_flights_by_city(self, city: str, country: str, flight_type: str = 'both',
+                             itersize: int = 2000) -> Iterator[Route]:
+        """
+        Потоковый поиск рейсов по городу: строки читаются серверным курсором
+        порциями по itersize и отдаются по одной, без загрузки всего результата в память
+        """
+        query, params = self._flights_by_city_query(city, country, flight_type, self._get_flight_source())
+        self._cursor_number += 1
 
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                if flight_type == 'both':
-                    cursor.execute(query, (city, country, city, country))
-                else:
-                    cursor.execute(query, (city, country))
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+            # Серверному курсору нужна транзакция (DECLARE не работает с EXECUTE,
+            # поэтому этот запрос не подготавливается)
+            with self.session.transaction() as connection, \
+                    connection.cursor(name=f"flights_stream_{self._cursor_number}",
+                                      cursor_factory=RouteCursor) as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                yield from cursor
         except psycopg2.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
-            return []
 
+    def get_flights_by_city_page(self, city: str, country: str, flight_type: str = 'both',
+                                 limit: int = 100, after: Tuple = None) -> Tuple[List[Route], Optional[Tuple]]:
+        """
+        Постраничный поиск рейсов по городу (пагинация по ключу).
+        Возвращает строки страницы и ключ для следующей страницы (None - страниц больше нет).
+        Ключ - (airline, src_airport, dst_airport, src_id, dst_id) последней строки
+        """
+        query, params = self._flights_page_query(city, country, flight_type, limit, after,
+                                                 self._get_flight_source())
+
+        try:
+            rows = self.session.fetch(query, params, cursor_factory=RouteCursor)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return [], None
+
+        return paginate(rows, limit)
+
+    @cached_method
     def get_direct_flights(self, src_city: str, src_country: str,
-                           dst_city: str, dst_country: str) -> List[Dict]:
+                           dst_city: str, dst_country: str) -> List[Route]:
         """
         Поиск прямых рейсов между двумя городами
         """
-        query = """
-        SELECT r.airline, r.src_airport, r.dst_airport, 
-               a1.id as src_id, a2.id as dst_id
-        FROM routes r
-        JOIN airports a1 ON r.src_airport = a1.iata
-        JOIN airports a2 ON r.dst_airport = a2.iata
-        WHERE LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)
-          AND LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s)
-        """
+        query = self._direct_flights_query(self._get_flight_source())
 
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute(query, (src_city, src_country, dst_city, dst_country))
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+            return self.session.fetch(query, (src_city, src_country, dst_city, dst_country),
+                                      cursor_factory=RouteCursor)
         except psycopg2.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
             return []
 
+    @staticmethod
+    def _direct_flights_query(source: FlightSource = JOIN_SOURCE) -> str:
+        return f"""
+        SELECT r.airline, r.src_airport, r.dst_airport, {source.ids}
+        FROM {source.from_clause}
+        WHERE {source.src_condition}
+          AND {source.dst_condition}
+        """
+
+    def get_direct_flights_bulk(self, pairs: List[Tuple[str, str, str, str]]) -> Dict[Tuple[str, str, str, str], List[Route]]:
+        """
+        Пакетный поиск прямых рейсов для списка (город вылета, страна вылета,
+        город прилета, страна прилета) одним запросом.
+        Возвращает словарь: четверка из входного списка -> найденные рейсы
+        """
+        if not pairs:
+            return {}
+        query, params = self._direct_flights_bulk_query(pairs, self._get_flight_source())
+
+        try:
+            rows = self.session.fetch(query, params, cursor_factory=RouteCursor)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            rows = []
+
+        return self._group_by_key(pairs, rows, ('key_src_city', 'key_src_country',
+                                                'key_dst_city', 'key_dst_country'))
+
+    @staticmethod
+    def _direct_flights_bulk_query(pairs: List[Tuple[str, str, str, str]],
+                                   source: FlightSource = JOIN_SOURCE) -> Tuple[str, Tuple]:
+        """Все пары городов передаются четырьмя параметрами-массивами и соединяются на сервере"""
+        if source is VIEW_SOURCE:
+            joins = """
+        JOIN city_routes r ON r.src_city_key = p.src_city AND r.src_country_key = p.src_country
+                          AND r.dst_city_key = p.dst_city AND r.dst_country_key = p.dst_country"""
+        else:
+            joins = """
+        JOIN airports a1 ON LOWER(a1.city) = p.src_city AND LOWER(a1.country) = p.src_country
+        JOIN airports a2 ON LOWER(a2.city) = p.dst_city AND LOWER(a2.country) = p.dst_country
+        JOIN routes r ON r.src_airport = a1.iata AND r.dst_airport = a2.iata"""
+
+        query = f"""
+        SELECT p.src_city as key_src_city, p.src_country as key_src_country,
+               p.dst_city as key_dst_city, p.dst_country as key_dst_country,
+               r.airline, r.src_airport, r.dst_airport, {source.ids}
+        FROM (SELECT DISTINCT LOWER(src_city) as src_city, LOWER(src_country) as src_country,
+                     LOWER(dst_city) as dst_city, LOWER(dst_country) as dst_country
+              FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[])
+                   AS input(src_city, src_country, dst_city, dst_country)) p{joins}
+        """
+        return query, tuple([pair[i] for pair in pairs] for i in range(4))
+
+    @cached_method
+    def find_connections(self, src_city: str, src_country: str, dst_city: str, dst_country: str,
+                         max_stops: int = 2, rank_by: str = 'hops', limit: int = 5) -> List[Dict]:
+        """
+        Поиск маршрутов с пересадками между двумя городами
+        rank_by: 'hops' - сначала меньше перелетов, 'distance' - сначала короче путь
+        """
+        try:
+            if self._planner is None:
+                with self.session.transaction() as connection:
+                    self._planner = RoutePlanner.from_connection(connection)
+            return self._planner.find_itineraries(src_city, src_country, dst_city, dst_country,
+                                                  max_stops, rank_by, limit)
+        except psycopg2.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return []
 
-    def _get_flights_between_airports(self, src_airport: str, dst_airport: str) -> List[Dict]:
+    def _get_flights_between_airports(self, src_airport: str, dst_airport: str) -> List[Route]:
         """Получение рейсов между двумя аэропортами"""
         query = """
         SELECT airline, src_airport, dst_airport
@@ -167,9 +438,7 @@ class airtravelDatabase:
         """
 
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute(query, (src_airport, dst_airport))
-                return [dict(row) for row in cursor.fetchall()]
+            return self.session.fetch(query, (src_airport, dst_airport), cursor_factory=RouteCursor)
         except psycopg2.Error as e:
             print(f"Ошибка получения рейсов: {e}")
             return []
@@ -177,8 +446,13 @@ class airtravelDatabase:
 
 class airtravelApp:
     def __init__(self):
-        self.db = airtravelDatabase()
-        self.is_connected = False
+        load_dotenv()
+        # Размер страницы при выводе больших списков рейсов
+        self.page_size = int(os.environ.get("PAGE_SIZE", 50))
+        # Источник данных для поиска (см. repository.py): БД, копия в памяти или снимок
+        self.repository: Optional[AirtravelRepository] = None
+        # Сводная статистика кэшируется между вызовами пункта меню
+        self.analytics = NetworkAnalytics()
 
     def run(self):
         """Запуск приложения"""
@@ -186,25 +460,32 @@ class airtravelApp:
         print("ПРИЛОЖЕНИЕ ДЛЯ РАБОТЫ С ДАННЫМИ АЭРОПОРТОВ (PostgreSQL)")
         print("=" * 50)
 
-        if self.db.connect():
-            self.is_connected = True
-            print("Начинаем работу!")
-            self.main_menu()
-        else:
+        # Источник - DATA_BACKEND из .env; без БД поиск возможен по снимку данных (python snapshot.py export)
+        self.repository = open_repository(migrate=True, fallback=True)
+        if self.repository is None:
             print("Не удалось подключиться")
+            return
 
+        # Периодическая запись метрик запросов, если задан METRICS_DUMP_PATH
+        start_json_dump()
+        print("Начинаем работу!")
+        self.main_menu()
 
        # Главное меню
     def main_menu(self):
         while True:
+            # После загрузки новых данных в БД кэш и индексы строятся заново
+            self.repository.refresh()
             print("\nГЛАВНОЕ МЕНЮ:")
             print("1. Поиск аэропортов по координатам")
             print("2. Поиск аэропорта по городу и стране")
             print("3. Поиск рейсов по городу")
             print("4. Поиск прямых рейсов между городами")
-            print("5. Выход")
+            print("5. Поиск маршрутов с пересадками")
+            print("6. Статистика сети маршрутов")
+            print("7. Выход")
 
-            choice = input("\nВыберите опцию (1-5): ").strip()
+            choice = input("\nВыберите опцию (1-7): ").strip()
 
             if choice == '1':
                 self.search_by_coordinates()
@@ -215,11 +496,16 @@ class airtravelApp:
             elif choice == '4':
                 self.search_direct_flights()
             elif choice == '5':
+                self.search_connections()
+            elif choice == '6':
+                self.show_network_statistics()
+            elif choice == '7':
                 break
             else:
                 print("Неверный выбор. Попробуйте снова.")
 
-        self.db.disconnect()
+        self.repository.close()
+        stop_json_dump()
         print("Завершение работы с приложением. До свидания!")
 
     def _get_credentials(self):
@@ -231,6 +517,32 @@ class airtravelApp:
 
         return username, password
 
+    def _input_city(self) -> Tuple[str, str]:
+        """Ввод города и страны; если такого города нет, предлагаются похожие варианты"""
+        city = input("Город: ").strip()
+        country = input("Страна: ").strip()
+        if not city or self.repository.find_airport_by_city_country(city, country):
+            return city, country
+
+        # Сначала среди городов указанной страны, затем среди всех
+        suggestions = country and self.repository.suggest_cities(f"{city}, {country}", 5)
+        suggestions = suggestions or self.repository.suggest_cities(city, 5)
+        if not suggestions:
+            return city, country
+
+        print("Город не найден. Возможно, имелось в виду:")
+        for number, suggestion in enumerate(suggestions, 1):
+            note = ""
+            if suggestion['kind'] != 'city':
+                note = f" ({KIND_TITLES[suggestion['kind']]} {suggestion['match']})"
+            print(f"{number}. {suggestion['label']}{note}")
+
+        answer = input("Номер варианта (Enter - оставить как есть): ").strip()
+        if answer.isdigit() and 1 <= int(answer) <= len(suggestions):
+            suggestion = suggestions[int(answer) - 1]
+            return suggestion['city'], suggestion['country']
+        return city, country
+
     def search_by_coordinates(self):
         """Поиск аэропортов по координатам"""
         print("\n--- ПОИСК АЭРОПОРТОВ ПО КООРДИНАТАМ ---")
@@ -244,52 +556,81 @@ class airtravelApp:
             print("Ошибка: введите числовые значения для координат.")
             return
 
-        results = self.db.get_airports_by_coordinates(lat_min, lat_max, lon_min, lon_max)
+        results = self.repository.get_airports_by_coordinates(lat_min, lat_max, lon_min, lon_max)
         self.display_airports_table(results)
 
     def search_by_city_country(self):
         """Поиск аэропорта по городу и стране"""
         print("\n--- ПОИСК АЭРОПОРТА ПО ГОРОДУ И СТРАНЕ ---")
 
-        city = input("Город: ").strip()
-        country = input("Страна: ").strip()
+        city, country = self._input_city()
 
         if not city or not country:
             print("Ошибка: город и страна не могут быть пустыми.")
             return
 
-        results = self.db.find_airport_by_city_country(city, country)
+        results = self.repository.find_airport_by_city_country(city, country)
         self.display_airports_table(results)
 
     def search_flights_by_city(self):
         """Поиск рейсов по городу"""
         print("\n--- ПОИСК РЕЙСОВ ПО ГОРОДУ ---")
 
-        city = input("Город: ").strip()
-        country = input("Страна: ").strip()
+        city, country = self._input_city()
         flight_type = input("Тип рейсов (departure/arrival/both): ").strip().lower()
 
         if flight_type not in ['departure', 'arrival', 'both']:
             flight_type = 'both'
 
-        results = self.db.get_flights_by_city(city, country, flight_type)
-        self.display_flights_table(results)
+        self.display_flights_pages(
+            lambda after: self.repository.get_flights_by_city_page(city, country, flight_type,
+                                                                   self.page_size, after))
 
     def search_direct_flights(self):
         """Поиск прямых рейсов между городами"""
         print("\n--- ПОИСК ПРЯМЫХ РЕЙСОВ ---")
 
         print("Город отправления:")
-        src_city = input("Город: ").strip()
-        src_country = input("Страна: ").strip()
+        src_city, src_country = self._input_city()
 
         print("Город назначения:")
-        dst_city = input("Город: ").strip()
-        dst_country = input("Страна: ").strip()
+        dst_city, dst_country = self._input_city()
 
-        results = self.db.get_direct_flights(src_city, src_country, dst_city, dst_country)
+        results = self.repository.get_direct_flights(src_city, src_country, dst_city, dst_country)
         self.display_direct_flights_table(results)
 
+    def search_connections(self):
+        """Поиск маршрутов с пересадками"""
+        print("\n--- ПОИСК МАРШРУТОВ С ПЕРЕСАДКАМИ ---")
+
+        print("Город отправления:")
+        src_city, src_country = self._input_city()
+
+        print("Город назначения:")
+        dst_city, dst_country = self._input_city()
+
+        try:
+            max_stops = int(input("Максимум пересадок (0-3): ").strip() or 2)
+        except ValueError:
+            print("Ошибка: число пересадок должно быть целым.")
+            return
+        max_stops = min(max(max_stops, 0), 3)
+
+        rank_by = input("Сортировка (hops/distance): ").strip().lower()
+        if rank_by not in ['hops', 'distance']:
+            rank_by = 'hops'
+
+        results = self.repository.find_connections(src_city, src_country, dst_city, dst_country,
+                                                   max_stops, rank_by)
+        self.display_connections_table(results)
+
+    def show_network_statistics(self):
+        """Сводная статистика: загруженные аэропорты, авиакомпании, длинные маршруты, страны"""
+        try:
+            print_statistics_report(self.repository.statistics(self.analytics))
+        except psycopg2.Error as e:
+            print(f"Ошибка расчета статистики: {e}")
+
     def display_airports_table(self, airports: List[Dict]):
         """Отображение таблицы аэропортов"""
         if not airports:
@@ -318,16 +659,54 @@ class airtravelApp:
             print("Рейсы не найдены.")
             return
 
+        self._print_flights_header()
+        for flight in flights:
+            self._print_flight_row(flight)
+
+        print(f"\nНайдено рейсов: {len(flights)}")
+
+    def display_flights_pages(self, fetch_page):
+        """
+        Постраничное отображение рейсов: fetch_page(after) -> (рейсы, ключ следующей страницы).
+        Следующая страница запрашивается у БД только по желанию пользователя
+        """
+        shown = 0
+        after = None
+
+        while True:
+            flights, after = fetch_page(after)
+            if not flights and not shown:
+                print("Рейсы не найдены.")
+                return
+
+            if not shown:
+                self._print_flights_header()
+            for flight in flights:
+                self._print_flight_row(flight)
+            shown += len(flights)
+
+            if after is None:
+                break
+            answer = input(f"\nПоказано рейсов: {shown}. Показать еще? (y/n): ").strip().lower()
+            if answer != 'y':
+                break
+
+        if after is None:
+            print(f"\nНайдено рейсов: {shown}")
+        else:
+            print(f"\nПоказано рейсов: {shown} (есть еще)")
+
+    @staticmethod
+    def _print_flights_header():
         print("\n" + "=" * 120)
         print(f"{'Авиакомпания':<15} {'Откуда':<20} {'Куда':<20} {'Город отправления':<20} {'Город назначения':<20}")
         print("=" * 120)
 
-        for flight in flights:
-            print(f"{flight.get('airline', ''):<15} {flight.get('src_airport', ''):<20} "
-                  f"{flight.get('dst_airport', ''):<20} "
-                  f"{flight.get('src_city', ''):<20} {flight.get('dst_city', ''):<20}")
-
-        print(f"\nНайдено рейсов: {len(flights)}")
+    @staticmethod
+    def _print_flight_row(flight: Dict):
+        print(f"{flight.get('airline', ''):<15} {flight.get('src_airport', ''):<20} "
+              f"{flight.get('dst_airport', ''):<20} "
+              f"{flight.get('src_city', ''):<20} {flight.get('dst_city', ''):<20}")
 
     def display_direct_flights_table(self, flights: List[Dict]):
         """Отображение таблицы прямых рейсов"""
@@ -345,6 +724,24 @@ class airtravelApp:
 
         print(f"\nНайдено прямых рейсов: {len(flights)}")
 
+    def display_connections_table(self, itineraries: List[Dict]):
+        """Отображение найденных маршрутов с пересадками"""
+        if not itineraries:
+            print("Маршруты не найдены.")
+            return
+
+        print("\n" + "=" * 100)
+        print(f"{'№':<4} {'Маршрут':<45} {'Пересадки':<10} {'Расстояние, км':<15}")
+        print("=" * 100)
+
+        for number, itinerary in enumerate(itineraries, 1):
+            print(f"{number:<4} {' -> '.join(itinerary['airports']):<45} "
+                  f"{itinerary['stops']:<10} {itinerary['distance_km']:<15}")
+            for leg in itinerary['legs']:
+                print(f"     {leg['src_airport']} ({leg['src_city']}) -> {leg['dst_airport']} ({leg['dst_city']}): "
+                      f"{', '.join(leg['airlines'])}")
+
+        print(f"\nНайдено маршрутов: {len(itineraries)}")
 
 # Запуск приложения
 if __name__ == "__main__":
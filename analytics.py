@@ -0,0 +1,384 @@
+"""
+Сводная статистика сети маршрутов: самые загруженные аэропорты (по числу
+маршрутов), крупнейшие авиакомпании, самые длинные маршруты и связность
+по странам.
+
+Для БД каждая статистика - один агрегирующий SQL-запрос, без выгрузки строк
+в приложение. Результаты кэшируются вместе с версиями таблиц, от которых они
+зависят (таблица table_versions, миграция 7: версия увеличивается триггером
+при любом изменении строк). При следующем запросе пересчитываются только
+статистики, у которых изменилась хотя бы одна из их таблиц: после загрузки
+новых авиакомпаний пересчитывается только рейтинг авиакомпаний.
+
+Для InMemoryAirtravelStore и SnapshotStore (данные в них не меняются)
+та же статистика считается по данным в памяти один раз.
+
+Командная строка:
+    python analytics.py [--limit N] [--json]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+from memory_store import InMemoryAirtravelStore
+
+DEFAULT_LIMIT = 10
+
+TABLE_VERSIONS_SQL = "SELECT table_name, version FROM table_versions"
+
+# Аэропорт на каждый код IATA (коды в routes ссылаются на airports.iata)
+_AIRPORTS_BY_IATA = """
+    SELECT DISTINCT ON (iata) iata, airport, city, country, latitude, longitude
+    FROM airports
+    WHERE iata <> ''
+    ORDER BY iata, id COLLATE "C"
+"""
+
+
+class Statistic(NamedTuple):
+    name: str
+    title: str
+    # Таблицы, при изменении которых статистика пересчитывается
+    tables: Tuple[str, ...]
+    query: str
+
+
+STATISTICS: Tuple[Statistic, ...] = (
+    Statistic(
+        'summary', "Сеть в целом", ('airports', 'airlines', 'routes'),
+        """
+        SELECT (SELECT count(*) FROM airports) AS airports,
+               (SELECT count(*) FROM airlines) AS airlines,
+               (SELECT count(*) FROM routes) AS routes,
+               (SELECT count(DISTINCT country) FROM airports WHERE country <> '') AS countries,
+               (SELECT count(*) FROM (SELECT src_airport FROM routes
+                                      UNION SELECT dst_airport FROM routes) codes) AS served_airports
+        """,
+    ),
+    Statistic(
+        'busiest_airports', "Самые загруженные аэропорты", ('airports', 'routes'),
+        f"""
+        WITH legs AS (
+            SELECT src_airport AS iata, dst_airport AS other, 1 AS departure FROM routes
+            UNION ALL
+            SELECT dst_airport, src_airport, 0 FROM routes
+        ), degrees AS (
+            SELECT iata, sum(departure) AS departures, count(*) - sum(departure) AS arrivals,
+                   count(*) AS routes, count(DISTINCT other) AS destinations
+            FROM legs
+            GROUP BY iata
+        )
+        SELECT d.iata, a.airport, a.city, a.country,
+               d.departures::integer, d.arrivals::integer, d.routes, d.destinations
+        FROM degrees d
+        JOIN ({_AIRPORTS_BY_IATA}) a ON a.iata = d.iata
+        ORDER BY d.routes DESC, d.iata COLLATE "C"
+        LIMIT %(limit)s
+        """,
+    ),
+    Statistic(
+        'top_airlines', "Авиакомпании с наибольшим числом маршрутов", ('airlines', 'routes'),
+        """
+        WITH carriers AS (
+            SELECT airline, count(*) AS routes FROM routes GROUP BY airline
+        ), served AS (
+            SELECT airline, count(*) AS airports
+            FROM (SELECT airline, src_airport FROM routes
+                  UNION SELECT airline, dst_airport FROM routes) codes
+            GROUP BY airline
+        ), names AS (
+            -- Коды IATA авиакомпаний повторяются: берется действующая, затем с меньшим id
+            SELECT DISTINCT ON (iata) iata, name, country
+            FROM airlines
+            WHERE iata <> ''
+            ORDER BY iata, active <> 'Y', id COLLATE "C"
+        )
+        SELECT c.airline, COALESCE(n.name, '') AS name, COALESCE(n.country, '') AS country,
+               c.routes, s.airports
+        FROM carriers c
+        JOIN served s ON s.airline = c.airline
+        LEFT JOIN names n ON n.iata = c.airline
+        ORDER BY c.routes DESC, c.airline COLLATE "C"
+        LIMIT %(limit)s
+        """,
+    ),
+    Statistic(
+        'longest_routes', "Самые длинные маршруты", ('airports', 'routes'),
+        f"""
+        WITH lengths AS (
+            SELECT r.airline, r.src_airport, a1.city AS src_city, a1.country AS src_country,
+                   r.dst_airport, a2.city AS dst_city, a2.country AS dst_country,
+                   2 * 6371.0088 * asin(least(1.0, sqrt(
+                       sin(radians(a2.latitude - a1.latitude) / 2) ^ 2
+                       + cos(radians(a1.latitude)) * cos(radians(a2.latitude))
+                         * sin(radians(a2.longitude - a1.longitude) / 2) ^ 2))) AS distance
+            FROM routes r
+            JOIN ({_AIRPORTS_BY_IATA}) a1 ON a1.iata = r.src_airport
+            JOIN ({_AIRPORTS_BY_IATA}) a2 ON a2.iata = r.dst_airport
+        )
+        SELECT airline, src_airport, src_city, src_country, dst_airport, dst_city, dst_country,
+               round(distance::numeric, 1)::float8 AS distance_km
+        FROM lengths
+        ORDER BY distance_km DESC, airline COLLATE "C", src_airport COLLATE "C", dst_airport COLLATE "C"
+        LIMIT %(limit)s
+        """,
+    ),
+    Statistic(
+        'countries', "Связность по странам", ('airports', 'routes'),
+        f"""
+        WITH legs AS (
+            SELECT a1.country, a2.country AS other
+            FROM routes r
+            JOIN ({_AIRPORTS_BY_IATA}) a1 ON a1.iata = r.src_airport
+            JOIN ({_AIRPORTS_BY_IATA}) a2 ON a2.iata = r.dst_airport
+        ), countries AS (
+            SELECT country, count(*) AS airports FROM airports WHERE country <> '' GROUP BY country
+        )
+        SELECT c.country, c.airports,
+               count(l.other) AS routes,
+               count(l.other) FILTER (WHERE l.other = c.country) AS domestic,
+               count(l.other) FILTER (WHERE l.other <> c.country) AS international,
+               count(DISTINCT l.other) FILTER (WHERE l.other <> c.country) AS destinations
+        FROM countries c
+        LEFT JOIN legs l ON l.country = c.country
+        GROUP BY c.country, c.airports
+        ORDER BY routes DESC, c.country COLLATE "C"
+        """,
+    ),
+)
+
+
+def table_versions(connection) -> Dict[str, int]:
+    """Версии таблиц данных; пустой словарь, если миграция 7 еще не применена"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(TABLE_VERSIONS_SQL)
+            return dict(cursor.fetchall())
+    except psycopg2.Error:
+        connection.rollback()
+        return {}
+
+
+class NetworkAnalytics:
+    """
+    Кэш сводной статистики. report() принимает соединение с БД (airtravelDatabase.connection
+    или соединение из пула app.py) либо хранилище в памяти
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT):
+        self.limit = limit
+        # Имя статистики -> (версии ее таблиц, строки результата)
+        self._results: Dict[str, Tuple[Tuple, List[Dict]]] = {}
+        # Окно статистики в app.py вызывает report() из рабочих потоков
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._results.clear()
+
+    def report(self, source) -> Dict:
+        """
+        Все статистики: {'summary': {...}, 'busiest_airports': [...], ...,
+        'recomputed': [пересчитанные статистики], 'seconds': время}
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if isinstance(source, InMemoryAirtravelStore):
+                recomputed = self._update_from_store(source)
+            else:
+                recomputed = self._update_from_connection(source)
+            report = {name: rows for name, (_, rows) in self._results.items()}
+
+        report['summary'] = report['summary'][0] if report['summary'] else {}
+        report['recomputed'] = recomputed
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        return report
+
+    def _update_from_connection(self, connection) -> List[str]:
+        versions = table_versions(connection)
+        recomputed = []
+        try:
+            with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                for statistic in STATISTICS:
+                    key = tuple(versions.get(table) for table in statistic.tables)
+                    cached = self._results.get(statistic.name)
+                    # Без table_versions изменения не отследить: пересчет каждый раз
+                    if cached is not None and cached[0] == key and None not in key:
+                        continue
+                    cursor.execute(statistic.query, {'limit': self.limit})
+                    self._results[statistic.name] = (key, [dict(row) for row in cursor.fetchall()])
+                    recomputed.append(statistic.name)
+        finally:
+            if not connection.autocommit:
+                connection.rollback()
+        return recomputed
+
+    def _update_from_store(self, store: InMemoryAirtravelStore) -> List[str]:
+        key = ('store', id(store))
+        if all(self._results.get(statistic.name, (None,))[0] == key for statistic in STATISTICS):
+            return []
+        results = store_statistics(store, self.limit)
+        for statistic in STATISTICS:
+            self._results[statistic.name] = (key, results[statistic.name])
+        return [statistic.name for statistic in STATISTICS]
+
+
+def store_statistics(store: InMemoryAirtravelStore, limit: int = DEFAULT_LIMIT) -> Dict[str, List[Dict]]:
+    """Те же статистики, что и STATISTICS, по данным хранилища в памяти"""
+    by_iata: Dict[str, Tuple] = {}
+    countries = Counter()
+    for airport in store.airports:
+        airport_id, _, _, country, iata = airport[:5]
+        if iata and (iata not in by_iata or airport_id < by_iata[iata][0]):
+            by_iata[iata] = airport
+        if country:
+            countries[country] += 1
+
+    airline_names: Dict[str, Tuple] = {}
+    for airline in store.airlines:
+        airline_id, name, _, iata, _, _, country, active = airline
+        rank = (active != 'Y', airline_id)
+        if iata and (iata not in airline_names or rank < airline_names[iata][0]):
+            airline_names[iata] = (rank, name, country)
+
+    departures, arrivals = Counter(), Counter()
+    neighbours: Dict[str, set] = defaultdict(set)
+    carrier_routes = Counter()
+    carrier_airports: Dict[str, set] = defaultdict(set)
+    legs: Dict[str, List[str]] = defaultdict(list)
+    for airline, src, dst in store.routes:
+        departures[src] += 1
+        arrivals[dst] += 1
+        neighbours[src].add(dst)
+        neighbours[dst].add(src)
+        carrier_routes[airline] += 1
+        carrier_airports[airline].update((src, dst))
+        if src in by_iata and dst in by_iata:
+            legs[by_iata[src][3]].append(by_iata[dst][3])
+
+    summary = {
+        'airports': len(store.airports),
+        'airlines': len(store.airlines),
+        'routes': len(store.routes),
+        'countries': len(countries),
+        'served_airports': len(neighbours),
+    }
+
+    degrees = sorted((code for code in neighbours if code in by_iata),
+                     key=lambda code: (-(departures[code] + arrivals[code]), code))
+    busiest = []
+    for code in degrees[:limit]:
+        _, airport, city, country = by_iata[code][:4]
+        busiest.append({'iata': code, 'airport': airport, 'city': city, 'country': country,
+                        'departures': departures[code], 'arrivals': arrivals[code],
+                        'routes': departures[code] + arrivals[code], 'destinations': len(neighbours[code])})
+
+    top_airlines = []
+    for code in sorted(carrier_routes, key=lambda code: (-carrier_routes[code], code))[:limit]:
+        _, name, country = airline_names.get(code, (None, '', ''))
+        top_airlines.append({'airline': code, 'name': name, 'country': country,
+                             'routes': carrier_routes[code], 'airports': len(carrier_airports[code])})
+
+    # Маршруты с длиной не меньше limit-го, чтобы равные по длине упорядочить как в SQL
+    candidates = store.get_routes_by_distance(limit=limit)
+    if len(candidates) == limit:
+        candidates = store.get_routes_by_distance(min_km=candidates[-1]['distance_km'] - 0.05,
+                                                  limit=len(store.routes))
+    longest = []
+    for route in candidates:
+        src, dst = by_iata[route['src_airport']], by_iata[route['dst_airport']]
+        longest.append({'airline': route['airline'],
+                        'src_airport': route['src_airport'], 'src_city': src[2], 'src_country': src[3],
+                        'dst_airport': route['dst_airport'], 'dst_city': dst[2], 'dst_country': dst[3],
+                        'distance_km': route['distance_km']})
+    longest.sort(key=lambda row: (-row['distance_km'], row['airline'], row['src_airport'], row['dst_airport']))
+
+    connectivity = []
+    for country, airports in countries.items():
+        others = legs.get(country, [])
+        domestic = sum(1 for other in others if other == country)
+        connectivity.append({'country': country, 'airports': airports, 'routes': len(others),
+                             'domestic': domestic, 'international': len(others) - domestic,
+                             'destinations': len({other for other in others if other != country})})
+    connectivity.sort(key=lambda row: (-row['routes'], row['country']))
+
+    return {
+        'summary': [summary],
+        'busiest_airports': busiest,
+        'top_airlines': top_airlines,
+        'longest_routes': longest[:limit],
+        'countries': connectivity,
+    }
+
+
+def print_report(report: Dict, countries_limit: Optional[int] = 20):
+    summary = report['summary']
+    print("\n--- СТАТИСТИКА СЕТИ МАРШРУТОВ ---")
+    print(f"Аэропортов: {summary.get('airports')}, из них с маршрутами: {summary.get('served_airports')}; "
+          f"авиакомпаний: {summary.get('airlines')}; маршрутов: {summary.get('routes')}; "
+          f"стран: {summary.get('countries')}")
+
+    print("\nСамые загруженные аэропорты:")
+    print(f"{'IATA':<6} {'Город':<20} {'Страна':<20} {'вылетов':>8} {'прилетов':>9} {'направлений':>12}")
+    for row in report['busiest_airports']:
+        print(f"{row['iata']:<6} {row['city'][:20]:<20} {row['country'][:20]:<20} "
+              f"{row['departures']:>8} {row['arrivals']:>9} {row['destinations']:>12}")
+
+    print("\nАвиакомпании с наибольшим числом маршрутов:")
+    print(f"{'Код':<5} {'Название':<35} {'Страна':<20} {'маршрутов':>10} {'аэропортов':>11}")
+    for row in report['top_airlines']:
+        print(f"{row['airline']:<5} {row['name'][:35]:<35} {row['country'][:20]:<20} "
+              f"{row['routes']:>10} {row['airports']:>11}")
+
+    print("\nСамые длинные маршруты:")
+    print(f"{'А/к':<5} {'Откуда':<28} {'Куда':<28} {'км':>9}")
+    for row in report['longest_routes']:
+        print(f"{row['airline']:<5} {row['src_airport'] + ' ' + row['src_city']:<28.28} "
+              f"{row['dst_airport'] + ' ' + row['dst_city']:<28.28} {row['distance_km']:>9.1f}")
+
+    countries = report['countries'][:countries_limit] if countries_limit else report['countries']
+    print(f"\nСвязность по странам (первые {len(countries)} из {len(report['countries'])}):")
+    print(f"{'Страна':<25} {'аэропортов':>10} {'маршрутов':>10} {'внутренних':>11} {'междунар.':>10} {'стран':>6}")
+    for row in countries:
+        print(f"{row['country'][:25]:<25} {row['airports']:>10} {row['routes']:>10} {row['domestic']:>11} "
+              f"{row['international']:>10} {row['destinations']:>6}")
+
+    print(f"\nРассчитано за {report['seconds']:.2f} с"
+          + (f", пересчитано: {', '.join(report['recomputed'])}" if report['recomputed'] else ", из кэша"))
+
+
+def main(argv: List[str] = None) -> int:
+    from airtravel import airtravelDatabase
+
+    parser = argparse.ArgumentParser(description="Сводная статистика сети маршрутов airtravel")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help="строк в рейтингах")
+    parser.add_argument('--json', action='store_true', help="вывести статистику в JSON")
+    args = parser.parse_args(argv)
+
+    db = airtravelDatabase()
+    if not db.connect():
+        return 1
+    try:
+        report = NetworkAnalytics(args.limit).report(db.connection)
+    except psycopg2.Error as e:
+        print(f"Ошибка расчета статистики: {e}")
+        return 1
+    finally:
+        db.disconnect()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report, countries_limit=None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
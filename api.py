@@ -0,0 +1,486 @@
+"""
+HTTP-сервис с JSON API поверх поиска AsyncAirtravelDatabase.
+
+    python api.py [--host 0.0.0.0] [--port 8080] [--pool-size 20]
+
+    GET /airports?lat_min=55&lat_max=56&lon_min=37&lon_max=38   - аэропорты в диапазоне координат
+    GET /airports/city?city=Moscow&country=Russia                - аэропорты города
+    GET /flights?city=Moscow&country=Russia&type=departure       - рейсы города постранично
+                 [&limit=100&after=<next из предыдущего ответа>]
+    GET /direct?src_city=Moscow&src_country=Russia&dst_city=London&dst_country=United Kingdom
+    GET /health                                                   - доступность БД и версия данных
+    GET /metrics[?format=prometheus]                              - счетчики сервиса и запросов к БД
+
+Сервер - HTTP/1.1 с keep-alive на asyncio, без сторонних фреймворков; все
+запросы обслуживаются одним пулом соединений asyncpg. Ответы поиска
+зависят только от параметров и версии данных (таблица table_versions,
+миграция 7), поэтому:
+    - ETag ответа - версия данных и адрес запроса: If-None-Match с тем же
+      ETag получает 304 без обращения к БД;
+    - готовые ответы (и их сжатые варианты) хранятся в LRU-кэше до смены версии;
+    - Cache-Control: public, max-age=API_CACHE_MAX_AGE.
+Версия данных перечитывается не чаще раза в API_VERSION_TTL секунд; при ее
+смене сбрасываются кэш ответов и индексы AsyncAirtravelDatabase.
+Ответы больше COMPRESS_MIN_SIZE сжимаются gzip, если клиент это принимает.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+import zlib
+from collections import Counter, OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from email.utils import formatdate
+from http import HTTPStatus
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import asyncpg
+from dotenv import load_dotenv
+
+from analytics import TABLE_VERSIONS_SQL
+from async_airtravel import AsyncAirtravelDatabase, DB_ERRORS
+from instrumentation import METRICS
+from pagination import FLIGHT_PAGE_KEY
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+# Наибольший размер строки запроса и заголовков
+MAX_HEADER_SIZE = 16 * 1024
+# Сколько ждать следующий запрос на открытом соединении, с
+KEEP_ALIVE_TIMEOUT = 15.0
+# Ответы меньше этого размера не сжимаются: выигрыш меньше затрат
+COMPRESS_MIN_SIZE = 1024
+# Ответы больше этого размера сжимаются в потоке, чтобы не задерживать другие запросы
+COMPRESS_EXECUTOR_SIZE = 256 * 1024
+COMPRESS_LEVEL = 6
+# Размер страницы рейсов по умолчанию и наибольший
+FLIGHTS_PAGE_LIMIT = 100
+FLIGHTS_MAX_LIMIT = 1000
+
+FLIGHT_TYPES = ('departure', 'arrival', 'both')
+
+
+class ApiError(Exception):
+    """Ошибка запроса: код ответа HTTP и сообщение для клиента"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    target: str
+    params: Dict[str, str]
+    headers: Dict[str, str]
+
+
+class CachedResponse(NamedTuple):
+    version: str
+    etag: str
+    body: bytes
+    gzip_body: Optional[bytes]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def dump_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+def encode_page_key(key: Optional[Tuple]) -> Optional[str]:
+    """Ключ следующей страницы рейсов -> строка для параметра after"""
+    if key is None:
+        return None
+    return base64.urlsafe_b64encode(dump_json(list(key))).decode('ascii').rstrip('=')
+
+
+def decode_page_key(token: str) -> Tuple:
+    """Параметр after -> ключ страницы: столько же строк, сколько колонок в FLIGHT_PAGE_KEY"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise ApiError(400, "Неверное значение параметра after")
+    if (not isinstance(key, list) or len(key) != len(FLIGHT_PAGE_KEY)
+            or not all(isinstance(value, str) for value in key)):
+        raise ApiError(400, "Неверное значение параметра after")
+    return tuple(key)
+
+
+def accepts_gzip(header: str) -> bool:
+    """Принимает ли клиент gzip (Accept-Encoding; gzip;q=0 - отказ)"""
+    for item in header.lower().split(','):
+        coding, _, params = item.strip().partition(';')
+        if coding.strip() in ('gzip', '*'):
+            quality = params.strip()
+            return not (quality.startswith('q=') and float(quality[2:] or 0) == 0)
+    return False
+
+
+def gzip_compress(body: bytes) -> bytes:
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _text(params: Dict[str, str], name: str) -> str:
+    value = params.get(name, '').strip()
+    if not value:
+        raise ApiError(400, f"Не задан параметр {name}")
+    return value
+
+
+def _float(params: Dict[str, str], name: str) -> float:
+    try:
+        return float(_text(params, name))
+    except ValueError:
+        raise ApiError(400, f"Параметр {name} должен быть числом")
+
+
+def _int(params: Dict[str, str], name: str, default: int, low: int, high: int) -> int:
+    if name not in params:
+        return default
+    try:
+        value = int(params[name])
+    except ValueError:
+        raise ApiError(400, f"Параметр {name} должен быть целым числом")
+    if not low <= value <= high:
+        raise ApiError(400, f"Параметр {name} должен быть от {low} до {high}")
+    return value
+
+
+class AirtravelApi:
+    """
+    Обработчики запросов API и HTTP-сервер над ними.
+    db - подключенная AsyncAirtravelDatabase, общая для всех соединений клиентов
+    """
+
+    def __init__(self, db: AsyncAirtravelDatabase, max_age: int = None, version_ttl: float = None,
+                 cache_size: int = None):
+        load_dotenv()
+        self.db = db
+        # Ошибка БД - ответ 503 без кэширования (handle_connection), а не пустой результат поиска
+        self.db.raise_errors = True
+        self.max_age = max_age if max_age is not None else int(os.environ.get("API_CACHE_MAX_AGE", 60))
+        self.version_ttl = (version_ttl if version_ttl is not None
+                            else float(os.environ.get("API_VERSION_TTL", 1)))
+        self.cache_size = (cache_size if cache_size is not None
+                           else int(os.environ.get("API_RESPONSE_CACHE_SIZE", 4096)))
+
+        self.routes = {
+            '/airports': self.airports_by_coordinates,
+            '/airports/city': self.airports_by_city,
+            '/flights': self.flights_by_city,
+            '/direct': self.direct_flights,
+        }
+        self._responses: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        # Ответы, которые сейчас формируются: одинаковые одновременные запросы ждут один расчет
+        self._rendering: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._version: Optional[str] = None
+        self._version_checked = 0.0
+        self._version_lock = asyncio.Lock()
+        self.started = time.time()
+
+        self.connections = 0
+        self.requests = 0
+        self.statuses = Counter()
+        self.cache_hits = 0
+        self.not_modified = 0
+
+    # ------------------------------------------------------------------
+    # Версия данных
+
+    async def data_version(self) -> str:
+        """Версия данных по table_versions; перечитывается не чаще раза в version_ttl секунд"""
+        if self._version is not None and time.monotonic() - self._version_checked < self.version_ttl:
+            return self._version
+
+        async with self._version_lock:
+            if self._version is not None and time.monotonic() - self._version_checked < self.version_ttl:
+                return self._version
+            try:
+                rows = await self.db.pool.fetch(TABLE_VERSIONS_SQL)
+                versions = sorted((row['table_name'], row['version']) for row in rows)
+                version = format(zlib.crc32(repr(versions).encode()), '08x')
+            except asyncpg.UndefinedTableError:
+                # Миграция 7 не применена: изменения данных не отслеживаются,
+                # версия меняется только при перезапуске сервиса
+                version = format(int(self.started), 'x')
+
+            if version != self._version:
+                if self._version is not None:
+                    print(f"Данные изменились (версия {version}), кэш ответов сброшен")
+                    self.db.invalidate_cache()
+                self._responses.clear()
+                self._version = version
+            self._version_checked = time.monotonic()
+            return version
+
+    # ------------------------------------------------------------------
+    # Обработчики поиска: параметры запроса -> данные ответа
+
+    async def airports_by_coordinates(self, params: Dict[str, str]) -> Dict:
+        results = await self.db.get_airports_by_coordinates(
+            _float(params, 'lat_min'), _float(params, 'lat_max'),
+            _float(params, 'lon_min'), _float(params, 'lon_max'))
+        return {'count': len(results), 'results': results}
+
+    async def airports_by_city(self, params: Dict[str, str]) -> Dict:
+        results = await self.db.find_airport_by_city_country(_text(params, 'city'), _text(params, 'country'))
+        return {'count': len(results), 'results': results}
+
+    async def flights_by_city(self, params: Dict[str, str]) -> Dict:
+        flight_type = params.get('type', 'both').lower()
+        if flight_type not in FLIGHT_TYPES:
+            raise ApiError(400, f"Параметр type должен быть одним из: {', '.join(FLIGHT_TYPES)}")
+        limit = _int(params, 'limit', FLIGHTS_PAGE_LIMIT, 1, FLIGHTS_MAX_LIMIT)
+        after = decode_page_key(params['after']) if params.get('after') else None
+
+        results, next_key = await self.db.get_flights_by_city_page(
+            _text(params, 'city'), _text(params, 'country'), flight_type, limit, after)
+        return {'count': len(results), 'results': results, 'next': encode_page_key(next_key)}
+
+    async def direct_flights(self, params: Dict[str, str]) -> Dict:
+        results = await self.db.get_direct_flights(
+            _text(params, 'src_city'), _text(params, 'src_country'),
+            _text(params, 'dst_city'), _text(params, 'dst_country'))
+        return {'count': len(results), 'results': results}
+
+    # ------------------------------------------------------------------
+    # Служебные запросы (не кэшируются)
+
+    async def health(self) -> Tuple[int, Dict]:
+        try:
+            await self.db.pool.fetchval("SELECT 1")
+            version = await self.data_version()
+        except DB_ERRORS as e:
+            return 503, {'status': 'unavailable', 'error': str(e)}
+        return 200, {'status': 'ok', 'data_version': version}
+
+    def metrics(self) -> Dict:
+        pool = self.db.pool
+        return {
+            'server': {
+                'uptime': round(time.time() - self.started, 3),
+                'connections': self.connections,
+                'requests': self.requests,
+                'statuses': dict(self.statuses),
+                'response_cache_hits': self.cache_hits,
+                'response_cache_size': len(self._responses),
+                'not_modified': self.not_modified,
+                'data_version': self._version,
+            },
+            'pool': {
+                'size': pool.get_size(),
+                'idle': pool.get_idle_size(),
+                'max_size': pool.get_max_size(),
+            },
+            'query_cache': self.db.cache.stats(),
+            'database': METRICS.snapshot(),
+        }
+
+    # ------------------------------------------------------------------
+    # Разбор запроса и формирование ответа
+
+    async def respond(self, request: Request) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Ответ на запрос: код, заголовки, тело (несжатое или gzip по Accept-Encoding)"""
+        if request.method not in ('GET', 'HEAD'):
+            raise ApiError(405, "Поддерживаются только запросы GET и HEAD")
+
+        if request.path == '/health':
+            status, data = await self.health()
+            return status, [('Cache-Control', 'no-store')], dump_json(data)
+        if request.path == '/metrics':
+            if request.params.get('format') == 'prometheus':
+                return 200, [('Cache-Control', 'no-store'),
+                             ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')], \
+                    METRICS.prometheus_text().encode('utf-8')
+            return 200, [('Cache-Control', 'no-store')], dump_json(self.metrics())
+
+        handler = self.routes.get(request.path)
+        if handler is None:
+            raise ApiError(404, f"Неизвестный адрес {request.path}")
+
+        version = await self.data_version()
+        cached = self._responses.get(request.target)
+        if cached is not None and cached.version == version:
+            self._responses.move_to_end(request.target)
+            self.cache_hits += 1
+        else:
+            key = (version, request.target)
+            future = self._rendering.get(key)
+            if future is None:
+                future = self._rendering[key] = asyncio.ensure_future(self._render(handler, request, version))
+                future.add_done_callback(lambda _: self._rendering.pop(key, None))
+            cached = await asyncio.shield(future)
+
+        headers = [('ETag', cached.etag), ('Cache-Control', f'public, max-age={self.max_age}'),
+                   ('Vary', 'Accept-Encoding')]
+        if cached.etag in request.headers.get('if-none-match', ''):
+            self.not_modified += 1
+            return 304, headers, b''
+        if cached.gzip_body is not None and accepts_gzip(request.headers.get('accept-encoding', '')):
+            return 200, headers + [('Content-Encoding', 'gzip')], cached.gzip_body
+        return 200, headers, cached.body
+
+    async def _render(self, handler, request: Request, version: str) -> CachedResponse:
+        """Расчет ответа поиска, его сжатие и сохранение в кэше ответов"""
+        # Слабый ETag: один и тот же ответ отдается сжатым и несжатым
+        etag = f'W/"{version}-{zlib.crc32(request.target.encode()):08x}"'
+        body = dump_json(await handler(request.params))
+        gzip_body = None
+        if len(body) >= COMPRESS_MIN_SIZE:
+            if len(body) >= COMPRESS_EXECUTOR_SIZE:
+                gzip_body = await asyncio.get_running_loop().run_in_executor(None, gzip_compress, body)
+            else:
+                gzip_body = gzip_compress(body)
+
+        cached = CachedResponse(version, etag, body, gzip_body)
+        if self.cache_size > 0 and version == self._version:
+            self._responses[request.target] = cached
+            if len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
+        return cached
+
+    @staticmethod
+    def parse_request(head: bytes) -> Request:
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise ApiError(400, "Неверная строка запроса")
+        if not version.startswith('HTTP/1.'):
+            raise ApiError(505, "Поддерживается только HTTP/1.x")
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        if version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+            headers.setdefault('connection', 'close')
+
+        url = urlsplit(target)
+        # Параметры запроса в UTF-8 (названия городов)
+        params = dict(parse_qsl(url.query, encoding='utf-8'))
+        return Request(method.upper(), url.path.rstrip('/') or '/', target, params, headers)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживание соединения клиента: запросы по очереди, пока клиент держит keep-alive"""
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    writer.write(self._message(431, [], dump_json({'error': "Слишком большие заголовки"}),
+                                               False, False))
+                    break
+
+                keep_alive, head_only = True, False
+                try:
+                    try:
+                        request = self.parse_request(head)
+                        keep_alive = request.headers.get('connection', '').lower() != 'close'
+                        head_only = request.method == 'HEAD'
+                        # Тело запроса не используется, но его нужно вычитать из потока
+                        length = int(request.headers.get('content-length') or 0)
+                        if length:
+                            await reader.readexactly(length)
+                    except (asyncio.IncompleteReadError, ValueError):
+                        # Неверный Content-Length или клиент закрыл соединение посреди тела
+                        break
+                    status, headers, body = await self.respond(request)
+                except ApiError as e:
+                    status, headers, body = e.status, [('Cache-Control', 'no-store')], dump_json({'error': e.message})
+                except DB_ERRORS as e:
+                    print(f"Ошибка выполнения запроса: {e}")
+                    status, headers, body = 503, [('Cache-Control', 'no-store')], dump_json({'error': "База данных недоступна"})
+                except Exception as e:
+                    print(f"Ошибка обработки запроса: {e}")
+                    status, headers, body = 500, [('Cache-Control', 'no-store')], dump_json({'error': "Внутренняя ошибка"})
+
+                self.requests += 1
+                self.statuses[status] += 1
+                writer.write(self._message(status, headers, body, keep_alive, head_only))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    _date_cache = (0, '')
+
+    @classmethod
+    def _date(cls) -> str:
+        now = int(time.time())
+        if cls._date_cache[0] != now:
+            cls._date_cache = (now, formatdate(now, usegmt=True))
+        return cls._date_cache[1]
+
+    def _message(self, status: int, headers: List[Tuple[str, str]], body: bytes,
+                 keep_alive: bool, head_only: bool) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Date: {self._date()}",
+                 "Server: airtravel-api"]
+        if not any(name == 'Content-Type' for name, _ in headers) and status != 304:
+            lines.append("Content-Type: application/json; charset=utf-8")
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if status != 304:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        return message if head_only or status == 304 else message + body
+
+
+async def serve(host: str, port: int, pool_size: int = None) -> int:
+    db = AsyncAirtravelDatabase(max_size=pool_size)
+    if not await db.connect():
+        return 1
+
+    api = AirtravelApi(db)
+    server = await asyncio.start_server(api.handle_connection, host, port, limit=MAX_HEADER_SIZE,
+                                        reuse_address=True)
+    print(f"API доступно по адресу http://{host}:{port}/")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await db.disconnect()
+    return 0
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="HTTP JSON API поиска аэропортов и рейсов")
+    parser.add_argument('--host', default=os.environ.get("API_HOST") or DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=int(os.environ.get("API_PORT") or DEFAULT_PORT))
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help="наибольшее число соединений с БД (по умолчанию ASYNC_POOL_SIZE)")
+    args = parser.parse_args(argv)
+
+    try:
+        return asyncio.run(serve(args.host, args.port, args.pool_size))
+    except KeyboardInterrupt:
+        print("Сервер остановлен")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,202 +1,136 @@
 from tkinter import *
 from tkinter import ttk, messagebox # подключаем пакет ttk
-import psycopg2
-from config import DB_airtravel
+import threading
+from repository import open_repository
+from gui_dispatch import SearchDispatcher, ProgressIndicator
+from instrumentation import start_json_dump, stop_json_dump
+from analytics import NetworkAnalytics
+from gui_autocomplete import EntryAutocomplete
+from gui_table import VirtualTable
 
 # ======================================================================
-# =======================  Соединение с БД  ============================
+# =======================  Источник данных  ============================
 # ======================================================================
 
-def get_db_connection():
-    try:
-        return psycopg2.connect(**DB_airtravel)
-    except Exception as e:
-        messagebox.showerror("База данных", f"Не удалось подключиться к БД:\n{e}")
-        return None
+# Пул потоков для поиска; создается вместе с корневым окном
+dispatcher = None
+
+# Источник данных окон - тот же слой, что у консольного airtravel.py (см. repository.py):
+# БД, копия в памяти или снимок по DATA_BACKEND из .env. Поиски идут в нескольких
+# потоках, поэтому запросы к БД выполняются через пул соединений
+repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    """
+    Источник открывается при первом поиске; если открыть не удалось - снова при следующем.
+    Если данные изменились (новая загрузка в БД, перезаписанный снимок), сбрасываются
+    подсказки городов и статистика окон
+    """
+    global repository
+    with _repository_lock:
+        if repository is not None and repository.refresh():
+            invalidate_caches()
+        if repository is None:
+            repository = open_repository(pooled=True, fallback=True)
+            if repository is None and dispatcher is not None:
+                # Поиск идет в рабочем потоке: окно с ошибкой показываем из потока Tk
+                dispatcher.call_in_ui(messagebox.showerror, "База данных",
+                                      "Не удалось подключиться к БД (подробности - в консоли)")
+        return repository
+
+def close_repository():
+    global repository
+    with _repository_lock:
+        if repository is not None:
+            repository.close()
+            repository = None
 
 # ======================================================================
-# ======================== SQL-функции (backend) =======================
+# ========================= Функции поиска  ============================
 # ======================================================================
 
+def invalidate_caches():
+    """Сброс загруженных окнами индексов после изменения данных (кэш источника сбрасывает repository.refresh)"""
+    global _city_index
+    _city_index = None
+    network_analytics.invalidate()
+
+# Столбцы окон результатов: (заголовок, ширина)
+CITY_COLUMNS = (("ID аэропорта", 80), ("Город", 120), ("Страна", 120), ("IATA", 80), ("ICAO", 80),
+                ("Широта", 120), ("Долгота", 120))
+FLIGHT_COLUMNS = (("Авиакомпания", 100), ("Аэропорт вылета", 100), ("Аэропорт прилета", 100),
+                  ("Город вылета", 120), ("Страна вылета", 120), ("Город прилета", 120), ("Страна прилета", 120))
+DIRECT_COLUMNS = (("Авиакомпания", 120), ("Аэропорт вылета", 120), ("Аэропорт прилета", 120))
+
+def show_results_table(parent, title, columns, results):
+    """
+    Окно результатов. В таблице (см. gui_table.py) создаются только видимые строки,
+    поэтому окно открывается сразу при любом числе результатов
+    """
+    results_window = Toplevel(parent)
+    results_window.title(title)
+    results_window.geometry("1000x400")
+
+    ttk.Button(results_window, text="Закрыть", command=results_window.destroy).pack(side="bottom", pady=10)
+
+    table = VirtualTable(results_window, columns, results)
+    table.pack(expand=True, fill="both", padx=10, pady=10)
+    return results_window
+
 def search_airports_by_coordinates(coordinates):
-    conn = get_db_connection()
-    if not conn:
+    source = get_repository()
+    if not source:
         return []
     try:
         coords = [float(coord.strip()) for coord in coordinates.split(',')]
         lat_min, lat_max, lon_min, lon_max = coords
 
-        with conn.cursor() as cur:
-            query = """
-            SELECT id, city, country, latitude, longitude
-            FROM airports
-            WHERE latitude  BETWEEN %s AND %s
-            AND longitude BETWEEN %s AND %s
-            ORDER BY country, city, id
-            """
-            cur.execute(query, (lat_min, lat_max, lon_min, lon_max))
-            results = cur.fetchall()
-        return results
+        # lon_min > lon_max - диапазон через 180-й меридиан; записи те же, что у поиска по городу
+        return source.get_airports_by_coordinates(lat_min, lat_max, lon_min, lon_max)
 
     except Exception as e:
         print(f"Ошибка выполнения запроса: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 def show_coord_results(results, coord_window):
-    results_window = Toplevel(coord_window)
-    results_window.title("Результаты поиска по координатам")
-    results_window.geometry("1000x400")
-
-    tree = ttk.Treeview(results_window, columns=("ID аэропорта", "Город", "Страна", "Широта", "Долгота"),
-                        show="headings")
-
-    tree.heading("ID аэропорта", text="ID аэропорта")
-    tree.heading("Город", text="Город")
-    tree.heading("Страна", text="Страна")
-    tree.heading("Широта", text="Широта")
-    tree.heading("Долгота", text="Долгота")
-
-    # Настраиваем ширину столбцов
-    tree.column("ID аэропорта", width=50, anchor="center")
-    tree.column("Город", width=150, anchor="center")
-    tree.column("Страна", width=150, anchor="center")
-    tree.column("Широта", width=100, anchor="center")
-    tree.column("Долгота", width=100, anchor="center")
-
-    for result in results:
-        tree.insert("", "end", values=result)
-
-    scrollbar = ttk.Scrollbar(results_window, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
-    tree.pack(side="left", expand=True, fill="both", padx=10, pady=10)
-    scrollbar.pack(side="right", fill="y")
-
-    ttk.Button(results_window, text="Закрыть", command=results_window.destroy).pack(side = "bottom", pady=10)
+    show_results_table(coord_window, "Результаты поиска по координатам", CITY_COLUMNS, results)
 
 def search_by_city_country(city, country):
-    conn = get_db_connection()
-    if not conn:
+    source = get_repository()
+    if not source:
         return []
-    try:
-        with conn.cursor() as cur:
-            query = """
-            SELECT id, city, country, iata, icao, latitude, longitude
-            FROM airports
-            WHERE LOWER(city) = LOWER(%s) AND LOWER(country) = LOWER(%s)
-            """
-            cur.execute(query, (city, country))
-            return cur.fetchall()
-    except Exception as e:
-        print(f"Ошибка поиска аэропортов: {e}")
-        return [], []
-    finally:
-        if conn:
-            conn.close()
+    return source.find_airport_by_city_country(city, country)
 
 
 def show_city_results(results, city_window):
-    results_window = Toplevel(city_window)
-    results_window.title("Результаты поиска по городу")
-    results_window.geometry("1000x400")
-
-    tree = ttk.Treeview(results_window, columns=("ID аэропорта", "Город", "Страна", "IATA", "ICAO", "Широта", "Долгота"),
-                        show="headings")
-
-    tree.heading("ID аэропорта", text="ID аэропорта")
-    tree.heading("Город", text="Город")
-    tree.heading("Страна", text="Страна")
-    tree.heading("IATA", text="IATA")
-    tree.heading("ICAO", text="ICAO")
-    tree.heading("Широта", text="Широта")
-    tree.heading("Долгота", text="Долгота")
-
-    # Настраиваем ширину столбцов
-    tree.column("ID аэропорта", width=80, anchor="center")
-    tree.column("Город", width=120, anchor="center")
-    tree.column("Страна", width=120, anchor="center")
-    tree.column("IATA", width=80, anchor="center")
-    tree.column("ICAO", width=80, anchor="center")
-    tree.column("Широта", width=120, anchor="center")
-    tree.column("Долгота", width=120, anchor="center")
-
-    for result in results:
-        tree.insert("", "end", values=result)
-
-    scrollbar = ttk.Scrollbar(results_window, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
-    tree.pack(side="left", expand=True, fill="both", padx=10, pady=10)
-    scrollbar.pack(side="right", fill="y")
-
-    ttk.Button(results_window, text="Закрыть", command=results_window.destroy).pack(side="bottom", pady=10)
+    show_results_table(city_window, "Результаты поиска по городу", CITY_COLUMNS, results)
 
 def search_flights_from_city(city, country, flight_type):
-    conn = get_db_connection()
-    if not conn:
+    source = get_repository()
+    if not source:
         return []
-
-    try:
-        with conn.cursor() as cur:
-            if flight_type == 'departure':
-                query = """
-                SELECT 
-                    r.airline, 
-                    r.src_airport, 
-                    r.dst_airport, 
-                    a1.city as src_city, 
-                    a1.country as src_country, 
-                    a2.city as dst_city, 
-                    a2.country as dst_country
-                FROM routes r
-                JOIN airports a1 ON r.src_airport = a1.iata
-                JOIN airports a2 ON r.dst_airport = a2.iata
-                WHERE LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)
-                """
-                cur.execute(query, (city, country))
-
-            elif flight_type == 'arrival':
-                query = """
-                SELECT r.airline, 
-                       r.src_airport, 
-                       r.dst_airport, 
-                       a1.city as src_city, 
-                       a1.country as src_country,
-                       a2.city as dst_city, 
-                       a2.country as dst_country
-                FROM routes r
-                JOIN airports a1 ON r.src_airport = a1.iata
-                JOIN airports a2 ON r.dst_airport = a2.iata
-                WHERE LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s)
-                """
-                cur.execute(query, (city,country))
-            else:
-                query = """
-                SELECT r.airline, 
-                       r.src_airport, 
-                       r.dst_airport, 
-                       a1.city as src_city, 
-                       a1.country as src_country,
-                       a2.city as dst_city, 
-                       a2.country as dst_country
-                FROM routes r
-                JOIN airports a1 ON r.src_airport = a1.iata
-                JOIN airports a2 ON r.dst_airport = a2.iata
-                WHERE (LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s))
-                    OR (LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s))
-                """
-                cur.execute(query, (city, country, city, country))
-
-            return cur.fetchall()
-    except Exception as e:
-        print(f"Ошибка поиска рейсов: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
-
-def show_flights_results(results, flights_window, flight_type):
+    return source.get_flights_by_city(city, country, flight_type)
+
+# Размер порции рейсов, подгружаемой в окно результатов
+FLIGHTS_PAGE_SIZE = 200
+
+def search_flights_from_city_page(city, country, flight_type, after=None, limit=FLIGHTS_PAGE_SIZE):
+    """
+    Одна страница рейсов по городу (пагинация по ключу).
+    Возвращает (строки, ключ следующей страницы или None)
+    """
+    source = get_repository()
+    if not source:
+        return [], None
+    # src_id и dst_id остаются в записях: таблица показывает только первые 7 столбцов
+    return source.get_flights_by_city_page(city, country, flight_type, limit, after)
+
+def show_flights_results(results, flights_window, flight_type, fetch_more=None):
+    """
+    Окно с рейсами. fetch_more() -> (строки, есть_еще) подгружает следующую порцию,
+    когда пользователь прокручивает таблицу до конца или нажимает "Показать еще"
+    """
     results_window = Toplevel(flights_window)
 
     if flight_type == 'departure':
@@ -209,100 +143,139 @@ def show_flights_results(results, flights_window, flight_type):
     results_window.title(f"Результаты поиска - {title}")
     results_window.geometry("1000x400")
 
-    tree = ttk.Treeview(results_window, columns=("Аэропорт вылета", "Аэропорт прилета", "Город вылета","Страна вылета",
-                                                 "Город прилета", "Страна прилета"), show="headings")
+    state = {'has_more': fetch_more is not None, 'loading': False}
 
-    tree.heading("Аэропорт вылета", text="Аэропорт вылета")
-    tree.heading("Аэропорт прилета", text="Аэропорт прилета")
-    tree.heading("Город вылета", text="Город вылета")
-    tree.heading("Страна вылета", text="Страна вылета")
-    tree.heading("Город прилета", text="Город прилета")
-    tree.heading("Страна прилета", text="Страна прилета")
+    def update_count():
+        count_label.config(text=f"Показано рейсов: {table.total}" + (" (есть еще)" if state['has_more'] else ""))
 
-    # Настраиваем ширину столбцов
-    tree.column("Аэропорт вылета", width=100, anchor="center")
-    tree.column("Аэропорт прилета", width=100, anchor="center")
-    tree.column("Город вылета", width=120, anchor="center")
-    tree.column("Страна вылета", width=120, anchor="center")
-    tree.column("Город прилета", width=120, anchor="center")
-    tree.column("Страна прилета", width=120, anchor="center")
+    def on_page(page):
+        rows, state['has_more'] = page
+        state['loading'] = False
+        table.append(rows)
+        update_count()
+        if not state['has_more']:
+            more_btn.config(state="disabled")
 
-    for result in results:
-        tree.insert("", "end", values=result)
+    def on_page_error(error):
+        state['loading'] = False
 
-    scrollbar = ttk.Scrollbar(results_window, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
-    tree.pack(side="left", expand=True, fill="both", padx=10, pady=10)
-    scrollbar.pack(side="right", fill="y")
+    def load_more():
+        if not state['has_more'] or state['loading']:
+            return
+        state['loading'] = True
+        # Следующая порция загружается в рабочем потоке, окно не блокируется
+        dispatcher.submit(results_window, fetch_more, on_success=on_page, on_error=on_page_error,
+                          progress=progress)
+
+    bottom_frame = ttk.Frame(results_window)
+    bottom_frame.pack(side="bottom", fill="x")
+
+    count_label = ttk.Label(bottom_frame, text="")
+    count_label.pack(side="left", padx=10)
+
+    more_btn = ttk.Button(bottom_frame, text="Показать еще", command=load_more,
+                          state="normal" if state['has_more'] else "disabled")
+    more_btn.pack(side="left", padx=10, pady=10)
 
-    ttk.Button(results_window, text="Закрыть", command=results_window.destroy).pack(side = "bottom", pady=10)
+    progress = ProgressIndicator(bottom_frame, side="left", padx=10)
+
+    ttk.Button(bottom_frame, text="Закрыть", command=results_window.destroy).pack(side="right", padx=10, pady=10)
+
+    # Прокрутка до последней строки подгружает следующую порцию
+    table = VirtualTable(results_window, FLIGHT_COLUMNS, results, on_end=load_more)
+    table.pack(expand=True, fill="both", padx=10, pady=10)
+    update_count()
 
 def search_direct_flights_between_cities(from_city, from_country, to_city, to_country):
-    conn = get_db_connection()
-    if not conn:
+    source = get_repository()
+    if not source:
         return []
+    return source.get_direct_flights(from_city, from_country, to_city, to_country)
 
-    try:
-        with conn.cursor() as cur:
-            query = """
-            SELECT r.airline, 
-                   r.src_airport, 
-                   r.dst_airport, 
-                   a1.city as src_city,
-                   a1.country as src_country, 
-                   a2.city as dst_city,
-                   a2.country as dst_country
-            FROM routes r
-            JOIN airports a1 ON r.src_airport = a1.iata
-            JOIN airports a2 ON r.dst_airport = a2.iata
-            WHERE LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)
-              AND LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s)
-            """
-
-            cur.execute(query, (from_city, from_country, to_city, to_country))
-            return cur.fetchall()
-    except Exception as e:
-        print(f"Ошибка поиска прямых рейсов: {e}")
+def show_direct_results(results, direct_window):
+    # src_id и dst_id остаются в записях: таблица показывает только первые 3 столбца
+    show_results_table(direct_window, "Результаты поиска прямых рейсов", DIRECT_COLUMNS, results)
+
+def search_connections_between_cities(from_city, from_country, to_city, to_country, max_stops, rank_by):
+    source = get_repository()
+    if not source:
         return []
-    finally:
-        if conn:
-            conn.close()
+    return source.find_connections(from_city, from_country, to_city, to_country, max_stops, rank_by)
 
-def show_direct_results(results, direct_window):
-    results_window = Toplevel(direct_window)
-    results_window.title("Результаты поиска прямых рейсов")
+def show_connections_results(results, connections_window):
+    results_window = Toplevel(connections_window)
+    results_window.title("Результаты поиска маршрутов с пересадками")
     results_window.geometry("1000x400")
 
-    tree = ttk.Treeview(results_window,
-                        columns=("Авиакомпания", "Аэропорт вылета", "Аэропорт прилета", "Город вылета",
-                                 "Страна вылета", "Город прилета", "Страна прилета"),
+    tree = ttk.Treeview(results_window, columns=("Маршрут", "Пересадки", "Расстояние, км", "Авиакомпании"),
                         show="headings")
 
-    tree.heading("Авиакомпания", text="Авиакомпания")
-    tree.heading("Аэропорт вылета", text="Аэропорт вылета")
-    tree.heading("Аэропорт прилета", text="Аэропорт прилета")
-    tree.heading("Город вылета", text="Город вылета")
-    tree.heading("Страна вылета", text="Страна вылета")
-    tree.heading("Город прилета", text="Город прилета")
-    tree.heading("Страна прилета", text="Страна прилета")
-
-    tree.column("Авиакомпания", width=100, anchor="center")
-    tree.column("Аэропорт вылета", width=100, anchor="center")
-    tree.column("Аэропорт прилета", width=100, anchor="center")
-    tree.column("Город вылета", width=100, anchor="center")
-    tree.column("Страна вылета", width=100, anchor="center")
-    tree.column("Город прилета", width=100, anchor="center")
-    tree.column("Страна прилета", width=100, anchor="center")
-
-    for result in results:
-        tree.insert("", "end", values=result)
+    tree.heading("Маршрут", text="Маршрут")
+    tree.heading("Пересадки", text="Пересадки")
+    tree.heading("Расстояние, км", text="Расстояние, км")
+    tree.heading("Авиакомпании", text="Авиакомпании")
+
+    tree.column("Маршрут", width=300, anchor="center")
+    tree.column("Пересадки", width=80, anchor="center")
+    tree.column("Расстояние, км", width=120, anchor="center")
+    tree.column("Авиакомпании", width=400, anchor="center")
+
+    for itinerary in results:
+        airlines = " | ".join(", ".join(leg['airlines']) for leg in itinerary['legs'])
+        tree.insert("", "end", values=(" -> ".join(itinerary['airports']), itinerary['stops'],
+                                       itinerary['distance_km'], airlines))
 
     scrollbar = ttk.Scrollbar(results_window, orient="vertical", command=tree.yview)
     tree.configure(yscrollcommand=scrollbar.set)
     tree.pack(side="left", expand=True, fill="both", padx=10, pady=10)
     scrollbar.pack(side="right", fill="y")
 
-    ttk.Button(results_window, text="Закрыть", command=results_window.destroy).pack(side = "bottom", pady=10)
+    ttk.Button(results_window, text="Закрыть", command=results_window.destroy).pack(side="bottom", pady=10)
+
+# Сводная статистика сети: пересчитывается только по изменившимся таблицам (см. analytics.py)
+network_analytics = NetworkAnalytics()
+
+def get_network_statistics():
+    source = get_repository()
+    if not source:
+        return None
+    try:
+        return source.statistics(network_analytics)
+    except Exception as e:
+        print(f"Ошибка расчета статистики: {e}")
+        return None
+
+# Подсказки городов при вводе (см. city_search.py)
+_city_index = None
+
+def get_city_index():
+    """Индекс подсказок по городам, аэропортам и кодам: загружается источником один раз"""
+    global _city_index
+    if _city_index is not None:
+        return _city_index
+
+    source = get_repository()
+    if not source:
+        return None
+    try:
+        _city_index = source.city_index()
+        return _city_index
+    except Exception as e:
+        print(f"Ошибка загрузки городов: {e}")
+        return None
+
+def suggest_cities(text, limit=8):
+    """Подсказки для полей ввода; пока индекс загружается, подсказок нет (ввод не блокируется)"""
+    if _city_index is None:
+        return []
+    return _city_index.search(text, limit)
+
+def attach_city_autocomplete(*entries, suffix=""):
+    """Подсказки городов для полей ввода; индекс загружается в фоне при первом открытии окна"""
+    for entry in entries:
+        EntryAutocomplete(entry, suggest_cities, suffix)
+    if _city_index is None:
+        dispatcher.submit(entries[0], get_city_index, on_success=lambda index: None)
 
 # Функции для работы кнопок
 # 1. Для кнопки помощь
@@ -340,6 +313,8 @@ def open_start():
 "2. Поиск аэропорта по городу и стране\n"
 "3. Поиск рейсов по городу\n"
 "4. Поиск прямых рейсов между городами\n"
+"5. Поиск маршрутов с пересадками\n"
+"6. Статистика сети маршрутов\n"
 
 "Введите необходимый параметр и нажмите Enter:")
 
@@ -396,9 +371,9 @@ def open_start():
             show_errors("Ошибка: Можно ввести только одну цифру!")
             return False
 
-        # Проверка на диапазон (1-4)
-        if user_input not in ['1', '2', '3', '4']:
-            show_errors("Ошибка: Введите цифру от 1 до 4!")
+        # Проверка на диапазон (1-6)
+        if user_input not in ['1', '2', '3', '4', '5', '6']:
+            show_errors("Ошибка: Введите цифру от 1 до 6!")
             return False
 
         # Если все проверки пройдены - открываем соответствующее окно
@@ -410,6 +385,10 @@ def open_start():
             open_flights_search(start)
         elif user_input == '4':
             open_direct_flights_search(start)
+        elif user_input == '5':
+            open_connections_search(start)
+        elif user_input == '6':
+            open_statistics(start)
 
         return True
 
@@ -437,6 +416,7 @@ def open_coordinates_search(start):
     "Минимальное и максимальное значение долготы\n"
     "Формат: минимальная_широта, максимальная_широта, минимальная_долгота, максимальная_долгота\n"
     "Диапазон поиска: широта [-90; 90], долгота [-180; 180]\n"
+    "Если минимальная долгота больше максимальной, поиск идет через 180-й меридиан\n"
     "Пример: 40.0, 50.0, -80.0, -70.0")
 
     label=ttk.Label(coord_window, text=instruction, font=("Times New Roman", 12),
@@ -470,16 +450,19 @@ def open_coordinates_search(start):
     def search_airports():
         coordinates = coord_entry.get().strip()
 
-        # Здесь будет проверка ввода и поиск в БД
+        # Проверка ввода и поиск в БД (в рабочем потоке, окно не блокируется)
         if validate_coordinates(coordinates):
-            results = search_airports_by_coordinates(coordinates)
-            show_coord_results(results, coord_window)
+            dispatcher.submit(coord_window, search_airports_by_coordinates, coordinates,
+                              on_success=lambda results: show_coord_results(results, coord_window),
+                              progress=coord_progress)
         else:
             show_coord_errors("Неверный формат координат!")
 
     search_btn = ttk.Button(entry_frame, text="Поиск", command=search_airports)
     search_btn.pack(side="left")
 
+    coord_progress = ProgressIndicator(coord_window)
+
     # Кнопка назад
     def go_back():
         coord_window.destroy()
@@ -502,7 +485,8 @@ def open_coordinates_search(start):
                 return False
             if not (-180 <= lon_min <= 180 and -180 <= lon_max <= 180):
                 return False
-            if lat_min > lat_max or lon_min > lon_max:
+            # lon_min > lon_max допустимо: диапазон через 180-й меридиан
+            if lat_min > lat_max:
                 return False
 
             return True
@@ -535,6 +519,7 @@ def open_city_country_search(start):
 
     city_entry = ttk.Entry(entry_frame, font=("Times New Roman", 12), width=50)
     city_entry.pack(side="left", padx=(0, 10))
+    attach_city_autocomplete(city_entry)
 
     # Функция для показа ошибок в этом окне
     def show_city_errors(error_text):
@@ -575,15 +560,21 @@ def open_city_country_search(start):
             return
 
         city, country = result
-        results = search_by_city_country(city, country)
-        if results:
-            show_city_results(results, city_window)
-        else:
-            show_city_errors("Аэропорты не найдены!")
+
+        def on_results(results):
+            if results:
+                show_city_results(results, city_window)
+            else:
+                show_city_errors("Аэропорты не найдены!")
+
+        dispatcher.submit(city_window, search_by_city_country, city, country,
+                          on_success=on_results, progress=city_progress)
 
     search_btn = ttk.Button(entry_frame, text="Поиск", command=search_by_city_country_f)
     search_btn.pack(side="left")
 
+    city_progress = ProgressIndicator(city_window)
+
     # Кнопка назад
     def go_back():
         city_window.destroy()
@@ -620,6 +611,8 @@ def open_flights_search(start):
 
     flights_entry = ttk.Entry(entry_frame, font=("Times New Roman", 12), width=50)
     flights_entry.pack(side="left", padx=(0, 10))
+    # После города и страны остается ввести тип рейса
+    attach_city_autocomplete(flights_entry, suffix=", ")
 
     # Функция для показа ошибок в этом окне
     def show_flight_errors(error_text):
@@ -660,16 +653,32 @@ def open_flights_search(start):
             return
 
         city, country, flight_type = result
-        results = search_flights_from_city(city, country,  flight_type)
 
-        if results:
-            show_flights_results(results, flights_window, flight_type)
-        else:
-            show_flight_errors("Рейсы не найдены!\n\nПроверьте правильность введенных данных.")
+        def on_results(page):
+            results, after = page
+
+            # Следующие порции загружаются только по мере прокрутки
+            page_state = {'after': after}
+
+            def fetch_more():
+                rows, page_state['after'] = search_flights_from_city_page(city, country, flight_type,
+                                                                          page_state['after'])
+                return rows, page_state['after'] is not None
+
+            if results:
+                show_flights_results(results, flights_window, flight_type,
+                                     fetch_more if after is not None else None)
+            else:
+                show_flight_errors("Рейсы не найдены!\n\nПроверьте правильность введенных данных.")
+
+        dispatcher.submit(flights_window, search_flights_from_city_page, city, country, flight_type,
+                          on_success=on_results, progress=flights_progress)
 
     search_btn = ttk.Button(entry_frame, text="Поиск", command=search_flights)
     search_btn.pack(side="left")
 
+    flights_progress = ProgressIndicator(flights_window)
+
     # Кнопка назад
     def go_back():
         flights_window.destroy()
@@ -717,6 +726,7 @@ def open_direct_flights_search(start):
 
     to_entry = ttk.Entry(to_entry_frame, font=("Times New Roman", 12), width=50)
     to_entry.pack(pady=5)
+    attach_city_autocomplete(from_entry, to_entry)
 
     button_frame = ttk.Frame(direct_window)
     button_frame.pack(pady=20)
@@ -766,15 +776,21 @@ def open_direct_flights_search(start):
         from_city, from_country = result_from
         to_city, to_country = result_to
 
-        results = search_direct_flights_between_cities(from_city, from_country, to_city, to_country)
-        if results:
-            show_direct_results(results, direct_window)
-        else:
-            show_direct_errors("Прямые рейсы не найдены!\n\nПроверьте правильность введенных городов и стран.")
+        def on_results(results):
+            if results:
+                show_direct_results(results, direct_window)
+            else:
+                show_direct_errors("Прямые рейсы не найдены!\n\nПроверьте правильность введенных городов и стран.")
+
+        dispatcher.submit(direct_window, search_direct_flights_between_cities,
+                          from_city, from_country, to_city, to_country,
+                          on_success=on_results, progress=direct_progress)
 
     search_btn = ttk.Button(button_frame, text="Найти рейсы", command=search_direct_flights_func)
     search_btn.pack(side="left", padx=(0, 10))
 
+    direct_progress = ProgressIndicator(direct_window)
+
     def go_back():
         direct_window.destroy()
         open_start()
@@ -782,49 +798,269 @@ def open_direct_flights_search(start):
     close_btn = ttk.Button(direct_window, text="Назад", command=go_back)
     close_btn.pack(side="bottom", pady=10)
 
+# ======================================================================
+# ================ Маршруты с пересадками между городами  ==============
+# ======================================================================
+
+def open_connections_search(start):
+    start.destroy()
+
+    connections_window = Toplevel()
+    connections_window.title("Поиск маршрутов с пересадками")
+    connections_window.geometry("600x500")
+
+    instruction = ("Введите города и страны отправления и назначения,\n"
+                   "максимальное число пересадок и способ сортировки:\n"
+                   "Формат отправления и назначения: Город, Страна\n"
+                   "Пересадки: от 0 до 3. Сортировка: hops-по числу перелетов, distance-по расстоянию\n"
+                   "Пример отправления: Goroka, Papua New Guinea\n"
+                   "Пример назначения: Moscow, Russia")
+
+    label = ttk.Label(connections_window, text=instruction, font=("Times New Roman", 12),
+                      wraplength=550, justify="left")
+    label.pack(padx=20, pady=15)
+
+    #Для отправления
+    from_entry_frame = ttk.Frame(connections_window)
+    from_entry_frame.pack(pady=5)
+
+    ttk.Label(from_entry_frame, text="Отправление (Город, Страна):",
+              font=("Times New Roman", 11)).pack(anchor="w")
+
+    from_entry = ttk.Entry(from_entry_frame, font=("Times New Roman", 12), width=50)
+    from_entry.pack(pady=5)
+
+    #Для назначения
+    to_entry_frame = ttk.Frame(connections_window)
+    to_entry_frame.pack(pady=5)
+
+    ttk.Label(to_entry_frame, text="Назначение (Город, Страна):",
+              font=("Times New Roman", 11)).pack(anchor="w")
+
+    to_entry = ttk.Entry(to_entry_frame, font=("Times New Roman", 12), width=50)
+    to_entry.pack(pady=5)
+    attach_city_autocomplete(from_entry, to_entry)
+
+    #Параметры поиска
+    options_frame = ttk.Frame(connections_window)
+    options_frame.pack(pady=5)
+
+    ttk.Label(options_frame, text="Пересадки:", font=("Times New Roman", 11)).pack(side="left")
+    stops_box = ttk.Combobox(options_frame, values=("0", "1", "2", "3"), width=5, state="readonly")
+    stops_box.set("2")
+    stops_box.pack(side="left", padx=(5, 15))
+
+    ttk.Label(options_frame, text="Сортировка:", font=("Times New Roman", 11)).pack(side="left")
+    rank_box = ttk.Combobox(options_frame, values=("hops", "distance"), width=10, state="readonly")
+    rank_box.set("hops")
+    rank_box.pack(side="left", padx=5)
+
+    button_frame = ttk.Frame(connections_window)
+    button_frame.pack(pady=15)
+
+    def show_connections_errors(error_text):
+        error_window = Toplevel(connections_window)
+        error_window.title("ОШИБКА")
+        error_window.geometry("300x150")
+
+        error_label = ttk.Label(error_window, text=error_text,
+                                font=("Times New Roman", 12),
+                                foreground="red", wraplength=250, justify="center")
+        error_label.pack(expand=True, padx=20, pady=20)
+
+        ok_btn = ttk.Button(error_window, text="OK", command=error_window.destroy)
+        ok_btn.pack(side="bottom", pady=5)
+
+    def validate_city_input(input_text, field_name):
+        if not input_text:
+            return False, f"Введите {field_name}!"
+
+        parts = [part.strip() for part in input_text.split(',')]
+        if len(parts) != 2:
+            return False, "Неверный формат!\n Введите город и страну"
+
+        city, country = parts
+        if not city or not country:
+            return False, "Город и страна не могут быть пустыми!"
+
+        return True, (city, country)
+
+    def search_connections_func():
+        is_valid_from, result_from = validate_city_input(from_entry.get().strip(), "отправления")
+        if not is_valid_from:
+            show_connections_errors(result_from)
+            return
+
+        is_valid_to, result_to = validate_city_input(to_entry.get().strip(), "назначения")
+        if not is_valid_to:
+            show_connections_errors(result_to)
+            return
+
+        from_city, from_country = result_from
+        to_city, to_country = result_to
+
+        def on_results(results):
+            if results:
+                show_connections_results(results, connections_window)
+            else:
+                show_connections_errors("Маршруты не найдены!\n\nПопробуйте увеличить число пересадок.")
+
+        dispatcher.submit(connections_window, search_connections_between_cities,
+                          from_city, from_country, to_city, to_country,
+                          int(stops_box.get()), rank_box.get(),
+                          on_success=on_results, progress=connections_progress)
+
+    search_btn = ttk.Button(button_frame, text="Найти маршруты", command=search_connections_func)
+    search_btn.pack(side="left", padx=(0, 10))
+
+    connections_progress = ProgressIndicator(connections_window)
+
+    def go_back():
+        connections_window.destroy()
+        open_start()
+
+    close_btn = ttk.Button(connections_window, text="Назад", command=go_back)
+    close_btn.pack(side="bottom", pady=10)
+
+# ======================================================================
+# ======================== Статистика сети маршрутов  ==================
+# ======================================================================
+
+# Вкладки окна статистики: ключ отчета, заголовок и колонки (поле, заголовок, ширина)
+STATISTICS_TABS = (
+    ('busiest_airports', "Аэропорты", (("iata", "IATA", 60), ("airport", "Аэропорт", 250),
+                                       ("city", "Город", 140), ("country", "Страна", 140),
+                                       ("departures", "Вылетов", 80), ("arrivals", "Прилетов", 80),
+                                       ("destinations", "Направлений", 100))),
+    ('top_airlines', "Авиакомпании", (("airline", "Код", 60), ("name", "Название", 280),
+                                      ("country", "Страна", 160), ("routes", "Маршрутов", 100),
+                                      ("airports", "Аэропортов", 100))),
+    ('longest_routes', "Длинные маршруты", (("airline", "Авиакомпания", 90), ("src_airport", "Откуда", 70),
+                                            ("src_city", "Город вылета", 150), ("dst_airport", "Куда", 70),
+                                            ("dst_city", "Город прилета", 150), ("distance_km", "Расстояние, км", 120))),
+    ('countries', "Страны", (("country", "Страна", 200), ("airports", "Аэропортов", 90),
+                             ("routes", "Маршрутов", 90), ("domestic", "Внутренних", 90),
+                             ("international", "Международных", 110), ("destinations", "Стран назначения", 120))),
+)
+
+def open_statistics(start):
+    start.destroy()
+
+    stats_window = Toplevel()
+    stats_window.title("Статистика сети маршрутов")
+    stats_window.geometry("950x550")
+
+    summary_label = ttk.Label(stats_window, text="Расчет статистики...", font=("Times New Roman", 12),
+                              wraplength=900, justify="left")
+    summary_label.pack(padx=20, pady=10)
+
+    stats_progress = ProgressIndicator(stats_window)
+
+    notebook = ttk.Notebook(stats_window)
+    notebook.pack(expand=True, fill="both", padx=10, pady=5)
+
+    trees = {}
+    for key, title, columns in STATISTICS_TABS:
+        tab = ttk.Frame(notebook)
+        notebook.add(tab, text=title)
+
+        tree = ttk.Treeview(tab, columns=[heading for _, heading, _ in columns], show="headings")
+        for _, heading, width in columns:
+            tree.heading(heading, text=heading)
+            tree.column(heading, width=width, anchor="center")
+
+        scrollbar = ttk.Scrollbar(tab, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side="left", expand=True, fill="both")
+        scrollbar.pack(side="right", fill="y")
+        trees[key] = tree
+
+    def show_statistics(report):
+        if not report:
+            summary_label.configure(text="Не удалось рассчитать статистику", foreground="red")
+            return
+
+        summary = report['summary']
+        summary_label.configure(text=(
+            f"Аэропортов: {summary['airports']} (с маршрутами: {summary['served_airports']}), "
+            f"авиакомпаний: {summary['airlines']}, маршрутов: {summary['routes']}, "
+            f"стран: {summary['countries']}. Рассчитано за {report['seconds']:.2f} с"))
+
+        for key, _, columns in STATISTICS_TABS:
+            tree = trees[key]
+            tree.delete(*tree.get_children())
+            for row in report[key]:
+                tree.insert("", "end", values=[row[field] for field, _, _ in columns])
+
+    def refresh():
+        dispatcher.submit(stats_window, get_network_statistics,
+                          on_success=show_statistics, progress=stats_progress)
+
+    button_frame = ttk.Frame(stats_window)
+    button_frame.pack(side="bottom", pady=10)
+
+    def go_back():
+        stats_window.destroy()
+        open_start()
+
+    ttk.Button(button_frame, text="Обновить", command=refresh).pack(side="left", padx=(0, 10))
+    ttk.Button(button_frame, text="Назад", command=go_back).pack(side="left")
+
+    refresh()
+
 # ======================================================================
 # ========================== Корневое окно  ============================
 # ======================================================================
 
-root = Tk()  # создаем корневой объект - окно
-root.title("Airtravel app")  # устанавливаем заголовок окна
-root.iconbitmap(default="plane2.ico") #Изображение иконки рядом с названием заголовка окна
-root.geometry("500x500") # устанавливаем размеры окна
+# При импорте (например, из benchmark.py) окно не создается: доступны только функции поиска
+if __name__ == "__main__":
+    root = Tk()  # создаем корневой объект - окно
+    root.title("Airtravel app")  # устанавливаем заголовок окна
+    root.iconbitmap(default="plane2.ico") #Изображение иконки рядом с названием заголовка окна
+    root.geometry("500x500") # устанавливаем размеры окна
+
+    # Поиски выполняются в пуле потоков, результаты возвращаются в цикл событий Tk
+    dispatcher = SearchDispatcher(root)
+    # Периодическая запись метрик запросов, если задан METRICS_DUMP_PATH
+    start_json_dump()
 
 
-#Текстовая метка Label
-plane = PhotoImage(file="./plane1.png")
-label = ttk.Label(image=plane, text="Добро пожаловать в приложение авиакомпаний!", font=("Times New Roman", 14), compound="top",
-                  borderwidth=2, relief="solid", background="#99FFFF", foreground="#000", padding=8)
-label.pack()
+    #Текстовая метка Label
+    plane = PhotoImage(file="./plane1.png")
+    label = ttk.Label(image=plane, text="Добро пожаловать в приложение авиакомпаний!", font=("Times New Roman", 14), compound="top",
+                      borderwidth=2, relief="solid", background="#99FFFF", foreground="#000", padding=8)
+    label.pack()
 
-#Создаем виджеты
-#1. Кнопки
-btn1 = ttk.Button(text="Начать", command=open_start) # создаем кнопку из пакета ttk
-btn1.place(relx=0.5, rely=0.5, anchor="center") #Размещаем кнопку
-btn2 = ttk.Button(root, text="Помощь", command=open_help)
-btn2.pack(expand=True, anchor="sw", padx=15, pady=15)
+    #Создаем виджеты
+    #1. Кнопки
+    btn1 = ttk.Button(text="Начать", command=open_start) # создаем кнопку из пакета ttk
+    btn1.place(relx=0.5, rely=0.5, anchor="center") #Размещаем кнопку
+    btn2 = ttk.Button(root, text="Помощь", command=open_help)
+    btn2.pack(expand=True, anchor="sw", padx=15, pady=15)
 
 
-# Создаем меню
-root.option_add("*tearOff", FALSE)
+    # Создаем меню
+    root.option_add("*tearOff", FALSE)
 
-main_menu = Menu()
+    main_menu = Menu()
 
-file_menu = Menu()
-file_menu.add_command(label="Новый файл")
-file_menu.add_command(label="Сохранить")
-file_menu.add_command(label="Открыть")
-file_menu.add_separator()
-file_menu.add_command(label="Выход")
+    file_menu = Menu()
+    file_menu.add_command(label="Новый файл")
+    file_menu.add_command(label="Сохранить")
+    file_menu.add_command(label="Открыть")
+    file_menu.add_separator()
+    file_menu.add_command(label="Выход")
 
-main_menu.add_cascade(label="Файл", menu=file_menu)
-main_menu.add_cascade(label="Правка")
-main_menu.add_cascade(label="Вид")
+    main_menu.add_cascade(label="Файл", menu=file_menu)
+    main_menu.add_cascade(label="Правка")
+    main_menu.add_cascade(label="Вид")
 
-root.config(menu=main_menu)
+    root.config(menu=main_menu)
 
-# устанавливаем тему
-ttk.Style().theme_use("xpnative")
+    # устанавливаем тему
+    ttk.Style().theme_use("xpnative")
 
-root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    dispatcher.shutdown()
+    close_repository()
+    stop_json_dump()
\ No newline at end of file
@@ -0,0 +1,437 @@
+import asyncio
+import itertools
+import os
+import re
+import time
+from typing import List, Dict, Tuple, Optional, AsyncIterator
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+from airtravel import airtravelDatabase
+from spatial import AirportLocator, routes_by_distance
+from city_search import AIRPORTS_QUERY, ROUTE_COUNTS_QUERY, CitySearchIndex
+from route_planner import RoutePlanner
+from query_cache import QueryCache, async_cached_method
+from pagination import paginate
+from city_routes import CITY_ROUTES_READY_SQL, FlightSource, JOIN_SOURCE, VIEW_SOURCE
+from instrumentation import METRICS, SlowQuery, caller_name, params_hash
+from config import QUERY_CACHE, db_params_from_env
+
+# Ошибки, при которых методы, как и в airtravelDatabase, печатают сообщение и возвращают []
+# (с raise_errors=True - передают исключение вызывающему)
+DB_ERRORS = (asyncpg.PostgresError, asyncpg.InterfaceError, OSError)
+
+
+def _dicts(records: List) -> List[Dict]:
+    return [record._asdict() for record in records]
+
+
+def _numbered(query: str) -> str:
+    """Перевод параметров %s (psycopg2) в нумерованные $1, $2, ... (asyncpg)"""
+    counter = itertools.count(1)
+    return re.sub(r'%s', lambda match: f"${next(counter)}", query)
+
+
+class AsyncAirtravelDatabase:
+    """
+    Асинхронный доступ к БД airtravel для сервисов на asyncio.
+
+    Запросы выполняются через пул соединений asyncpg, поэтому одновременно
+    может выполняться столько запросов, сколько соединений в пуле. Независимые
+    подзапросы одного поиска (например, аэропорты города вылета и города
+    прилета) запускаются параллельно через asyncio.gather.
+    Методы повторяют сигнатуры и формат результатов airtravelDatabase.
+    """
+
+    def __init__(self, db_params: Dict[str, str] = None, min_size: int = None, max_size: int = None,
+                 raise_errors: bool = False):
+        load_dotenv()
+
+        if db_params is None:
+            self.db_params = self.get_db_params_from_dotenv()
+        else:
+            self.db_params = db_params
+
+        self.min_size = min_size if min_size is not None else 1
+        self.max_size = max_size if max_size is not None else int(os.environ.get("ASYNC_POOL_SIZE", 10))
+        self.pool: Optional[asyncpg.Pool] = None
+        self._locator = None
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_source = None
+        self._build_lock = asyncio.Lock()
+        # Сервису (api.py) пустой результат при ошибке не подходит: он закэшировал бы его как ответ
+        self.raise_errors = raise_errors
+        self.cache = QueryCache(**QUERY_CACHE)
+
+    def get_db_params_from_dotenv(self) -> Dict[str, str]:
+        return db_params_from_env()
+
+    async def connect(self) -> bool:
+        try:
+            self.pool = await asyncpg.create_pool(
+                host=self.db_params.get('host'),
+                database=self.db_params.get('database'),
+                user=self.db_params.get('user'),
+                password=self.db_params.get('password'),
+                port=int(self.db_params['port']) if self.db_params.get('port') else None,
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+            print("Успешное подключение к PostgreSQL (асинхронный пул)")
+            return True
+
+        except DB_ERRORS as e:
+            print(f"Ошибка подключения к PostgreSQL: {e}")
+            return False
+
+    async def disconnect(self):
+        """Закрытие пула соединений"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+            print("Соединение с базой данных закрыто")
+
+    async def __aenter__(self) -> 'AsyncAirtravelDatabase':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    def invalidate_cache(self):
+        """Сброс кэша запросов и построенных по данным индексов (после перезагрузки данных)"""
+        self.cache.invalidate()
+        self._locator = None
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_source = None
+
+    def _query_failed(self, error: Exception, result):
+        """Ошибка запроса: исключение (raise_errors=True) или сообщение и пустой результат result"""
+        if self.raise_errors:
+            raise error
+        print(f"Ошибка выполнения запроса: {error}")
+        return result
+
+    async def _fetch(self, query: str, params: Tuple = (), name: str = None) -> List[Dict]:
+        """
+        Выполнение запроса с параметрами %s на свободном соединении пула.
+        Время запроса и разбора строк учитывается в instrumentation.METRICS под именем name
+        """
+        name = name or caller_name()
+        statement = _numbered(query)
+        started = time.perf_counter()
+        try:
+            rows = await self.pool.fetch(statement, *params)
+        except Exception:
+            METRICS.record(name, time.perf_counter() - started, error=True)
+            raise
+        execute_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = [dict(row) for row in rows]
+        fetch_time = time.perf_counter() - started
+
+        if METRICS.record(name, execute_time, fetch_time, len(results)):
+            METRICS.log_slow(SlowQuery(name, params_hash(params), statement, round(execute_time * 1000, 3),
+                                       round(fetch_time * 1000, 3), len(results), time.time()))
+        return results
+
+    async def _get_flight_source(self) -> FlightSource:
+        """Поиск рейсов идет по city_routes, если представление создано и заполнено"""
+        if self._flight_source is None:
+            ready = await self.pool.fetchval(CITY_ROUTES_READY_SQL)
+            self._flight_source = VIEW_SOURCE if ready else JOIN_SOURCE
+        return self._flight_source
+
+    async def _get_locator(self) -> AirportLocator:
+        """Пространственный индекс по аэропортам (строится один раз по одной выборке)"""
+        async with self._build_lock:
+            if self._locator is None:
+                airports = await self._fetch("""
+                SELECT id, city, country, iata, icao, latitude, longitude
+                FROM airports
+                """)
+                self._locator = AirportLocator(airports)
+        return self._locator
+
+    async def _get_planner(self) -> RoutePlanner:
+        """Граф маршрутов: обе выборки читаются параллельно, граф строится в отдельном потоке"""
+        async with self._build_lock:
+            if self._planner is None:
+                airports, routes = await asyncio.gather(
+                    self._fetch("SELECT iata, city, country, latitude, longitude FROM airports",
+                                name="AsyncAirtravelDatabase._get_planner[airports]"),
+                    self._fetch("SELECT airline, src_airport, dst_airport FROM routes",
+                                name="AsyncAirtravelDatabase._get_planner[routes]"),
+                )
+                loop = asyncio.get_running_loop()
+                self._planner = await loop.run_in_executor(
+                    None, RoutePlanner, [tuple(row.values()) for row in airports],
+                    [tuple(row.values()) for row in routes])
+        return self._planner
+
+    async def _get_route_lengths(self) -> Tuple[List[Tuple], np.ndarray]:
+        """Все маршруты и их длины по большому кругу (считаются один раз, векторно)"""
+        locator = await self._get_locator()
+        async with self._build_lock:
+            if self._route_lengths is None:
+                rows = await self._fetch("SELECT airline, src_airport, dst_airport FROM routes")
+                routes = [tuple(row.values()) for row in rows]
+                self._route_lengths = (routes, locator.route_lengths_km(routes))
+        return self._route_lengths
+
+    async def _get_city_index(self) -> CitySearchIndex:
+        """Индекс подсказок по городам: обе выборки читаются параллельно, индекс строится в отдельном потоке"""
+        async with self._build_lock:
+            if self._city_index is None:
+                airports, route_counts = await asyncio.gather(
+                    self._fetch(AIRPORTS_QUERY, name="AsyncAirtravelDatabase._get_city_index[airports]"),
+                    self._fetch(ROUTE_COUNTS_QUERY, name="AsyncAirtravelDatabase._get_city_index[routes]"),
+                )
+                loop = asyncio.get_running_loop()
+                self._city_index = await loop.run_in_executor(
+                    None, CitySearchIndex, [tuple(row.values()) for row in airports],
+                    dict(tuple(row.values()) for row in route_counts))
+        return self._city_index
+
+    async def get_airports_by_coordinates(self, lat_min: float, lat_max: float,
+                                          lon_min: float, lon_max: float) -> List[Dict]:
+        """
+        Поиск аэропортов в диапазоне географических координат.
+        Если lon_min > lon_max, диапазон проходит через 180-й меридиан
+        """
+        try:
+            # Записи индекса (records.py) -> словари, как строки остальных методов
+            return _dicts((await self._get_locator()).airports_in_box(lat_min, lat_max, lon_min, lon_max))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    async def get_airports_within_radius(self, lat: float, lon: float, radius_km: float) -> List[Dict]:
+        """
+        Поиск аэропортов в радиусе radius_km от точки (по большому кругу)
+        """
+        try:
+            return _dicts((await self._get_locator()).airports_within_radius(lat, lon, radius_km))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    async def get_nearest_airports(self, lat: float, lon: float, k: int = 10) -> List[Dict]:
+        """
+        Поиск k ближайших к точке аэропортов
+        """
+        try:
+            return _dicts((await self._get_locator()).nearest_airports(lat, lon, k))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    async def get_routes_by_distance(self, min_km: float = 0.0, max_km: float = None,
+                                     limit: int = 100) -> List[Dict]:
+        """
+        Маршруты с длиной по большому кругу от min_km до max_km (км), от самых длинных
+        """
+        try:
+            routes, lengths = await self._get_route_lengths()
+            return routes_by_distance(routes, lengths, min_km, max_km, limit)
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    async def suggest_cities(self, text: str, limit: int = 10) -> List[Dict]:
+        """
+        Подсказки городов по началу или неточному написанию города, аэропорта, кода IATA/ICAO
+        """
+        try:
+            return (await self._get_city_index()).search(text, limit)
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    @async_cached_method
+    async def find_airport_by_city_country(self, city: str, country: str) -> List[Dict]:
+        """
+        Поиск аэропорта по городу и стране
+        """
+        query = """
+        SELECT id, city, country, iata, icao, latitude, longitude
+        FROM airports
+        WHERE LOWER(city) = LOWER(%s) AND LOWER(country) = LOWER(%s)
+        """
+
+        try:
+            return await self._fetch(query, (city, country))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    async def find_airports_by_cities(self, cities: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        Пакетный поиск аэропортов для списка пар (город, страна) одним запросом
+        """
+        if not cities:
+            return {}
+
+        try:
+            rows = await self._fetch(*airtravelDatabase._airports_by_cities_query(cities))
+        except DB_ERRORS as e:
+            rows = self._query_failed(e, [])
+
+        return airtravelDatabase._group_by_key(cities, rows, ('key_city', 'key_country'))
+
+    @async_cached_method
+    async def get_flights_by_city(self, city: str, country: str, flight_type: str = 'both') -> List[Dict]:
+        """
+        Поиск всех рейсов в или из заданного города
+        flight_type: 'departure', 'arrival', 'both'
+        Для 'both' вылеты и прилеты запрашиваются параллельно двумя запросами
+        по индексам вместо одного запроса с OR
+        """
+        try:
+            source = await self._get_flight_source()
+            if flight_type.lower() not in ('departure', 'arrival'):
+                departures, arrivals = await asyncio.gather(
+                    self._fetch(*airtravelDatabase._flights_by_city_query(city, country, 'departure', source),
+                                name="AsyncAirtravelDatabase.get_flights_by_city[departures]"),
+                    self._fetch(*self._arrivals_from_other_cities_query(city, country, source),
+                                name="AsyncAirtravelDatabase.get_flights_by_city[arrivals]"),
+                )
+                return departures + arrivals
+
+            return await self._fetch(*airtravelDatabase._flights_by_city_query(city, country, flight_type, source))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+    @staticmethod
+    def _arrivals_from_other_cities_query(city: str, country: str,
+                                          source: FlightSource = JOIN_SOURCE) -> Tuple[str, Tuple]:
+        """Прилеты в город без рейсов, которые уже попали в вылеты (внутренние рейсы города)"""
+        query, params = airtravelDatabase._flights_by_city_query(city, country, 'arrival', source)
+        query += f"  AND ({source.src_condition}) IS NOT TRUE\n"
+        return query, params + (city, country)
+
+    async def iter_flights_by_city(self, city: str, country: str, flight_type: str = 'both',
+                                   itersize: int = 2000) -> AsyncIterator[Dict]:
+        """
+        Потоковый поиск рейсов по городу: строки читаются серверным курсором
+        порциями по itersize и отдаются по одной
+        """
+        try:
+            query, params = airtravelDatabase._flights_by_city_query(city, country, flight_type,
+                                                                     await self._get_flight_source())
+            async with self.pool.acquire() as connection:
+                async with connection.transaction(readonly=True):
+                    async for row in connection.cursor(_numbered(query), *params, prefetch=itersize):
+                        yield dict(row)
+        except DB_ERRORS as e:
+            self._query_failed(e, None)
+
+    async def get_flights_by_city_page(self, city: str, country: str, flight_type: str = 'both',
+                                       limit: int = 100, after: Tuple = None) -> Tuple[List[Dict], Optional[Tuple]]:
+        """
+        Постраничный поиск рейсов по городу (пагинация по ключу).
+        Возвращает строки страницы и ключ для следующей страницы (None - страниц больше нет)
+        """
+        try:
+            rows = await self._fetch(*airtravelDatabase._flights_page_query(
+                city, country, flight_type, limit, after, await self._get_flight_source()))
+        except DB_ERRORS as e:
+            return self._query_failed(e, ([], None))
+
+        return paginate(rows, limit)
+
+    @async_cached_method
+    async def get_direct_flights(self, src_city: str, src_country: str,
+                                 dst_city: str, dst_country: str) -> List[Dict]:
+        """
+        Поиск прямых рейсов между двумя городами.
+        По city_routes - один запрос по индексу пар городов. Без представления
+        аэропорты обоих городов ищутся параллельно, затем одним запросом
+        выбираются маршруты между найденными кодами IATA
+        """
+        airports_query = """
+        SELECT id, iata
+        FROM airports
+        WHERE LOWER(city) = LOWER(%s) AND LOWER(country) = LOWER(%s)
+        """
+
+        try:
+            if await self._get_flight_source() is VIEW_SOURCE:
+                return await self._fetch(airtravelDatabase._direct_flights_query(VIEW_SOURCE),
+                                         (src_city, src_country, dst_city, dst_country))
+
+            src_airports, dst_airports = await asyncio.gather(
+                self._fetch(airports_query, (src_city, src_country),
+                            name="AsyncAirtravelDatabase.get_direct_flights[src_airports]"),
+                self._fetch(airports_query, (dst_city, dst_country),
+                            name="AsyncAirtravelDatabase.get_direct_flights[dst_airports]"),
+            )
+            if not src_airports or not dst_airports:
+                return []
+
+            routes = await self._fetch("""
+            SELECT airline, src_airport, dst_airport
+            FROM routes
+            WHERE src_airport = ANY(%s) AND dst_airport = ANY(%s)
+            """, ([a['iata'] for a in src_airports], [a['iata'] for a in dst_airports]))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+
+        # Как JOIN в airtravelDatabase: строка на каждую пару аэропортов с этими кодами
+        src_ids: Dict[str, List[str]] = {}
+        dst_ids: Dict[str, List[str]] = {}
+        for airport in src_airports:
+            src_ids.setdefault(airport['iata'], []).append(airport['id'])
+        for airport in dst_airports:
+            dst_ids.setdefault(airport['iata'], []).append(airport['id'])
+
+        return [
+            {**route, 'src_id': src_id, 'dst_id': dst_id}
+            for route in routes
+            for src_id in src_ids[route['src_airport']]
+            for dst_id in dst_ids[route['dst_airport']]
+        ]
+
+    async def get_direct_flights_bulk(self, pairs: List[Tuple[str, str, str, str]]) -> Dict[Tuple[str, str, str, str], List[Dict]]:
+        """
+        Пакетный поиск прямых рейсов для списка пар городов одним запросом
+        """
+        if not pairs:
+            return {}
+
+        try:
+            rows = await self._fetch(*airtravelDatabase._direct_flights_bulk_query(
+                pairs, await self._get_flight_source()))
+        except DB_ERRORS as e:
+            rows = self._query_failed(e, [])
+
+        return airtravelDatabase._group_by_key(pairs, rows, ('key_src_city', 'key_src_country',
+                                                             'key_dst_city', 'key_dst_country'))
+
+    @async_cached_method
+    async def find_connections(self, src_city: str, src_country: str, dst_city: str, dst_country: str,
+                               max_stops: int = 2, rank_by: str = 'hops', limit: int = 5) -> List[Dict]:
+        """
+        Поиск маршрутов с пересадками между двумя городами
+        rank_by: 'hops' - сначала меньше перелетов, 'distance' - сначала короче путь
+        """
+        try:
+            planner = await self._get_planner()
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
+        return planner.find_itineraries(src_city, src_country, dst_city, dst_country,
+                                        max_stops, rank_by, limit)
+
+    async def _get_flights_between_airports(self, src_airport: str, dst_airport: str) -> List[Dict]:
+        """Получение рейсов между двумя аэропортами"""
+        query = """
+        SELECT airline, src_airport, dst_airport
+        FROM routes
+        WHERE src_airport = %s AND dst_airport = %s
+        """
+
+        try:
+            return await self._fetch(query, (src_airport, dst_airport))
+        except DB_ERRORS as e:
+            return self._query_failed(e, [])
@@ -0,0 +1,453 @@
+"""
+Замер скорости поисковых запросов.
+
+Бенчмарк прогоняет методы airtravelDatabase и функции поиска из app.py
+(без окон Tk) на типичных нагрузках: крупные города-хабы, случайные
+прямоугольники координат и случайные пары городов. Для каждого запроса
+считаются задержки p50/p95/p99, пропускная способность и строк в секунду.
+Результаты сохраняются в JSON; при сравнении с прошлым прогоном отмечаются
+запросы, у которых p95 вырос больше допустимого порога.
+
+Источники данных:
+    --load-dump       временная БД на сервере из .env, загруженная из airtravel_dump.sql
+                      (после замера удаляется)
+    без --load-dump   БД из .env как есть
+    --backend memory  без PostgreSQL: InMemoryAirtravelStore, собранный прямо из дампа
+    --backend snapshot  без PostgreSQL: SnapshotStore по снимку, записанному из дампа
+
+Примеры:
+    python benchmark.py --load-dump --output bench.json
+    python benchmark.py --backend app --compare bench.json --threshold 0.2
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from airtravel import airtravelDatabase
+from memory_store import InMemoryAirtravelStore, AIRPORT_COLUMNS, AIRLINE_COLUMNS, ROUTE_COLUMNS, parse_copy_text
+from migrations import apply_migrations
+from repository import open_repository
+from snapshot import SnapshotStore, write_snapshot
+
+DUMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airtravel_dump.sql")
+BACKENDS = ('db', 'app', 'memory', 'snapshot')
+
+_COPY_RE = re.compile(r"^COPY (\S+) \((.*)\) FROM stdin;$")
+
+
+# ======================================================================
+# ===========================  Данные  =================================
+# ======================================================================
+
+def read_dump(path: str = DUMP_PATH) -> Tuple[List[str], Dict[str, Tuple[List[str], str]]]:
+    """
+    Разбор дампа pg_dump (формат plain): SQL-команды и блоки COPY ... FROM stdin.
+    Возвращает список команд и словарь: таблица -> (колонки, данные COPY в текстовом формате)
+    """
+    statements = []
+    tables = {}
+    statement = []
+
+    with open(path, encoding='utf-8') as dump:
+        lines = iter(dump)
+        for line in lines:
+            line = line.rstrip('\n')
+            match = _COPY_RE.match(line)
+            if match:
+                data = []
+                for row in lines:
+                    if row.rstrip('\n') == '\\.':
+                        break
+                    data.append(row)
+                table = match.group(1).split('.')[-1]
+                tables[table] = ([column.strip() for column in match.group(2).split(',')], ''.join(data))
+                continue
+
+            if not statement and (not line.strip() or line.startswith('--')):
+                continue
+            statement.append(line)
+            if line.endswith(';'):
+                statements.append('\n'.join(statement))
+                statement = []
+
+    return statements, tables
+
+
+def _select_columns(table: Tuple[List[str], str], columns: Tuple[str, ...]) -> List[List]:
+    """Строки таблицы из дампа, урезанные до нужных колонок"""
+    dump_columns, data = table
+    indexes = [dump_columns.index(column) for column in columns]
+    return [[row[i] for i in indexes] for row in parse_copy_text(io.StringIO(data))]
+
+
+def store_from_dump(path: str = DUMP_PATH) -> InMemoryAirtravelStore:
+    """Хранилище в памяти, собранное прямо из дампа (PostgreSQL не нужен)"""
+    _, tables = read_dump(path)
+    store = InMemoryAirtravelStore()
+    store.build(_select_columns(tables['airports'], AIRPORT_COLUMNS),
+                _select_columns(tables['airlines'], AIRLINE_COLUMNS),
+                _select_columns(tables['routes'], ROUTE_COLUMNS))
+    return store
+
+
+def create_throwaway_database(db_params: Dict[str, str], path: str = DUMP_PATH) -> Dict[str, str]:
+    """
+    Создание временной БД на том же сервере и загрузка в нее дампа.
+    Возвращает параметры подключения к новой БД
+    """
+    name = f"airtravel_bench_{os.getpid()}"
+    admin = psycopg2.connect(**{**db_params, 'database': 'postgres'})
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {name}")
+    admin.close()
+
+    params = {**db_params, 'database': name}
+    statements, tables = read_dump(path)
+    connection = psycopg2.connect(**params)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                # Владелец из дампа может отсутствовать на сервере, а часть SET
+                # зависит от версии PostgreSQL - такие команды пропускаются
+                if ' OWNER TO ' in statement:
+                    continue
+                try:
+                    cursor.execute(statement)
+                except psycopg2.Error:
+                    if not statement.startswith('SET '):
+                        raise
+                if statement.startswith('CREATE TABLE'):
+                    table = statement.split()[2].split('.')[-1]
+                    columns, data = tables[table]
+                    cursor.copy_expert(f"COPY public.{table} ({', '.join(columns)}) FROM STDIN",
+                                       io.StringIO(data))
+            cursor.execute("SELECT pg_catalog.set_config('search_path', 'public', false)")
+
+        connection.autocommit = False
+        apply_migrations(connection)
+    finally:
+        connection.close()
+
+    print(f"Временная БД {name} загружена из дампа")
+    return params
+
+
+def drop_database(db_params: Dict[str, str]):
+    admin = psycopg2.connect(**{**db_params, 'database': 'postgres'})
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {db_params['database']}")
+    admin.close()
+    print(f"Временная БД {db_params['database']} удалена")
+
+
+# ======================================================================
+# ==========================  Нагрузка  ================================
+# ======================================================================
+
+def build_workload(store: InMemoryAirtravelStore, size: int, seed: int) -> Dict[str, List]:
+    """
+    Наборы входных данных: города-хабы (больше всего вылетов), случайные города,
+    случайные прямоугольники координат и пары городов (половина - связанные прямым рейсом)
+    """
+    rng = random.Random(seed)
+    iata_city = {}
+    for airport in store.airports:
+        if airport[4]:
+            iata_city.setdefault(airport[4], (airport[2], airport[3]))
+
+    departures = Counter(iata_city[src] for _, src, dst in store.routes if src in iata_city)
+    hubs = [city for city, _ in departures.most_common(size)]
+    cities = sorted({(airport[2], airport[3]) for airport in store.airports})
+
+    boxes = []
+    for _ in range(size):
+        lat = rng.uniform(-60, 70)
+        lon = rng.uniform(-180, 180)
+        height = rng.uniform(1, 15)
+        width = rng.uniform(1, 30)
+        lon_min = lon - width / 2
+        lon_max = lon + width / 2
+        # Прямоугольник, выходящий за 180-й меридиан, задается через lon_min > lon_max
+        if lon_min < -180:
+            lon_min += 360
+        if lon_max > 180:
+            lon_max -= 360
+        boxes.append((max(lat - height / 2, -90), min(lat + height / 2, 90), lon_min, lon_max))
+
+    connected = sorted({
+        iata_city[src] + iata_city[dst]
+        for _, src, dst in store.routes
+        if src in iata_city and dst in iata_city and iata_city[src] != iata_city[dst]
+    })
+    pairs = rng.sample(connected, min(size // 2, len(connected)))
+    pairs += [rng.choice(cities) + rng.choice(cities) for _ in range(size - len(pairs))]
+    rng.shuffle(pairs)
+
+    return {
+        'hubs': hubs,
+        'cities': rng.sample(cities, min(size, len(cities))),
+        'boxes': boxes,
+        'pairs': pairs,
+    }
+
+
+def _db_cases(db, workload: Dict[str, List]) -> Dict[str, Tuple[Callable, List[Tuple]]]:
+    """Запросы airtravelDatabase (или хранилища в памяти с теми же методами)"""
+    hubs = workload['hubs']
+    cities = workload['cities']
+    pairs = workload['pairs']
+    return {
+        'find_airport_by_city_country': (db.find_airport_by_city_country, hubs + cities),
+        'get_airports_by_coordinates': (db.get_airports_by_coordinates, workload['boxes']),
+        'get_flights_by_city[departure]': (db.get_flights_by_city, [c + ('departure',) for c in hubs]),
+        'get_flights_by_city[arrival]': (db.get_flights_by_city, [c + ('arrival',) for c in hubs]),
+        'get_flights_by_city[both]': (db.get_flights_by_city, [c + ('both',) for c in hubs]),
+        'get_flights_by_city_page[both]': (db.get_flights_by_city_page, [c + ('both',) for c in hubs]),
+        'get_direct_flights': (db.get_direct_flights, pairs),
+        'find_connections': (db.find_connections, pairs),
+        'find_airports_by_cities[batch]': (db.find_airports_by_cities, [(cities,)]),
+        'get_direct_flights_bulk[batch]': (db.get_direct_flights_bulk, [(pairs,)]),
+    }
+
+
+def _app_cases(app, workload: Dict[str, List]) -> Dict[str, Tuple[Callable, List[Tuple]]]:
+    """Функции поиска из app.py (те же, что вызывают окна Tk)"""
+    hubs = workload['hubs']
+    pairs = workload['pairs']
+    return {
+        'search_by_city_country': (app.search_by_city_country, hubs + workload['cities']),
+        'search_airports_by_coordinates': (app.search_airports_by_coordinates,
+                                           [(", ".join(str(round(v, 4)) for v in box),)
+                                            for box in workload['boxes']]),
+        'search_flights_from_city[both]': (app.search_flights_from_city, [c + ('both',) for c in hubs]),
+        'search_flights_from_city_page[both]': (app.search_flights_from_city_page,
+                                                [c + ('both',) for c in hubs]),
+        'search_direct_flights_between_cities': (app.search_direct_flights_between_cities, pairs),
+        'search_connections_between_cities': (app.search_connections_between_cities,
+                                              [p + (2, 'hops') for p in pairs]),
+    }
+
+
+# ======================================================================
+# ===========================  Замер  ==================================
+# ======================================================================
+
+def count_rows(result: Any) -> int:
+    """Число строк в результате: список, словарь списков (пакетные методы) или (строки, ключ)"""
+    if isinstance(result, dict):
+        return sum(len(rows) for rows in result.values())
+    if isinstance(result, tuple):
+        return len(result[0])
+    return len(result)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией по отсортированным значениям"""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def measure(func: Callable, inputs: List[Tuple], iterations: int = 1, warmup: int = 1) -> Dict[str, float]:
+    """Последовательный прогон func по всем входам; задержка - время одного вызова"""
+    for args in inputs[:warmup]:
+        func(*args)
+
+    latencies = []
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for args in inputs:
+            call_started = time.perf_counter()
+            result = func(*args)
+            latencies.append(time.perf_counter() - call_started)
+            rows += count_rows(result)
+    total = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'rows': rows,
+        'total_s': round(total, 6),
+        'mean_ms': round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'p50_ms': round(1000 * percentile(latencies, 0.50), 3),
+        'p95_ms': round(1000 * percentile(latencies, 0.95), 3),
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 3),
+        'max_ms': round(1000 * latencies[-1], 3) if latencies else 0.0,
+        'throughput_ops': round(len(latencies) / total, 2) if total else 0.0,
+        'rows_per_s': round(rows / total, 1) if total else 0.0,
+    }
+
+
+def run_benchmark(cases: Dict[str, Tuple[Callable, List[Tuple]]], iterations: int,
+                  only: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, (func, inputs) in cases.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        print(f"  {name}: {len(inputs)} входов x {iterations}...", flush=True)
+        results[name] = measure(func, inputs, iterations)
+    return results
+
+
+def compare_results(current: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Запросы, у которых p95 вырос больше чем на threshold (доля) относительно прошлого прогона"""
+    regressions = []
+    for name, stats in current.items():
+        old = baseline.get(name)
+        if not old or not old.get('p95_ms'):
+            continue
+        change = stats['p95_ms'] / old['p95_ms'] - 1
+        if change > threshold:
+            regressions.append(f"{name}: p95 {old['p95_ms']:.3f} -> {stats['p95_ms']:.3f} мс (+{change:.0%})")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]]):
+    print(f"\n{'Запрос':<40} {'вызовов':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+          f"{'оп/с':>9} {'строк/с':>11}")
+    print("-" * 100)
+    for name, stats in results.items():
+        print(f"{name:<40} {stats['calls']:>8} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+              f"{stats['p99_ms']:>9.3f} {stats['throughput_ops']:>9.1f} {stats['rows_per_s']:>11.1f}")
+
+
+def _server_version(db_params: Dict[str, str]) -> Optional[str]:
+    try:
+        connection = psycopg2.connect(**db_params)
+    except psycopg2.Error:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW server_version")
+            return cursor.fetchone()[0]
+    finally:
+        connection.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Замер скорости поисковых запросов airtravel")
+    parser.add_argument('--backend', choices=BACKENDS, default='db',
+                        help="db - airtravelDatabase, app - функции поиска app.py, memory - хранилище в памяти, "
+                             "snapshot - снимок данных")
+    parser.add_argument('--load-dump', action='store_true',
+                        help="загрузить airtravel_dump.sql во временную БД на сервере из .env")
+    parser.add_argument('--dump', default=DUMP_PATH, help="путь к дампу")
+    parser.add_argument('--size', type=int, default=50, help="размер каждого набора входных данных")
+    parser.add_argument('--iterations', type=int, default=3, help="число проходов по набору")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache', action='store_true', help="замер с кэшем результатов (по умолчанию выключен)")
+    parser.add_argument('--only', nargs='*', help="замерять только запросы, в названии которых есть подстрока")
+    parser.add_argument('--output', help="файл для сохранения результатов в JSON")
+    parser.add_argument('--compare', help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимый рост p95 (доля), по умолчанию 0.2")
+    args = parser.parse_args(argv)
+
+    # Данные для нагрузки всегда берутся из дампа, чтобы наборы не зависели от источника
+    print("Чтение дампа и подготовка нагрузки...")
+    reference = store_from_dump(args.dump)
+    workload = build_workload(reference, args.size, args.seed)
+
+    db_params = airtravelDatabase().db_params
+    throwaway = None
+    server_version = None
+    db = None
+    snapshot_store = None
+
+    try:
+        if args.backend == 'memory':
+            cases = _db_cases(reference, workload)
+        elif args.backend == 'snapshot':
+            path = os.path.join(tempfile.mkdtemp(), "bench.snapshot")
+            write_snapshot(reference, path)
+            snapshot_store = SnapshotStore.open(path)
+            cases = _db_cases(snapshot_store, workload)
+        else:
+            if args.load_dump:
+                throwaway = create_throwaway_database(db_params, args.dump)
+                db_params = throwaway
+            server_version = _server_version(db_params)
+
+            if args.backend == 'db':
+                db = airtravelDatabase(db_params)
+                if not db.connect():
+                    return 2
+                if not args.cache:
+                    db.cache = None
+                cases = _db_cases(db, workload)
+            else:
+                import app
+                # Окна ищут по БД через тот же слой, что и консоль, но с пулом соединений
+                app.repository = open_repository('postgres', db_params, pooled=True)
+                if app.repository is None:
+                    return 2
+                if not args.cache:
+                    app.repository.source.cache = None
+                cases = _app_cases(app, workload)
+
+        print(f"Замер ({args.backend}):")
+        results = run_benchmark(cases, args.iterations, args.only)
+    finally:
+        if db is not None:
+            db.disconnect()
+        if snapshot_store is not None:
+            snapshot_store.close()
+            os.remove(snapshot_store.snapshot.path)
+            os.rmdir(os.path.dirname(snapshot_store.snapshot.path))
+        if args.backend == 'app' and 'app' in sys.modules:
+            sys.modules['app'].close_repository()
+        if throwaway is not None:
+            drop_database(throwaway)
+
+    print_report(results)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'backend': args.backend,
+        'size': args.size,
+        'iterations': args.iterations,
+        'seed': args.seed,
+        'cache': args.cache,
+        'python': platform.python_version(),
+        'postgres': server_version,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare_results(results, baseline.get('results', {}), args.threshold)
+        if regressions:
+            print(f"\nРЕГРЕССИИ (рост p95 больше {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nРегрессий нет (порог {args.threshold:.0%})")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
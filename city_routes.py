@@ -0,0 +1,81 @@
+from typing import NamedTuple, Tuple
+
+# Материализованное представление: маршруты, уже соединенные с городами аэропортов
+# (создается миграцией 6 в migrations.py)
+CITY_ROUTES_VIEW = "city_routes"
+
+CITY_ROUTES_READY_SQL = "SELECT ispopulated FROM pg_matviews WHERE matviewname = 'city_routes'"
+
+
+class FlightSource(NamedTuple):
+    """Фрагменты SQL для выборки рейсов с городами: FROM, колонки, ключ сортировки и условия по городам"""
+    from_clause: str
+    columns: str
+    ids: str
+    key: str
+    src_condition: str
+    dst_condition: str
+
+
+# Соединение routes с airports по коду IATA для аэропортов вылета и прилета
+JOIN_SOURCE = FlightSource(
+    from_clause="""routes r
+            JOIN airports a1 ON r.src_airport = a1.iata
+            JOIN airports a2 ON r.dst_airport = a2.iata""",
+    columns="""r.airline, r.src_airport, r.dst_airport,
+                   a1.city as src_city, a1.country as src_country,
+                   a2.city as dst_city, a2.country as dst_country""",
+    ids="a1.id as src_id, a2.id as dst_id",
+    key="r.airline, r.src_airport, r.dst_airport, a1.id, a2.id",
+    src_condition="LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)",
+    dst_condition="LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s)",
+)
+
+# То же из city_routes: поиск по городу - один проход по индексу без соединений
+VIEW_SOURCE = FlightSource(
+    from_clause="city_routes r",
+    columns="""r.airline, r.src_airport, r.dst_airport,
+                   r.src_city, r.src_country,
+                   r.dst_city, r.dst_country""",
+    ids="r.src_id, r.dst_id",
+    key="r.airline, r.src_airport, r.dst_airport, r.src_id, r.dst_id",
+    src_condition="r.src_city_key = LOWER(%s) AND r.src_country_key = LOWER(%s)",
+    dst_condition="r.dst_city_key = LOWER(%s) AND r.dst_country_key = LOWER(%s)",
+)
+
+
+def city_routes_ready(connection) -> bool:
+    """Представление city_routes создано и заполнено"""
+    with connection.cursor() as cursor:
+        cursor.execute(CITY_ROUTES_READY_SQL)
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def flight_source(connection) -> FlightSource:
+    """Источник строк рейсов: city_routes, если представление готово, иначе соединение таблиц"""
+    return VIEW_SOURCE if city_routes_ready(connection) else JOIN_SOURCE
+
+
+def city_condition(source: FlightSource, city: str, country: str, flight_type: str) -> Tuple[str, Tuple]:
+    """Условие WHERE и параметры поиска рейсов по городу: 'departure', 'arrival' или 'both'"""
+    flight_type = flight_type.lower()
+    if flight_type == 'departure':
+        return source.src_condition, (city, country)
+    if flight_type == 'arrival':
+        return source.dst_condition, (city, country)
+    return f"({source.src_condition}) OR ({source.dst_condition})", (city, country, city, country)
+
+
+def refresh_city_routes(connection, concurrently: bool = True):
+    """
+    Пересчет city_routes после перезагрузки routes/airports.
+    CONCURRENTLY не блокирует чтение представления (нужен уникальный индекс,
+    он создается миграцией); для еще не заполненного представления - обычный REFRESH
+    """
+    concurrently = concurrently and city_routes_ready(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{CITY_ROUTES_VIEW}")
+        cursor.execute(f"ANALYZE {CITY_ROUTES_VIEW}")
+    if not connection.autocommit:
+        connection.commit()
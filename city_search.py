@@ -0,0 +1,236 @@
+"""
+Нечеткий и префиксный поиск городов для подсказок при вводе.
+
+Индекс строится один раз по таблице airports: ключами служат город, название
+аэропорта, коды IATA и ICAO. Каждый ключ нормализуется (регистр, диакритика,
+знаки препинания), после чего попадает в два индекса:
+
+    префиксный - отсортированный массив ключей и окончаний ключей, начиная
+                 с каждого слова ("sheremetyevo international", "international");
+                 все ключи с заданным префиксом - непрерывный отрезок массива,
+                 он находится двоичным поиском (то же, что обход trie, но без
+                 сотен тысяч узлов-словарей в памяти);
+    триграммный - триграмма -> массив номеров ключей (как pg_trgm: к каждому
+                 слову добавляются пробелы по краям). Похожесть - доля общих
+                 триграмм, число общих триграмм для всех ключей сразу считается
+                 одним np.bincount.
+
+Кандидаты - пары (город, страна). Точное совпадение выше префиксного,
+префиксное выше похожего по триграммам; при равенстве выше города
+с большим числом маршрутов.
+"""
+import math
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Порог похожести по триграммам (доля общих триграмм)
+SIMILARITY_THRESHOLD = 0.25
+# Запросы из 1-2 символов ("m", "mo") совпадают с тысячами ключей: лучшие города
+# для таких префиксов считаются заранее
+SHORT_PREFIX_LENGTH = 2
+SHORT_PREFIX_TOP = 50
+
+# Веса видов совпадения: точное, префикс ключа, префикс слова в ключе
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+WORD_PREFIX_SCORE = 1.5
+# Добавка к похожести по триграммам за популярность города: 0.05 * log10(1 + маршрутов)
+POPULARITY_WEIGHT = 0.05
+
+KIND_TITLES = {'city': "город", 'airport': "аэропорт", 'iata': "IATA", 'icao': "ICAO"}
+
+# Выборки для построения индекса по БД
+AIRPORTS_QUERY = "SELECT city, country, airport, iata, icao FROM airports"
+ROUTE_COUNTS_QUERY = """
+SELECT iata, count(*) FROM (
+    SELECT src_airport AS iata FROM routes
+    UNION ALL
+    SELECT dst_airport FROM routes
+) legs
+GROUP BY iata
+"""
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Ключ для сравнения: без диакритики, в нижнем регистре, слова через один пробел"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_WORD_RE.sub(' ', stripped.casefold()).strip()
+
+
+def trigrams(key: str) -> set:
+    """Триграммы нормализованной строки (по словам, с пробелами по краям, как в pg_trgm)"""
+    result = set()
+    for word in key.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class CitySearchIndex:
+    """
+    Индекс подсказок по городам. airports - строки (city, country, airport, iata, icao),
+    route_counts - число маршрутов по коду IATA (для ранжирования, необязательно)
+    """
+
+    def __init__(self, airports: Iterable[Tuple[str, str, str, str, str]],
+                 route_counts: Dict[str, int] = None):
+        route_counts = route_counts or {}
+
+        # Кандидаты: различные пары (город, страна) без учета регистра
+        self.cities: List[Tuple[str, str]] = []
+        self._popularity: List[int] = []
+        city_ids: Dict[Tuple[str, str], int] = {}
+
+        # Ключи: нормализованный текст, вид, номер города, исходный текст
+        self._keys: List[Tuple[str, str, int, str]] = []
+        seen = set()
+
+        for city, country, airport, iata, icao in airports:
+            if not city:
+                continue
+            city_key = (city.lower(), (country or '').lower())
+            city_id = city_ids.get(city_key)
+            if city_id is None:
+                city_id = city_ids[city_key] = len(self.cities)
+                self.cities.append((city, country or ''))
+                self._popularity.append(0)
+            self._popularity[city_id] += route_counts.get(iata, 0) if iata else 0
+
+            for kind, text in (('city', city), ('airport', airport), ('iata', iata), ('icao', icao)):
+                key = normalize(text)
+                # 'n' - старые значения '\\N' вместо пустой строки
+                if key and key != 'n' and (key, kind, city_id) not in seen:
+                    seen.add((key, kind, city_id))
+                    self._keys.append((key, kind, city_id, text))
+
+        # Префиксный индекс: ключи и их окончания с начала каждого слова
+        prefixes = []
+        for key_id, (key, kind, _, _) in enumerate(self._keys):
+            prefixes.append((key, key_id))
+            if kind in ('city', 'airport'):
+                for match in re.finditer(r' ', key):
+                    prefixes.append((key[match.end():], key_id))
+        prefixes.sort()
+        self._prefix_keys = [prefix for prefix, _ in prefixes]
+        self._prefix_ids = [key_id for _, key_id in prefixes]
+
+        # Триграммный индекс по городам и названиям аэропортов
+        postings = defaultdict(list)
+        self._trigram_counts = np.zeros(len(self._keys), dtype=np.int32)
+        for key_id, (key, kind, _, _) in enumerate(self._keys):
+            if kind in ('city', 'airport'):
+                grams = trigrams(key)
+                self._trigram_counts[key_id] = len(grams)
+                for gram in grams:
+                    postings[gram].append(key_id)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        self._short_prefixes: Dict[str, Dict[int, Tuple[float, int]]] = {}
+        for length in range(1, SHORT_PREFIX_LENGTH + 1):
+            groups = defaultdict(list)
+            for position, prefix in enumerate(self._prefix_keys):
+                if len(prefix) >= length:
+                    groups[prefix[:length]].append(position)
+            for short_key, positions in groups.items():
+                best = self._prefix_scores(short_key, positions)
+                top = sorted(best, key=lambda city_id: (-best[city_id][0], -self._popularity[city_id]))
+                self._short_prefixes[short_key] = {city_id: best[city_id] for city_id in top[:SHORT_PREFIX_TOP]}
+
+    @classmethod
+    def from_connection(cls, connection) -> 'CitySearchIndex':
+        with connection.cursor() as cursor:
+            cursor.execute(AIRPORTS_QUERY)
+            airports = cursor.fetchall()
+            cursor.execute(ROUTE_COUNTS_QUERY)
+            route_counts = dict(cursor.fetchall())
+        return cls(airports, route_counts)
+
+    @classmethod
+    def from_store(cls, store) -> 'CitySearchIndex':
+        """Индекс по InMemoryAirtravelStore (или SnapshotStore)"""
+        route_counts = Counter()
+        for _, src, dst in store.routes:
+            route_counts[src] += 1
+            route_counts[dst] += 1
+        return cls(((a[2], a[3], a[1], a[4], a[5]) for a in store.airports), route_counts)
+
+    def _prefix_matches(self, key: str) -> Iterable[int]:
+        for position in range(bisect_left(self._prefix_keys, key), len(self._prefix_keys)):
+            if not self._prefix_keys[position].startswith(key):
+                break
+            yield position
+
+    def _prefix_scores(self, key: str, positions: Iterable[int]) -> Dict[int, Tuple[float, int]]:
+        """Лучшее префиксное совпадение для каждого города: номер города -> (score, ключ)"""
+        best: Dict[int, Tuple[float, int]] = {}
+        for position in positions:
+            key_id = self._prefix_ids[position]
+            full_key, _, city_id, _ = self._keys[key_id]
+            if full_key == key:
+                score = EXACT_SCORE
+            elif full_key == self._prefix_keys[position]:
+                score = PREFIX_SCORE
+            else:
+                score = WORD_PREFIX_SCORE
+            if city_id not in best or score > best[city_id][0]:
+                best[city_id] = (score, key_id)
+        return best
+
+    def _similar(self, key: str) -> List[Tuple[int, float]]:
+        query_grams = trigrams(key)
+        grams = [self._postings[gram] for gram in query_grams if gram in self._postings]
+        if not grams:
+            return []
+        shared = np.bincount(np.concatenate(grams), minlength=len(self._keys))
+        candidates = np.flatnonzero(shared)
+        # Похожесть как в pg_trgm: общие / (всего в запросе + всего в ключе - общие)
+        total = len(query_grams) + self._trigram_counts[candidates] - shared[candidates]
+        similarity = shared[candidates] / total
+        keep = similarity >= SIMILARITY_THRESHOLD
+        return list(zip(candidates[keep].tolist(), similarity[keep].tolist()))
+
+    def search(self, text: str, limit: int = 10) -> List[Dict]:
+        """
+        Кандидаты для введенного текста: "Моск", "Moskva", "SVO", "Sheremetyevo".
+        Текст "Город, Страна" дополнительно отбирает города по началу названия страны.
+        Возвращает словари city, country, label, match, kind, score по убыванию score
+        """
+        query, _, country = text.partition(',')
+        key = normalize(query)
+        country_key = normalize(country)
+        if not key:
+            return []
+
+        # Лучшее совпадение для каждого города: (score, ключ)
+        if len(key) <= SHORT_PREFIX_LENGTH:
+            best = dict(self._short_prefixes.get(key, {}))
+        else:
+            best = self._prefix_scores(key, self._prefix_matches(key))
+            for key_id, similarity in self._similar(key):
+                city_id = self._keys[key_id][2]
+                score = similarity + POPULARITY_WEIGHT * math.log10(1 + self._popularity[city_id])
+                if city_id not in best or score > best[city_id][0]:
+                    best[city_id] = (score, key_id)
+
+        results = []
+        for city_id, (score, key_id) in best.items():
+            city, city_country = self.cities[city_id]
+            if country_key and not normalize(city_country).startswith(country_key):
+                continue
+            _, kind, _, matched = self._keys[key_id]
+            results.append({'city': city, 'country': city_country, 'label': f"{city}, {city_country}",
+                            'match': matched, 'kind': kind, 'score': round(score, 3),
+                            'routes': self._popularity[city_id]})
+
+        results.sort(key=lambda row: (-row['score'], -row['routes'], row['label']))
+        return results[:limit]
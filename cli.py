@@ -0,0 +1,319 @@
+"""
+Поиск из командной строки без диалога: для скриптов и пакетной обработки.
+
+    python cli.py airports 55 56 37 38                        - аэропорты в диапазоне координат
+    python cli.py city Moscow Russia                          - аэропорты города
+    python cli.py flights Moscow Russia departure             - рейсы из города и/или в город
+    python cli.py direct Moscow Russia London "United Kingdom"
+    python cli.py connections Moscow Russia Goroka "Papua New Guinea" --max-stops 2
+    python cli.py direct --input pairs.csv --format csv       - пакет запросов из файла
+    python cli.py connections --input pairs.csv --workers 4   - маршруты с пересадками в 4 процессах
+    ... | python cli.py city --input -                        - пакет запросов из stdin
+
+Во входном файле одна строка - один запрос: значения в порядке аргументов
+команды через запятую (CSV: названия с запятыми - в кавычках) или объект JSON
+с именами аргументов. Пустые строки и строки с # пропускаются.
+
+Результаты выводятся по мере получения, JSON Lines (по умолчанию) или CSV:
+одна строка - одна найденная запись с номером запроса и его параметрами.
+Запросы без результатов в вывод не попадают, ошибочные строки входа
+сообщаются в stderr и пропускаются. Весь запуск идет через одно соединение с
+БД (или по снимку данных, --snapshot). Поиск города и прямых рейсов
+выполняется порциями по --batch-size запросов одним SQL-запросом на порцию.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+# Сколько запросов из входа обрабатывается за один раз
+DEFAULT_BATCH_SIZE = 500
+
+
+class Command(NamedTuple):
+    name: str
+    help: str
+    # Параметры запроса по порядку: имя -> преобразование значения
+    params: Dict[str, Callable]
+    # Значения по умолчанию для необязательных последних параметров
+    defaults: Dict[str, str]
+    # Колонки результата в выводе CSV
+    columns: Tuple[str, ...]
+    # search(backend, queries, args) -> результаты для каждого запроса порции по порядку
+    search: Callable
+
+
+AIRPORT_COLUMNS = ('id', 'city', 'country', 'iata', 'icao', 'latitude', 'longitude')
+FLIGHT_COLUMNS = ('airline', 'src_airport', 'dst_airport', 'src_city', 'src_country', 'dst_city', 'dst_country')
+DIRECT_COLUMNS = ('airline', 'src_airport', 'dst_airport', 'src_id', 'dst_id')
+CONNECTION_COLUMNS = ('stops', 'distance_km', 'airports', 'airlines')
+
+
+def _flight_type(value: str) -> str:
+    value = value.strip().lower()
+    if value not in ('departure', 'arrival', 'both'):
+        raise ValueError(f"тип рейсов должен быть departure, arrival или both, а не {value!r}")
+    return value
+
+
+def _search_airports(backend, queries: List[Dict], args) -> Iterator[Iterable[Dict]]:
+    for query in queries:
+        yield backend.get_airports_by_coordinates(query['lat_min'], query['lat_max'],
+                                                  query['lon_min'], query['lon_max'])
+
+
+def _search_city(backend, queries: List[Dict], args) -> Iterator[Iterable[Dict]]:
+    cities = [(query['city'], query['country']) for query in queries]
+    found = backend.find_airports_by_cities(cities)
+    for city in cities:
+        yield found.get(city, [])
+
+
+def _search_flights(backend, queries: List[Dict], args) -> Iterator[Iterable[Dict]]:
+    # Рейсы крупного города читаются потоком, а не целым списком
+    for query in queries:
+        yield backend.iter_flights_by_city(query['city'], query['country'], query['flight_type'])
+
+
+def _search_direct(backend, queries: List[Dict], args) -> Iterator[Iterable[Dict]]:
+    pairs = [(query['src_city'], query['src_country'], query['dst_city'], query['dst_country'])
+             for query in queries]
+    found = backend.get_direct_flights_bulk(pairs)
+    for pair in pairs:
+        yield found.get(pair, [])
+
+
+def _search_connections(backend, queries: List[Dict], args) -> Iterator[Iterable[Dict]]:
+    workers = getattr(args, 'workers_pool', None)
+    if workers is not None:
+        # Вся порция делится между процессами пула (--workers)
+        pairs = [(query['src_city'], query['src_country'], query['dst_city'], query['dst_country'])
+                 for query in queries]
+        yield from workers.find_connections_bulk(pairs, args.max_stops, args.rank_by, args.limit)
+        return
+    for query in queries:
+        yield backend.find_connections(query['src_city'], query['src_country'],
+                                       query['dst_city'], query['dst_country'],
+                                       args.max_stops, args.rank_by, args.limit)
+
+
+COMMANDS = {command.name: command for command in (
+    Command('airports', "аэропорты в диапазоне координат",
+            {'lat_min': float, 'lat_max': float, 'lon_min': float, 'lon_max': float}, {},
+            AIRPORT_COLUMNS, _search_airports),
+    Command('city', "аэропорты по городу и стране",
+            {'city': str, 'country': str}, {},
+            AIRPORT_COLUMNS, _search_city),
+    Command('flights', "рейсы по городу (departure/arrival/both)",
+            {'city': str, 'country': str, 'flight_type': _flight_type}, {'flight_type': 'both'},
+            FLIGHT_COLUMNS, _search_flights),
+    Command('direct', "прямые рейсы между городами",
+            {'src_city': str, 'src_country': str, 'dst_city': str, 'dst_country': str}, {},
+            DIRECT_COLUMNS, _search_direct),
+    Command('connections', "маршруты с пересадками",
+            {'src_city': str, 'src_country': str, 'dst_city': str, 'dst_country': str}, {},
+            CONNECTION_COLUMNS, _search_connections),
+)}
+
+
+def parse_query(command: Command, values) -> Dict:
+    """Параметры запроса из списка значений (CSV, аргументы) или словаря (JSON)"""
+    names = list(command.params)
+    if isinstance(values, dict):
+        unknown = set(values) - set(names)
+        if unknown:
+            raise ValueError(f"неизвестные поля: {', '.join(sorted(unknown))}")
+        raw = {name: values[name] for name in names if values.get(name) is not None}
+    else:
+        if len(values) > len(names):
+            raise ValueError(f"лишние значения, ожидается: {', '.join(names)}")
+        raw = dict(zip(names, values))
+
+    query = {}
+    for name, convert in command.params.items():
+        value = raw.get(name)
+        if value is None or str(value).strip() == '':
+            if name not in command.defaults:
+                raise ValueError(f"не задано поле {name}, ожидается: {', '.join(names)}")
+            value = command.defaults[name]
+        try:
+            query[name] = convert(value.strip() if isinstance(value, str) else value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"поле {name}: {e}")
+    return query
+
+
+def read_queries(command: Command, lines: Iterable[str]) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Запросы входного потока: (номер строки, параметры, None) или (номер строки, None, ошибка)"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            if line.startswith('{'):
+                values = json.loads(line)
+                if not isinstance(values, dict):
+                    raise ValueError("ожидается объект JSON")
+            else:
+                values = next(csv.reader([line]))
+            yield number, parse_query(command, values), None
+        except ValueError as e:
+            yield number, None, str(e)
+
+
+class JsonLinesWriter:
+    def __init__(self, output: TextIO, command: Command):
+        self.output = output
+
+    def write(self, number: int, query: Dict, row: Dict):
+        # Как и в CSV, параметры запроса не перекрываются одноименными полями результата
+        record = {'query': number, **query}
+        record.update((key, value) for key, value in row.items() if key not in record)
+        self.output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+class CsvWriter:
+    def __init__(self, output: TextIO, command: Command):
+        # Параметры запроса идут первыми; одноименные колонки результата (city, country)
+        # в выводе не дублируются
+        fieldnames = ['query', *command.params]
+        fieldnames += [column for column in command.columns if column not in fieldnames]
+        self.writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore', lineterminator="\n")
+        self.writer.writeheader()
+
+    def write(self, number: int, query: Dict, row: Dict):
+        self.writer.writerow({'query': number, **_flatten(row), **query})
+
+
+def _flatten(row: Dict) -> Dict:
+    """Маршрут с пересадками в одну строку CSV: аэропорты через '-', авиакомпании по перелетам через ';'"""
+    if 'legs' not in row:
+        return row
+    return {**row, 'airports': '-'.join(row['airports']),
+            'airlines': ';'.join(','.join(leg['airlines']) for leg in row['legs'])}
+
+
+WRITERS = {'jsonl': JsonLinesWriter, 'csv': CsvWriter}
+
+
+def run(backend, command: Command, queries: Iterable[Tuple[int, Optional[Dict], Optional[str]]],
+        writer, args, errors: TextIO = sys.stderr) -> Dict:
+    """Выполнение запросов порциями по args.batch_size. Возвращает счетчики запросов, строк и ошибок"""
+    stats = {'queries': 0, 'rows': 0, 'errors': 0}
+    queries = iter(queries)
+    while True:
+        chunk = list(islice(queries, args.batch_size))
+        if not chunk:
+            break
+
+        valid = []
+        for number, query, error in chunk:
+            if error is not None:
+                stats['errors'] += 1
+                print(f"Строка {number}: {error}", file=errors)
+            else:
+                valid.append((number, query))
+        if not valid:
+            continue
+
+        results = command.search(backend, [query for _, query in valid], args)
+        for (number, query), rows in zip(valid, results):
+            stats['queries'] += 1
+            for row in rows:
+                writer.write(number, query, row)
+                stats['rows'] += 1
+        args.output.flush()
+    return stats
+
+
+def open_backend(args):
+    """
+    Источник данных на весь запуск (repository.AirtravelRepository; None - открыть
+    не удалось): снимок, копия в памяти или одно соединение с БД. Без --snapshot и
+    --memory источник задает DATA_BACKEND из .env
+    """
+    from repository import open_repository
+    if args.snapshot is not None:
+        return open_repository('snapshot', snapshot=args.snapshot or None)
+    return open_repository('memory' if args.memory else None)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Поиск по данным airtravel без диалога (JSON Lines или CSV)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--snapshot', nargs='?', const='', metavar='PATH',
+                        help="искать по снимку данных (по умолчанию SNAPSHOT_PATH), без БД")
+    source.add_argument('--memory', action='store_true',
+                        help="загрузить данные в память одним снимком и искать без обращений к БД")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command in COMMANDS.values():
+        sub = subparsers.add_parser(command.name, help=command.help)
+        sub.add_argument('values', nargs='*', metavar='|'.join(command.params),
+                         help=f"параметры одного запроса: {' '.join(command.params)}")
+        sub.add_argument('--input', '-i', type=argparse.FileType('r', encoding='utf-8'),
+                         help="файл запросов (по строке на запрос; '-' - stdin)")
+        sub.add_argument('--output', '-o', type=argparse.FileType('w', encoding='utf-8'),
+                         default=sys.stdout, help="файл результатов (по умолчанию stdout)")
+        sub.add_argument('--format', '-f', choices=sorted(WRITERS), default='jsonl', help="формат вывода")
+        sub.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                         help="запросов в одной порции")
+        if command.name == 'connections':
+            sub.add_argument('--max-stops', type=int, choices=range(4), default=2, help="максимум пересадок")
+            sub.add_argument('--rank-by', choices=('hops', 'distance'), default='hops', help="сортировка")
+            sub.add_argument('--limit', type=int, default=5, help="маршрутов на запрос")
+            sub.add_argument('--workers', type=int, default=None,
+                             help="искать в N процессах (для больших пакетов запросов)")
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    command = COMMANDS[args.command]
+
+    if args.input is not None and args.values:
+        parser.error("параметры запроса задаются либо аргументами, либо файлом --input")
+    if args.input is None and not args.values:
+        parser.error(f"нужны параметры запроса ({' '.join(command.params)}) или --input")
+    if args.batch_size < 1:
+        parser.error("--batch-size должен быть положительным")
+
+    if args.input is not None:
+        queries = read_queries(command, args.input)
+    else:
+        try:
+            queries = [(1, parse_query(command, args.values), None)]
+        except ValueError as e:
+            parser.error(str(e))
+
+    # stdout занят результатами: сообщения о подключении и ошибках запросов - в stderr
+    with redirect_stdout(sys.stderr):
+        backend = open_backend(args)
+        if backend is None:
+            return 1
+        if getattr(args, 'workers', None):
+            from workers import NetworkWorkers, RouteNetwork
+            args.workers_pool = NetworkWorkers(RouteNetwork.from_backend(backend), args.workers)
+        try:
+            stats = run(backend, command, queries, WRITERS[args.format](args.output, command), args)
+        except BrokenPipeError:
+            # Получатель вывода закрыл канал (например, head): остаток вывода отбрасывается
+            os.dup2(os.open(os.devnull, os.O_WRONLY), args.output.fileno())
+            return 0
+        finally:
+            if getattr(args, 'workers_pool', None) is not None:
+                args.workers_pool.close()
+            backend.close()
+
+    print(f"Запросов: {stats['queries']}, строк: {stats['rows']}, ошибок во входе: {stats['errors']}",
+          file=sys.stderr)
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
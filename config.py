@@ -1,7 +1,29 @@
-DB_airtravel = {
-    'host': 'localhost',
-    'database': 'airtravel',
-    'user': 'name',
-    'password': 'your_password',
-    'port': '5432'
+"""
+Настройки подключения к БД и кэша. Значения берутся из .env, как у
+airtravel.py, cli.py и app.py: все интерфейсы работают с одной базой
+"""
+import os
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def db_params_from_env() -> Dict[str, str]:
+    return {
+        'host': os.environ.get("HOST"),
+        'database': os.environ.get("DATABASE"),
+        'user': os.environ.get("USER_NAME"),
+        'password': os.environ.get("PASSWORD"),
+        'port': os.environ.get("PORT")
+    }
+
+
+DB_airtravel = db_params_from_env()
+
+# Кэш результатов поиска: максимум записей и время жизни (секунды)
+QUERY_CACHE = {
+    'maxsize': int(os.environ.get("QUERY_CACHE_SIZE", 256)),
+    'ttl': float(os.environ.get("QUERY_CACHE_TTL", 300))
 }
\ No newline at end of file
@@ -0,0 +1,226 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from instrumentation import InstrumentedConnection
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """Свободное соединение не появилось за отведенное время"""
+
+
+class ConnectionPool:
+    """
+    Ограниченный потокобезопасный пул соединений с PostgreSQL.
+
+    Соединения выдаются через getconn()/putconn() или контекстный менеджер
+    connection(). При выдаче соединение проверяется: закрытые соединения
+    пересоздаются, а простаивавшие дольше ping_interval секунд проверяются
+    запросом SELECT 1, чтобы обычный поиск стоил один запрос, а не подключение.
+    """
+
+    def __init__(self, db_params: Dict[str, str], minconn: int = 1, maxconn: int = 5,
+                 timeout: float = 10.0, ping_interval: float = 30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Неверные границы пула: нужно 0 <= minconn <= maxconn, maxconn >= 1")
+
+        self.db_params = db_params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._condition = threading.Condition()
+        self._idle: List[Tuple[psycopg2.extensions.connection, float]] = []
+        self._in_use = set()
+        self._closed = False
+
+        self._checkouts = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._created = 0
+        self._reconnects = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self) -> psycopg2.extensions.connection:
+        conn = psycopg2.connect(**self.db_params, connection_factory=InstrumentedConnection)
+        with self._condition:
+            self._created += 1
+        return conn
+
+    def _is_alive(self, conn: psycopg2.extensions.connection, idle_since: float) -> bool:
+        """Проверка соединения перед выдачей"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - idle_since < self.ping_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """Взять соединение из пула (ждет не дольше timeout секунд)"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Пул соединений закрыт")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    create = False
+                    break
+                if len(self._in_use) < self.maxconn:
+                    conn, idle_since = None, 0.0
+                    create = True
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений в пуле (maxconn={self.maxconn}) за {self.timeout} с")
+                waited = True
+                self._condition.wait(remaining)
+
+            # Резервируем место до подключения, чтобы не превысить maxconn
+            placeholder = object()
+            self._in_use.add(placeholder)
+            self._checkouts += 1
+            if create:
+                self._misses += 1
+            if waited:
+                self._waits += 1
+            wait_time = time.monotonic() - started
+            self._wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        try:
+            if create:
+                conn = self._connect()
+            elif not self._is_alive(conn, idle_since):
+                self._discard(conn)
+                conn = self._connect()
+                with self._condition:
+                    self._reconnects += 1
+        except BaseException:
+            with self._condition:
+                self._in_use.discard(placeholder)
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._in_use.discard(placeholder)
+            self._in_use.add(conn)
+        return conn
+
+    def putconn(self, conn: psycopg2.extensions.connection, close: bool = False):
+        """Вернуть соединение в пул"""
+        if conn is None:
+            return
+
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._condition:
+            self._in_use.discard(conn)
+            if close or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: берет соединение и гарантированно возвращает его"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    @staticmethod
+    def _discard(conn: psycopg2.extensions.connection):
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        """Закрыть все простаивающие соединения и запретить выдачу новых"""
+        with self._condition:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle.clear()
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика пула: выдачи, промахи, ожидание"""
+        with self._condition:
+            return {
+                'checkouts': self._checkouts,
+                'misses': self._misses,
+                'waits': self._waits,
+                'wait_time_total': self._wait_time,
+                'wait_time_avg': self._wait_time / self._checkouts if self._checkouts else 0.0,
+                'wait_time_max': self._max_wait_time,
+                'created': self._created,
+                'reconnects': self._reconnects,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'maxconn': self.maxconn,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(db_params: Dict[str, str] = None, **kwargs) -> ConnectionPool:
+    """
+    Общий для процесса пул соединений.
+    Создается при первом обращении; по умолчанию параметры берутся из config.DB_airtravel
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if db_params is None:
+                from config import DB_airtravel
+                db_params = DB_airtravel
+            _pool = ConnectionPool(db_params, **kwargs)
+        return _pool
+
+
+def close_pool():
+    """Закрытие общего пула (например, при выходе из приложения)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
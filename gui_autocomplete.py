@@ -0,0 +1,140 @@
+from tkinter import Toplevel, Listbox, END
+from typing import Callable, Dict, List
+
+from city_search import KIND_TITLES
+
+# Пауза после нажатия клавиши до поиска подсказок (мс): при быстром наборе
+# запрос делается один раз, а не на каждую букву
+DEBOUNCE_MS = 120
+# Сколько подсказок показывать
+SUGGESTIONS_LIMIT = 8
+
+
+class EntryAutocomplete:
+    """
+    Выпадающий список подсказок под полем ввода "Город, Страна".
+
+    suggest(text, limit) возвращает подсказки в формате CitySearchIndex.search.
+    Стрелки вверх/вниз выбирают подсказку, Enter или щелчок мышью подставляют ее
+    в поле (вместе с suffix), Escape закрывает список. Остальные части поля после
+    второй запятой (например, тип рейса) при подстановке сохраняются.
+    """
+
+    def __init__(self, entry, suggest: Callable[[str, int], List[Dict]],
+                 suffix: str = "", limit: int = SUGGESTIONS_LIMIT):
+        self.entry = entry
+        self.suggest = suggest
+        self.suffix = suffix
+        self.limit = limit
+        self.suggestions: List[Dict] = []
+        self._popup = None
+        self._listbox = None
+        self._pending = None
+        self._last_text = None
+
+        entry.bind('<KeyRelease>', self._on_key, add='+')
+        entry.bind('<Down>', lambda event: self._move(1))
+        entry.bind('<Up>', lambda event: self._move(-1))
+        entry.bind('<Return>', self._on_return, add='+')
+        entry.bind('<Escape>', lambda event: self.hide())
+        entry.bind('<FocusOut>', lambda event: entry.after(150, self._hide_if_unfocused), add='+')
+        entry.bind('<Destroy>', lambda event: self.hide(), add='+')
+
+    def _query(self) -> str:
+        # Подсказки ищутся только по городу и стране, остальные части поля не учитываются
+        return ','.join(self.entry.get().split(',')[:2]).strip()
+
+    def _on_key(self, event):
+        if event.keysym in ('Up', 'Down', 'Return', 'KP_Enter', 'Escape', 'Tab'):
+            return
+        if self._pending is not None:
+            self.entry.after_cancel(self._pending)
+        self._pending = self.entry.after(DEBOUNCE_MS, self.refresh)
+
+    def refresh(self):
+        self._pending = None
+        text = self._query()
+        if text == self._last_text:
+            return
+        self._last_text = text
+
+        self.suggestions = self.suggest(text, self.limit) if text else []
+        # Единственная подсказка, совпадающая с введенным текстом, не нужна
+        if (len(self.suggestions) == 1 and
+                self.suggestions[0]['label'].lower() == text.lower()):
+            self.suggestions = []
+        if not self.suggestions:
+            self.hide()
+            return
+
+        self._show()
+        self._listbox.delete(0, END)
+        for suggestion in self.suggestions:
+            note = ""
+            if suggestion['kind'] != 'city':
+                note = f"  ({KIND_TITLES[suggestion['kind']]} {suggestion['match']})"
+            self._listbox.insert(END, suggestion['label'] + note)
+        self._listbox.configure(height=len(self.suggestions))
+
+    def _show(self):
+        if self._popup is None:
+            self._popup = Toplevel(self.entry)
+            self._popup.overrideredirect(True)
+            self._listbox = Listbox(self._popup, font=self.entry.cget('font'), activestyle="none",
+                                    exportselection=False)
+            self._listbox.pack(fill="both", expand=True)
+            self._listbox.bind('<ButtonRelease-1>', self._on_click)
+
+        # Список располагается вплотную под полем ввода и совпадает с ним по ширине
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self._popup.geometry(f"{self.entry.winfo_width()}x{self._listbox.winfo_reqheight()}+{x}+{y}")
+        self._popup.deiconify()
+        self._popup.lift()
+
+    def hide(self):
+        if self._pending is not None:
+            self.entry.after_cancel(self._pending)
+            self._pending = None
+        if self._popup is not None:
+            self._popup.destroy()
+            self._popup = None
+            self._listbox = None
+
+    def _hide_if_unfocused(self):
+        if self._popup is not None and self.entry.focus_get() is not self._listbox:
+            self.hide()
+
+    def _move(self, step: int):
+        if self._listbox is None:
+            return "break"
+        selection = self._listbox.curselection()
+        index = (selection[0] + step if selection else (0 if step > 0 else len(self.suggestions) - 1))
+        index = max(0, min(index, len(self.suggestions) - 1))
+        self._listbox.selection_clear(0, END)
+        self._listbox.selection_set(index)
+        self._listbox.see(index)
+        return "break"
+
+    def _on_return(self, event):
+        # Enter при выбранной подсказке только подставляет ее, поиск не запускается
+        if self._listbox is not None and self._listbox.curselection():
+            self.accept(self._listbox.curselection()[0])
+            return "break"
+        self.hide()
+
+    def _on_click(self, event):
+        selection = self._listbox.curselection()
+        if selection:
+            self.accept(selection[0])
+
+    def accept(self, index: int):
+        suggestion = self.suggestions[index]
+        rest = self.entry.get().split(',')[2:]
+        text = suggestion['label'] + (',' + ','.join(rest) if rest else self.suffix)
+        self.entry.delete(0, END)
+        self.entry.insert(0, text)
+        self.entry.icursor(END)
+        self._last_text = self._query()
+        self.hide()
+        self.entry.focus_set()
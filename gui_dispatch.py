@@ -0,0 +1,143 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from tkinter import ttk
+from typing import Any, Callable, Dict, Optional
+
+# Интервал опроса очереди результатов (мс): около 60 кадров в секунду
+POLL_INTERVAL_MS = 16
+
+
+class ProgressIndicator:
+    """Бегущая полоса прогресса, которая видна только пока идет поиск"""
+
+    def __init__(self, parent, **pack_options):
+        self.bar = ttk.Progressbar(parent, mode="indeterminate", length=200)
+        self.pack_options = pack_options or {'pady': 5}
+        self.active = False
+
+    def start(self):
+        if not self.active:
+            self.active = True
+            self.bar.pack(**self.pack_options)
+            self.bar.start(10)
+
+    def stop(self):
+        if self.active:
+            self.active = False
+            self.bar.stop()
+            self.bar.pack_forget()
+
+
+class SearchDispatcher:
+    """
+    Выполнение поисковых функций в пуле потоков.
+
+    Функции запускаются в рабочих потоках, а их результаты передаются обратно в
+    поток Tk через очередь, которую цикл событий опрашивает с помощью root.after.
+    Для каждого окна-владельца учитывается только последний запущенный поиск:
+    более старый отменяется (если еще не начался) или его результат отбрасывается.
+    """
+
+    def __init__(self, root, max_workers: int = 4):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._results: "queue.Queue[Callable[[], None]]" = queue.Queue()
+        self._generations: Dict[int, int] = {}
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._polling = False
+        self._ui_thread = threading.current_thread()
+
+    def submit(self, owner, func: Callable, *args,
+               on_success: Callable[[Any], None],
+               on_error: Optional[Callable[[Exception], None]] = None,
+               progress: Optional[ProgressIndicator] = None) -> Future:
+        """
+        Запуск func(*args) в рабочем потоке.
+        on_success/on_error вызываются в потоке Tk, если окно owner еще существует
+        и за это время для него не был запущен более новый поиск
+        """
+        key = id(owner)
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._futures.get(key)
+        if previous is not None:
+            previous.cancel()
+
+        if progress is not None:
+            progress.start()
+
+        def deliver(callback: Optional[Callable], value):
+            def run():
+                with self._lock:
+                    current = self._generations.get(key) == generation
+                    if current:
+                        self._futures.pop(key, None)
+                # Результат устарел (запущен более новый поиск) или окно уже закрыто
+                if not current or not _exists(owner):
+                    return
+                if progress is not None:
+                    progress.stop()
+                if callback is not None:
+                    callback(value)
+            self._results.put(run)
+
+        def work():
+            try:
+                result = func(*args)
+            except Exception as e:
+                print(f"Ошибка поиска: {e}")
+                deliver(on_error, e)
+            else:
+                deliver(on_success, result)
+
+        future = self.executor.submit(work)
+        with self._lock:
+            self._futures[key] = future
+        self._ensure_polling()
+        return future
+
+    def call_in_ui(self, func: Callable, *args):
+        """Выполнить func(*args) в потоке Tk (можно вызывать из рабочих потоков)"""
+        if threading.current_thread() is self._ui_thread:
+            func(*args)
+            return
+        self._results.put(lambda: func(*args))
+        self._ensure_polling()
+
+    def _ensure_polling(self):
+        # root.after можно вызывать только из потока Tk; результаты рабочих
+        # потоков забирает уже запущенный опрос
+        if not self._polling and threading.current_thread() is self._ui_thread:
+            self._polling = True
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                callback = self._results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback()
+            except Exception as e:
+                print(f"Ошибка обработки результата поиска: {e}")
+
+        with self._lock:
+            pending = any(not future.done() for future in self._futures.values())
+        if pending or not self._results.empty():
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _exists(widget) -> bool:
+    try:
+        return bool(widget.winfo_exists())
+    except Exception:
+        return False
@@ -0,0 +1,260 @@
+from array import array
+from tkinter import ttk, StringVar
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Высота строки Treeview до первого отображения (потом берется из bbox строки)
+DEFAULT_ROW_HEIGHT = 20
+# Прокрутка колесом мыши: строк за один шаг
+WHEEL_ROWS = 3
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == ''
+
+
+def _sort_key(value):
+    """Ключ сортировки непустого значения ячейки: числа (и строки-числа) по величине, затем строки"""
+    if isinstance(value, (int, float)):
+        return (0, float(value), '')
+    text = str(value)
+    try:
+        return (0, float(text), '')
+    except ValueError:
+        return (1, 0.0, text.lower())
+
+
+class VirtualTable(ttk.Frame):
+    """
+    Таблица для больших результатов поиска.
+
+    В Treeview всегда столько элементов, сколько строк помещается в окне:
+    при прокрутке у них меняются только значения, поэтому окно открывается сразу
+    при любом числе строк. Сами строки хранятся кортежами (или записями
+    records.py) в одном списке, а порядок показа (после сортировки и
+    фильтра) - массивом номеров строк. Показываются первые len(columns)
+    значений строки, остальные (например, id аэропортов) только хранятся.
+    Щелчок по заголовку сортирует по столбцу, поле "Фильтр" оставляет строки,
+    содержащие введенный текст в любом столбце. on_end() вызывается, когда
+    прокрутка дошла до последней строки (для подгрузки следующей порции).
+    """
+
+    def __init__(self, parent, columns: Sequence[Tuple[str, int]], rows: Sequence[Tuple] = (),
+                 on_end: Optional[Callable[[], None]] = None):
+        super().__init__(parent)
+        self.columns = [title for title, _ in columns]
+        self._width = len(self.columns)
+        self.rows: List[Tuple] = []
+        self.on_end = on_end
+
+        self._view = array('I')
+        self._offset = 0
+        self._visible = 1
+        self._row_height = DEFAULT_ROW_HEIGHT
+        self._items: List[str] = []
+        self._selected: Optional[int] = None
+        self._sort_column: Optional[int] = None
+        self._sort_descending = False
+        self._filter_text = ''
+        # Строки в нижнем регистре для фильтра: считаются при первом использовании фильтра
+        self._search_text: List[str] = []
+        self._refilling = False
+
+        top = ttk.Frame(self)
+        top.pack(side="top", fill="x")
+        ttk.Label(top, text="Фильтр:").pack(side="left", padx=(0, 5))
+        self.filter_var = StringVar()
+        self.filter_var.trace_add('write', lambda *args: self._on_filter())
+        ttk.Entry(top, textvariable=self.filter_var, width=30).pack(side="left")
+        self.status = ttk.Label(top, text="")
+        self.status.pack(side="right")
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show="headings", selectmode="browse")
+        for index, (title, width) in enumerate(columns):
+            self.tree.heading(title, text=title, command=lambda column=index: self.sort_by(column))
+            self.tree.column(title, width=width, anchor="center")
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y", pady=(5, 0))
+        self.tree.pack(side="left", expand=True, fill="both", pady=(5, 0))
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<MouseWheel>', lambda event: self._scroll_by(-WHEEL_ROWS if event.delta > 0 else WHEEL_ROWS))
+        self.tree.bind('<Button-4>', lambda event: self._scroll_by(-WHEEL_ROWS))
+        self.tree.bind('<Button-5>', lambda event: self._scroll_by(WHEEL_ROWS))
+        self.tree.bind('<Up>', lambda event: self._move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self._move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self._move_selection(-self._visible))
+        self.tree.bind('<Next>', lambda event: self._move_selection(self._visible))
+        self.tree.bind('<Home>', lambda event: self._move_selection(-len(self._view)))
+        self.tree.bind('<End>', lambda event: self._move_selection(len(self._view)))
+
+        self.append(rows)
+
+    def __len__(self) -> int:
+        """Число строк, которые видны с учетом фильтра"""
+        return len(self._view)
+
+    @property
+    def total(self) -> int:
+        return len(self.rows)
+
+    def append(self, rows: Sequence[Tuple]):
+        """Добавление строк (следующая порция результатов); сортировка и фильтр сохраняются"""
+        start = len(self.rows)
+        # Записи records.py - уже кортежи, копировать их не нужно
+        self.rows.extend(row if isinstance(row, tuple) else tuple(row) for row in rows)
+        if self._search_text:
+            self._search_text.extend(self._row_text(row) for row in self.rows[start:])
+        if self._sort_column is None and not self._filter_text:
+            self._view.extend(range(start, len(self.rows)))
+            self._refresh()
+        else:
+            self._rebuild_view(keep_top=True)
+
+    def selected_row(self) -> Optional[Tuple]:
+        return self.rows[self._selected] if self._selected is not None else None
+
+    # ------------------------------------------------------------------
+    # Сортировка и фильтр
+
+    def sort_by(self, column: int):
+        """Сортировка по столбцу; повторный щелчок меняет направление"""
+        if self._sort_column == column:
+            self._sort_descending = not self._sort_descending
+        else:
+            self._sort_column, self._sort_descending = column, False
+
+        for index, title in enumerate(self.columns):
+            arrow = (" ▼" if self._sort_descending else " ▲") if index == column else ""
+            self.tree.heading(title, text=title + arrow)
+        self._rebuild_view()
+
+    def _on_filter(self):
+        self._filter_text = self.filter_var.get().strip().lower()
+        if self._filter_text and len(self._search_text) != len(self.rows):
+            self._search_text = [self._row_text(row) for row in self.rows]
+        self._rebuild_view()
+
+    def _row_text(self, row: Tuple) -> str:
+        return '\t'.join('' if value is None else str(value) for value in row[:self._width]).lower()
+
+    def _rebuild_view(self, keep_top: bool = False):
+        """
+        Новый порядок показа. Выбранная строка, если она была видна, остается
+        на том же месте окна; без нее keep_top оставляет на месте верхнюю
+        строку окна (подгрузка порции не прокручивает таблицу к началу)
+        """
+        window = self._view[self._offset:self._offset + self._visible]
+        anchor, row = None, 0
+        if self._selected is not None and self._selected in window:
+            anchor, row = self._selected, window.index(self._selected)
+        elif keep_top and window:
+            anchor = window[0]
+
+        indexes = range(len(self.rows))
+        if self._filter_text:
+            text = self._filter_text
+            indexes = [index for index in indexes if text in self._search_text[index]]
+        if self._sort_column is not None:
+            # Пустые значения - в конце при любом направлении сортировки
+            column = self._sort_column
+            empty = [index for index in indexes if _is_empty(self.rows[index][column])]
+            filled = [index for index in indexes if not _is_empty(self.rows[index][column])]
+            indexes = sorted(filled, key=lambda index: _sort_key(self.rows[index][column]),
+                             reverse=self._sort_descending) + empty
+        self._view = array('I', indexes)
+        self._offset = 0
+        if anchor is not None and anchor in self._view:
+            # _refresh() ограничит смещение, если строк после нее меньше окна
+            self._offset = max(0, self._view.index(anchor) - row)
+        self._refresh()
+
+    # ------------------------------------------------------------------
+    # Видимое окно строк
+
+    def _on_resize(self, event):
+        # Высота строки и заголовка - по положению первой строки, если она уже отображена
+        bbox = self.tree.bbox(self._items[0]) if self._items else ''
+        if bbox:
+            header, self._row_height = bbox[1], bbox[3]
+        else:
+            header = self._row_height + 5
+        visible = max(1, (event.height - header) // self._row_height)
+        if visible != self._visible:
+            self._visible = visible
+            self._refresh()
+
+    def _refresh(self):
+        """Заполнение элементов Treeview строками с self._offset"""
+        self._offset = max(0, min(self._offset, len(self._view) - self._visible))
+        count = min(self._visible, len(self._view) - self._offset)
+
+        while len(self._items) < count:
+            self._items.append(self.tree.insert("", "end"))
+        while len(self._items) > count:
+            self.tree.delete(self._items.pop())
+
+        self._refilling = True
+        try:
+            selected = None
+            for position, item in enumerate(self._items):
+                index = self._view[self._offset + position]
+                self.tree.item(item, values=self.rows[index][:self._width])
+                if index == self._selected:
+                    selected = item
+            if selected:
+                self.tree.selection_set(selected)
+            else:
+                self.tree.selection_set(())
+        finally:
+            self._refilling = False
+
+        if self._view:
+            self.scrollbar.set(self._offset / len(self._view), (self._offset + count) / len(self._view))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+        shown = f"{len(self._view)} из {len(self.rows)}" if self._filter_text else f"{len(self.rows)}"
+        self.status.config(text=f"Строк: {shown}")
+
+        if self.on_end is not None and self._offset + count >= len(self._view):
+            self.after_idle(self.on_end)
+
+    def _scroll_to(self, offset: int):
+        offset = max(0, min(offset, len(self._view) - self._visible))
+        if offset != self._offset:
+            self._offset = offset
+            self._refresh()
+
+    def _scroll_by(self, rows: int):
+        self._scroll_to(self._offset + rows)
+        return "break"
+
+    def _on_scrollbar(self, action, *args):
+        if action == 'moveto':
+            self._scroll_to(round(float(args[0]) * len(self._view)))
+        elif action == 'scroll':
+            step = self._visible if args[1] == 'pages' else 1
+            self._scroll_by(int(args[0]) * step)
+
+    def _on_select(self, event):
+        if self._refilling:
+            return
+        selection = self.tree.selection()
+        if selection and selection[0] in self._items:
+            self._selected = self._view[self._offset + self._items.index(selection[0])]
+
+    def _move_selection(self, step: int):
+        if not self._view:
+            return "break"
+        position = (self._view.index(self._selected) if self._selected is not None and
+                    self._selected in self._view else self._offset - (1 if step > 0 else 0))
+        position = max(0, min(position + step, len(self._view) - 1))
+        self._selected = self._view[position]
+        if position < self._offset:
+            self._offset = position
+        elif position >= self._offset + self._visible:
+            self._offset = position - self._visible + 1
+        self._refresh()
+        return "break"
@@ -0,0 +1,298 @@
+"""
+Загрузка обновлений в формате OpenFlights (airports.dat, airlines.dat, routes.dat).
+
+Файлы потоково передаются в временные staging-таблицы через COPY FROM STDIN
+(в памяти процесса держится только буфер чтения), затем сливаются с airports,
+airlines и routes набором запросов INSERT ... ON CONFLICT и DELETE в одной
+транзакции. По каждой таблице считается, сколько строк добавлено, изменено и
+удалено. Статистика (ANALYZE) и представление city_routes пересчитываются,
+только если в соответствующих таблицах что-то изменилось.
+
+Командная строка:
+    python ingest.py --airports airports.dat --airlines airlines.dat --routes routes.dat
+    python ingest.py --routes routes.dat --keep-missing   - только добавление и обновление
+    python ingest.py ... --json                           - отчет в JSON
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+import psycopg2
+
+from city_routes import city_routes_ready, refresh_city_routes
+
+# Сколько ключей добавленных/измененных/удаленных строк показывать в отчете
+SAMPLE_SIZE = 10
+
+
+class TableSpec(NamedTuple):
+    table: str
+    key: Tuple[str, ...]
+    # Колонки файла .dat в порядке следования (лишние хвостовые колонки допускаются)
+    file_columns: Tuple[str, ...]
+    # Колонка таблицы -> выражение над staging-строкой s
+    columns: Dict[str, str]
+
+
+def _text(column: str) -> str:
+    # В таблицах отсутствующие значения хранятся пустой строкой, а не NULL
+    return f"COALESCE(s.{column}, '')"
+
+
+AIRPORTS = TableSpec(
+    table='airports',
+    key=('id',),
+    file_columns=('id', 'airport', 'city', 'country', 'iata', 'icao', 'latitude', 'longitude',
+                  'elevation', 'utc', 'dst', 'region', 'type', 'source'),
+    columns={
+        'id': "s.id",
+        'airport': _text('airport'),
+        'city': _text('city'),
+        'country': _text('country'),
+        'iata': _text('iata'),
+        'icao': _text('icao'),
+        'latitude': "s.latitude::double precision",
+        'longitude': "s.longitude::double precision",
+        'elevation': "COALESCE(s.elevation::double precision, 0)",
+        'utc': _text('utc'),
+        'dst': _text('dst'),
+        'region': _text('region'),
+    },
+)
+
+AIRLINES = TableSpec(
+    table='airlines',
+    key=('id',),
+    file_columns=('id', 'name', 'alt_name', 'iata', 'icao', 'callsign', 'country', 'active'),
+    columns={
+        'id': "s.id",
+        'name': _text('name'),
+        'alt_name': _text('alt_name'),
+        'iata': _text('iata'),
+        'icao': _text('icao'),
+        'callsign': _text('callsign'),
+        'country': _text('country'),
+        'active': _text('active'),
+    },
+)
+
+ROUTES = TableSpec(
+    table='routes',
+    key=('airline', 'src_airport', 'dst_airport'),
+    file_columns=('airline', 'airline_id', 'src_airport', 'src_airport_id', 'dst_airport',
+                  'dst_airport_id', 'codeshare', 'stops', 'airplane'),
+    columns={
+        'airline': "s.airline",
+        'airline_id': _text('airline_id'),
+        'src_airport': "s.src_airport",
+        'src_airport_id': _text('src_airport_id'),
+        'dst_airport': "s.dst_airport",
+        'dst_airport_id': _text('dst_airport_id'),
+        'codeshare': _text('codeshare'),
+        'stops': "s.stops::integer",
+        'airplane': _text('airplane'),
+    },
+)
+
+TABLES = (AIRPORTS, AIRLINES, ROUTES)
+
+
+def _count_file_columns(file) -> int:
+    """Число колонок по первой строке файла (в разных выпусках OpenFlights оно отличается)"""
+    position = file.tell()
+    first_line = file.readline()
+    file.seek(position)
+    return len(next(csv.reader([first_line]), []))
+
+
+def stage_file(cursor, spec: TableSpec, path: str) -> int:
+    """Потоковая загрузка файла .dat во временную таблицу staging_<table>. Возвращает число строк"""
+    with open(path, encoding='utf-8') as file:
+        count = _count_file_columns(file)
+        if count < len(spec.columns) or count > len(spec.file_columns):
+            raise ValueError(f"{path}: {count} колонок, ожидается формат OpenFlights {spec.table}.dat")
+        columns = spec.file_columns[:count]
+
+        cursor.execute(f"""
+        CREATE TEMP TABLE staging_{spec.table} ({', '.join(f'{column} text' for column in columns)})
+        ON COMMIT DROP
+        """)
+        cursor.copy_expert(
+            f"COPY staging_{spec.table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            file)
+
+    cursor.execute(f"SELECT count(*) FROM staging_{spec.table}")
+    return cursor.fetchone()[0]
+
+
+def merge_table(cursor, spec: TableSpec, delete_missing: bool = True) -> Dict:
+    """
+    Слияние staging-таблицы с основной: INSERT ... ON CONFLICT DO UPDATE только для
+    действительно изменившихся строк и (при delete_missing) DELETE строк, которых нет в файле
+    """
+    columns = list(spec.columns)
+    key = ', '.join(spec.key)
+    key_text = f"concat_ws('/', {', '.join('t.' + column for column in spec.key)})"
+    updates = [column for column in columns if column not in spec.key]
+
+    cursor.execute(f"""
+    WITH source AS (
+        SELECT DISTINCT ON ({', '.join('s.' + column for column in spec.key)})
+               {', '.join(f'{expression} AS {column}' for column, expression in spec.columns.items())}
+        FROM staging_{spec.table} s
+        WHERE {' AND '.join(f's.{column} IS NOT NULL' for column in spec.key)}
+        ORDER BY {', '.join('s.' + column for column in spec.key)}
+    ), merged AS (
+        INSERT INTO {spec.table} AS t ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM source
+        ON CONFLICT ({key}) DO UPDATE
+        SET {', '.join(f'{column} = EXCLUDED.{column}' for column in updates)}
+        WHERE ({', '.join('t.' + column for column in updates)})
+              IS DISTINCT FROM ({', '.join('EXCLUDED.' + column for column in updates)})
+        RETURNING (t.xmax = 0) AS inserted, {key_text} AS row_key
+    )
+    SELECT count(*) FILTER (WHERE inserted),
+           count(*) FILTER (WHERE NOT inserted),
+           (array_agg(row_key) FILTER (WHERE inserted))[1:{SAMPLE_SIZE}],
+           (array_agg(row_key) FILTER (WHERE NOT inserted))[1:{SAMPLE_SIZE}],
+           (SELECT count(*) FROM source)
+    FROM merged
+    """)
+    inserted, updated, inserted_sample, updated_sample, unique_rows = cursor.fetchone()
+
+    deleted, deleted_sample = 0, []
+    if delete_missing:
+        cursor.execute(f"""
+        WITH removed AS (
+            DELETE FROM {spec.table} t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM staging_{spec.table} s
+                WHERE {' AND '.join(f's.{column} = t.{column}' for column in spec.key)}
+            )
+            RETURNING {key_text} AS row_key
+        )
+        SELECT count(*), (array_agg(row_key))[1:{SAMPLE_SIZE}] FROM removed
+        """)
+        deleted, deleted_sample = cursor.fetchone()
+
+    return {
+        'rows': unique_rows,
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': deleted,
+        'unchanged': unique_rows - inserted - updated,
+        'inserted_sample': inserted_sample or [],
+        'updated_sample': updated_sample or [],
+        'deleted_sample': deleted_sample or [],
+    }
+
+
+def ingest_openflights(conn, airports: str = None, airlines: str = None, routes: str = None,
+                       delete_missing: bool = True) -> Dict:
+    """
+    Загрузка файлов OpenFlights в БД одной транзакцией. Таблицы без файла не трогаются.
+    Возвращает отчет: по каждой таблице число строк в файле, добавленных,
+    измененных, удаленных и неизменных, а также какие сводные данные пересчитаны
+    """
+    paths = {'airports': airports, 'airlines': airlines, 'routes': routes}
+    report = {'tables': {}, 'refreshed': []}
+    started = time.perf_counter()
+
+    try:
+        with conn.cursor() as cursor:
+            for spec in TABLES:
+                path = paths[spec.table]
+                if not path:
+                    continue
+                staged = stage_file(cursor, spec, path)
+                report['tables'][spec.table] = {'file': path, 'staged': staged,
+                                                **merge_table(cursor, spec, delete_missing)}
+        conn.commit()
+    except (psycopg2.Error, OSError, ValueError):
+        conn.rollback()
+        raise
+
+    changed = [table for table, stats in report['tables'].items()
+               if stats['inserted'] or stats['updated'] or stats['deleted']]
+
+    # Пересчет только того, что зависит от изменившихся таблиц
+    if changed:
+        with conn.cursor() as cursor:
+            for table in changed:
+                cursor.execute(f"ANALYZE {table}")
+        conn.commit()
+        report['refreshed'].extend(f"ANALYZE {table}" for table in changed)
+
+    if {'airports', 'routes'} & set(changed) and city_routes_ready(conn):
+        refresh_city_routes(conn)
+        report['refreshed'].append("city_routes")
+    conn.rollback()
+
+    report['changed'] = changed
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\n{'Таблица':<10} {'в файле':>9} {'добавлено':>10} {'изменено':>9} {'удалено':>8} {'без изм.':>9}")
+    print("-" * 60)
+    for table, stats in report['tables'].items():
+        print(f"{table:<10} {stats['staged']:>9} {stats['inserted']:>10} {stats['updated']:>9} "
+              f"{stats['deleted']:>8} {stats['unchanged']:>9}")
+
+    for table, stats in report['tables'].items():
+        for action, title in (('inserted', "добавлены"), ('updated', "изменены"), ('deleted', "удалены")):
+            if stats[f'{action}_sample']:
+                more = stats[action] - len(stats[f'{action}_sample'])
+                suffix = f" и еще {more}" if more > 0 else ""
+                print(f"{table} {title}: {', '.join(stats[f'{action}_sample'])}{suffix}")
+
+    if report['refreshed']:
+        print(f"Пересчитано: {', '.join(report['refreshed'])}")
+    else:
+        print("Данные не изменились, пересчет не нужен")
+    print(f"Время загрузки: {report['seconds']:.2f} с")
+
+
+def main(argv: List[str] = None) -> int:
+    from airtravel import airtravelDatabase
+
+    parser = argparse.ArgumentParser(description="Загрузка обновлений OpenFlights в БД airtravel")
+    parser.add_argument('--airports', help="файл airports.dat")
+    parser.add_argument('--airlines', help="файл airlines.dat")
+    parser.add_argument('--routes', help="файл routes.dat")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="не удалять строки, которых нет в файлах (частичное обновление)")
+    parser.add_argument('--json', action='store_true', help="вывести отчет в JSON")
+    args = parser.parse_args(argv)
+
+    if not (args.airports or args.airlines or args.routes):
+        parser.error("нужен хотя бы один из файлов --airports, --airlines, --routes")
+
+    db = airtravelDatabase()
+    if not db.connect():
+        return 1
+
+    try:
+        # Сеанс airtravelDatabase только для чтения: запись - в отдельной транзакции
+        with db.session.transaction(readonly=False) as connection:
+            report = ingest_openflights(connection, args.airports, args.airlines, args.routes,
+                                        delete_missing=not args.keep_missing)
+    except (psycopg2.Error, OSError, ValueError) as e:
+        print(f"Ошибка загрузки данных: {e}")
+        return 1
+    finally:
+        db.disconnect()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from dotenv import load_dotenv
+
+# Границы гистограммы времени запроса (секунды) для экспорта в Prometheus
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class SlowQuery(NamedTuple):
+    name: str
+    params_hash: str
+    statement: str
+    execute_ms: float
+    fetch_ms: float
+    rows: int
+    timestamp: float
+    plan: Optional[str] = None
+
+
+def params_hash(params: Any) -> str:
+    """Короткий хеш параметров запроса: одинаковые вызовы видны в логе, значения - нет"""
+    if params is None:
+        return ''
+    return hashlib.blake2b(repr(params).encode('utf-8'), digest_size=8).hexdigest()
+
+
+# Обертки над cursor.execute: запрос записывается на имя функции, вызвавшей обертку
+_WRAPPER_CODES = set()
+
+
+def query_wrapper(func):
+    """Отметить функцию как обертку над cursor.execute (см. caller_name)"""
+    _WRAPPER_CODES.add(func.__code__)
+    return func
+
+
+def caller_name(depth: int = 2) -> str:
+    """Имя функции, вызвавшей запрос (для методов - Класс.метод)"""
+    frame = sys._getframe(depth)
+    while frame.f_code in _WRAPPER_CODES and frame.f_back is not None:
+        frame = frame.f_back
+    code = frame.f_code
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+class _QueryStats:
+    __slots__ = ('calls', 'errors', 'execute_time', 'fetch_time', 'max_time', 'rows', 'slow', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class QueryMetrics:
+    """
+    Потокобезопасный сбор метрик запросов к БД.
+
+    Для каждого запроса (по имени вызвавшей функции) накапливаются число вызовов,
+    ошибок и строк, время выполнения и отдельно время чтения и разбора строк,
+    а также гистограмма полного времени. Запросы дольше slow_threshold_ms
+    попадают в журнал медленных запросов, при explain_slow - вместе с планом
+    EXPLAIN (ANALYZE, BUFFERS)
+    """
+
+    def __init__(self, slow_threshold_ms: float = 200.0, explain_slow: bool = False, slow_log_size: int = 100):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.explain_slow = explain_slow
+        self.enabled = True
+        self.slow_queries: "deque[SlowQuery]" = deque(maxlen=slow_log_size)
+        self._stats: Dict[str, _QueryStats] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, name: str, execute_time: float, fetch_time: float = 0.0, rows: int = 0,
+               error: bool = False) -> bool:
+        """Учет одного выполненного запроса. Возвращает True, если запрос медленный"""
+        total = execute_time + fetch_time
+        slow = not error and total * 1000 >= self.slow_threshold_ms
+
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _QueryStats()
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.execute_time += execute_time
+            stats.fetch_time += fetch_time
+            stats.max_time = max(stats.max_time, total)
+            stats.rows += rows
+            stats.slow += int(slow)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if total <= bound:
+                    stats.buckets[i] += 1
+        return slow
+
+    def log_slow(self, entry: SlowQuery):
+        self.slow_queries.append(entry)
+        print(f"Медленный запрос {entry.name} [{entry.params_hash}]: "
+              f"{entry.execute_ms + entry.fetch_ms:.1f} мс (выполнение {entry.execute_ms:.1f}, "
+              f"чтение {entry.fetch_ms:.1f}), строк: {entry.rows}")
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow_queries.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict:
+        """Текущие метрики в виде словаря (для JSON)"""
+        with self._lock:
+            queries = {
+                name: {
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'rows': stats.rows,
+                    'slow': stats.slow,
+                    'execute_ms_total': round(stats.execute_time * 1000, 3),
+                    'fetch_ms_total': round(stats.fetch_time * 1000, 3),
+                    'mean_ms': round((stats.execute_time + stats.fetch_time) * 1000 / stats.calls, 3),
+                    'max_ms': round(stats.max_time * 1000, 3),
+                }
+                for name, stats in sorted(self._stats.items())
+            }
+            slow = [entry._asdict() for entry in self.slow_queries]
+
+        return {
+            'timestamp': time.time(),
+            'since': self.started,
+            'slow_threshold_ms': self.slow_threshold_ms,
+            'queries': queries,
+            'slow_queries': slow,
+        }
+
+    def prometheus_text(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP airtravel_query_duration_seconds Полное время запроса (выполнение и чтение строк)",
+            "# TYPE airtravel_query_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._stats.items())
+            for name, stats in items:
+                label = _label(name)
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    lines.append(f'airtravel_query_duration_seconds_bucket{{query="{label}",le="{bound}"}} {count}')
+                lines.append(f'airtravel_query_duration_seconds_bucket{{query="{label}",le="+Inf"}} {stats.calls}')
+                lines.append(f'airtravel_query_duration_seconds_sum{{query="{label}"}} '
+                             f'{stats.execute_time + stats.fetch_time:.6f}')
+                lines.append(f'airtravel_query_duration_seconds_count{{query="{label}"}} {stats.calls}')
+
+            counters = [
+                ('airtravel_query_fetch_seconds_total', "Время чтения и разбора строк", 'fetch_time'),
+                ('airtravel_query_rows_total', "Число возвращенных строк", 'rows'),
+                ('airtravel_query_errors_total', "Число запросов с ошибкой", 'errors'),
+                ('airtravel_slow_queries_total', "Число медленных запросов", 'slow'),
+            ]
+            for metric, help_text, field in counters:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for name, stats in items:
+                    lines.append(f'{metric}{{query="{_label(name)}"}} {getattr(stats, field)}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class InstrumentedCursorMixin:
+    """
+    Замер каждого execute/copy_expert курсора: время выполнения, время чтения
+    строк (fetch*, итерация) и число строк. Запись в метрики делается при
+    следующем выполнении или при закрытии курсора
+    """
+
+    def _begin(self, name: str, params: Any):
+        self._finish()
+        self._query_name = name
+        self._params_hash = params_hash(params)
+        self._execute_time = 0.0
+        self._fetch_time = 0.0
+        self._rows = 0
+        self._error = False
+
+    def _finish(self):
+        name = getattr(self, '_query_name', None)
+        if name is None:
+            return
+        self._query_name = None
+        metrics = METRICS
+        if not metrics.enabled:
+            return
+
+        slow = metrics.record(name, self._execute_time, self._fetch_time, self._rows, self._error)
+        if slow:
+            statement = self.query.decode('utf-8', 'replace') if self.query else ''
+            plan = explain_statement(self.connection, statement) if metrics.explain_slow else None
+            metrics.log_slow(SlowQuery(name, self._params_hash, statement,
+                                       round(self._execute_time * 1000, 3), round(self._fetch_time * 1000, 3),
+                                       self._rows, time.time(), plan))
+
+    def execute(self, query, vars=None):
+        self._begin(caller_name(), vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        except Exception:
+            self._error = True
+            raise
+        finally:
+            self._execute_time = time.perf_counter() - started
+
+    def copy_expert(self, sql, file, size=8192):
+        self._begin(caller_name(), None)
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        except Exception:
+            self._error = True
+            raise
+        finally:
+            self._execute_time = time.perf_counter() - started
+            self._rows = max(self.rowcount, 0)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._fetch_time += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed_fetch(super().fetchone)
+        self._rows += row is not None
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(super().fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        iterator = super().__iter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._fetch_time += time.perf_counter() - started
+            self._rows += 1
+            yield row
+
+    def close(self):
+        try:
+            self._finish()
+        finally:
+            super().close()
+
+
+class InstrumentedCursor(InstrumentedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class InstrumentedDictCursor(InstrumentedCursorMixin, psycopg2.extras.DictCursor):
+    pass
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """
+    Соединение, курсоры которого замеряются. Передается в
+    psycopg2.connect(..., connection_factory=InstrumentedConnection)
+    """
+
+    _CURSORS = {
+        None: InstrumentedCursor,
+        psycopg2.extensions.cursor: InstrumentedCursor,
+        psycopg2.extras.DictCursor: InstrumentedDictCursor,
+    }
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory', self.cursor_factory)
+        if factory in self._CURSORS:
+            kwargs['cursor_factory'] = self._CURSORS[factory]
+        return super().cursor(*args, **kwargs)
+
+
+# Изменение данных в запросе (в том числе в WITH ... AS (INSERT/UPDATE/DELETE ...))
+_WRITE_KEYWORDS = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+_EXECUTE_NAME = re.compile(r'\s*EXECUTE\s+(\w+)', re.IGNORECASE)
+
+
+def _writes_data(cursor, statement: str) -> bool:
+    """
+    Изменяет ли запрос данные. Для EXECUTE проверяется текст подготовленного
+    запроса; если его не найти - запрос считается изменяющим
+    """
+    match = _EXECUTE_NAME.match(statement)
+    if match:
+        cursor.execute("SELECT statement FROM pg_prepared_statements WHERE name = %s",
+                       (match.group(1).lower(),))
+        row = cursor.fetchone()
+        if row is None:
+            return True
+        statement = row[0]
+    return bool(_WRITE_KEYWORDS.search(statement))
+
+
+def explain_statement(connection, statement: str) -> Optional[str]:
+    """
+    План медленного запроса. Только для SELECT/WITH и подготовленных запросов
+    (EXECUTE). ANALYZE выполняет запрос повторно, поэтому для запросов,
+    изменяющих данные, снимается план без выполнения (EXPLAIN без ANALYZE).
+    Внутри открытой транзакции вызывающего запрос тоже не выполняется повторно
+    (его блокировки еще удерживаются), а EXPLAIN идет под точкой сохранения:
+    ошибка не прерывает транзакцию. Для серверных курсоров и прерванных
+    транзакций план не снимается
+    """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'EXECUTE')):
+        return None
+    if connection.closed:
+        return None
+    status = connection.info.transaction_status
+    if status not in (psycopg2.extensions.TRANSACTION_STATUS_IDLE, psycopg2.extensions.TRANSACTION_STATUS_INTRANS):
+        return None
+    in_transaction = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+    try:
+        with psycopg2.extensions.cursor(connection) as cursor:
+            if in_transaction:
+                cursor.execute("SAVEPOINT explain_slow_query")
+            try:
+                analyze = not in_transaction and not _writes_data(cursor, statement)
+                cursor.execute(("EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN ") + statement)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            except psycopg2.Error as e:
+                print(f"Не удалось получить план медленного запроса: {e}")
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+                return None
+            finally:
+                if in_transaction and connection.info.transaction_status == \
+                        psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+                    cursor.execute("RELEASE SAVEPOINT explain_slow_query")
+                elif not in_transaction and not connection.autocommit:
+                    # EXPLAIN сам открыл транзакцию - соединение возвращается в прежнее состояние
+                    connection.rollback()
+    except psycopg2.Error as e:
+        print(f"Не удалось получить план медленного запроса: {e}")
+        return None
+
+
+class JsonDumper:
+    """Периодическая запись метрик в JSON-файл в фоновом потоке"""
+
+    def __init__(self, metrics: QueryMetrics, path: str, interval: float = 60.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+
+    def start(self) -> 'JsonDumper':
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        # Пишем во временный файл и заменяем: читатель не увидит недописанный JSON
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.metrics.snapshot(), file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Не удалось сохранить метрики в {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.dump()
+
+
+# Общие метрики процесса; порог и EXPLAIN задаются через переменные окружения (.env)
+load_dotenv()
+METRICS = QueryMetrics(slow_threshold_ms=float(os.environ.get("SLOW_QUERY_MS", 200)),
+                       explain_slow=os.environ.get("SLOW_QUERY_EXPLAIN") == "1")
+
+_dumper: Optional[JsonDumper] = None
+
+
+def start_json_dump(path: str = None, interval: float = None) -> Optional[JsonDumper]:
+    """
+    Запуск периодической записи METRICS в JSON.
+    По умолчанию путь и интервал берутся из METRICS_DUMP_PATH и METRICS_DUMP_INTERVAL;
+    без пути запись не запускается
+    """
+    global _dumper
+    path = path or os.environ.get("METRICS_DUMP_PATH")
+    if not path or _dumper is not None:
+        return _dumper
+    interval = interval or float(os.environ.get("METRICS_DUMP_INTERVAL", 60))
+    _dumper = JsonDumper(METRICS, path, interval).start()
+    return _dumper
+
+
+def stop_json_dump():
+    global _dumper
+    if _dumper is not None:
+        _dumper.stop()
+        _dumper = None
+
+
+def slow_queries() -> List[SlowQuery]:
+    return list(METRICS.slow_queries)
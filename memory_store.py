@@ -0,0 +1,370 @@
+import io
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from operator import itemgetter
+from typing import List, Dict, Tuple, Optional, Iterator
+import numpy as np
+from route_planner import RoutePlanner
+from spatial import AirportLocator, routes_by_distance
+from city_search import CitySearchIndex
+from pagination import paginate
+from records import (Airport, Airline, Route, RouteBatch, AIRPORT_RESULT, FLIGHT_RESULT,
+                     DIRECT_FLIGHT_RESULT, ROUTE_RESULT)
+
+# Колонки, которые загружаются в память (порядок совпадает с COPY)
+AIRPORT_COLUMNS = ('id', 'airport', 'city', 'country', 'iata', 'icao', 'latitude', 'longitude')
+AIRLINE_COLUMNS = ('id', 'name', 'alt_name', 'iata', 'icao', 'callsign', 'country', 'active')
+ROUTE_COLUMNS = ('airline', 'src_airport', 'dst_airport')
+
+# Сколько последних поисков рейсов по городу хранят индекс страниц (см. get_flights_by_city_page)
+FLIGHT_PAGES_CACHE_SIZE = 32
+
+_COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v', '\\': '\\'}
+
+
+def _unescape_copy_value(value: str) -> Optional[str]:
+    """Разбор одного значения текстового формата COPY"""
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+
+    chars = []
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == '\\' and i + 1 < len(value):
+            i += 1
+            chars.append(_COPY_ESCAPES.get(value[i], value[i]))
+        else:
+            chars.append(ch)
+        i += 1
+    return ''.join(chars)
+
+
+def parse_copy_text(buffer: io.StringIO) -> List[List[Optional[str]]]:
+    """Разбор вывода COPY ... TO STDOUT (текстовый формат) в список строк"""
+    rows = []
+    for line in buffer.getvalue().split('\n'):
+        if not line or line == '\\.':
+            continue
+        rows.append([_unescape_copy_value(value) for value in line.split('\t')])
+    return rows
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _key(city: str, country: str) -> Tuple[str, str]:
+    """Нормализованный ключ (город, страна), аналог LOWER(city), LOWER(country)"""
+    return (city or '').lower(), (country or '').lower()
+
+
+class InMemoryAirtravelStore:
+    """
+    Хранилище аэропортов, авиакомпаний и маршрутов в памяти процесса.
+
+    Все три таблицы загружаются один раз потоковым COPY в рамках одного снимка
+    данных, после чего поиск идет по хеш-индексам без обращений к PostgreSQL.
+    Методы повторяют сигнатуры и формат результатов airtravelDatabase.
+    """
+
+    def __init__(self):
+        self.airports: List[Tuple] = []
+        self.airlines: List[Tuple] = []
+        self.routes: List[Tuple[str, str, str]] = []
+
+        self._airports_by_city: Dict[Tuple[str, str], List[int]] = {}
+        self._airports_by_iata: Dict[str, List[int]] = {}
+        self._routes_by_src: Dict[str, List[int]] = {}
+        self._routes_by_dst: Dict[str, List[int]] = {}
+        self._routes_by_pair: Dict[Tuple[str, str], List[int]] = {}
+        self.locator: Optional[AirportLocator] = None
+        self._planner: Optional[RoutePlanner] = None
+        self._route_lengths: Optional[np.ndarray] = None
+        self._city_index: Optional[CitySearchIndex] = None
+        self._flight_pages: 'OrderedDict[Tuple, Tuple[List[Tuple], List[Tuple]]]' = OrderedDict()
+        self._flight_pages_lock = threading.Lock()
+
+        self.load_time = 0.0
+        self.is_loaded = False
+
+    @classmethod
+    def from_connection(cls, connection) -> 'InMemoryAirtravelStore':
+        store = cls()
+        store.load(connection)
+        return store
+
+    def load(self, connection):
+        """Загрузка всех таблиц через COPY TO STDOUT в одной транзакции"""
+        started = time.perf_counter()
+
+        buffers = {}
+        queries = {
+            'airports': f"COPY (SELECT {', '.join(AIRPORT_COLUMNS)} FROM airports) TO STDOUT",
+            'airlines': f"COPY (SELECT {', '.join(AIRLINE_COLUMNS)} FROM airlines) TO STDOUT",
+            'routes': f"COPY (SELECT {', '.join(ROUTE_COLUMNS)} FROM routes) TO STDOUT",
+        }
+
+        with connection.cursor() as cursor:
+            # Один снимок данных для всех трех таблиц
+            if connection.autocommit:
+                cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            else:
+                connection.rollback()
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+            try:
+                for table, query in queries.items():
+                    buffers[table] = io.StringIO()
+                    cursor.copy_expert(query, buffers[table])
+            finally:
+                if connection.autocommit:
+                    cursor.execute("COMMIT")
+                else:
+                    connection.rollback()
+
+        self.build(parse_copy_text(buffers['airports']),
+                   parse_copy_text(buffers['airlines']),
+                   parse_copy_text(buffers['routes']))
+        self.load_time = time.perf_counter() - started
+        print(f"Данные загружены в память за {self.load_time:.2f} с: "
+              f"{len(self.airports)} аэропортов, {len(self.airlines)} авиакомпаний, "
+              f"{len(self.routes)} маршрутов")
+
+    def build(self, airports: List[List], airlines: List[List], routes: List[List]):
+        """Построение индексов по уже прочитанным строкам таблиц"""
+        self.airports = [
+            Airport((row[0], row[1], row[2], row[3], row[4], row[5], _to_float(row[6]), _to_float(row[7])))
+            for row in airports
+        ]
+        self.airlines = [Airline(row) for row in airlines]
+        self.routes = [ROUTE_RESULT((row[0], row[1], row[2])) for row in routes]
+
+        by_city = defaultdict(list)
+        by_iata = defaultdict(list)
+        for index, airport in enumerate(self.airports):
+            by_city[_key(airport[2], airport[3])].append(index)
+            if airport[4] is not None:
+                by_iata[airport[4]].append(index)
+
+        by_src = defaultdict(list)
+        by_dst = defaultdict(list)
+        by_pair = defaultdict(list)
+        for index, (_, src, dst) in enumerate(self.routes):
+            by_src[src].append(index)
+            by_dst[dst].append(index)
+            by_pair[(src, dst)].append(index)
+
+        self._airports_by_city = dict(by_city)
+        self._airports_by_iata = dict(by_iata)
+        self._routes_by_src = dict(by_src)
+        self._routes_by_dst = dict(by_dst)
+        self._routes_by_pair = dict(by_pair)
+        self.locator = AirportLocator([self._airport_row(index) for index in range(len(self.airports))])
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_pages.clear()
+        self.is_loaded = True
+
+    def _airport_row(self, index: int) -> Airport:
+        airport_id, _, city, country, iata, icao, latitude, longitude = self.airports[index]
+        return AIRPORT_RESULT((airport_id, city, country, iata, icao, latitude, longitude))
+
+    def _city_airports(self, city: str, country: str) -> List[int]:
+        return self._airports_by_city.get(_key(city, country), [])
+
+    def _flight_values(self, route_index: int, src_index: int, dst_index: int) -> Tuple:
+        """Значения колонок FLIGHT_RESULT для рейса"""
+        airline, src_airport, dst_airport = self.routes[route_index]
+        src = self.airports[src_index]
+        dst = self.airports[dst_index]
+        return airline, src_airport, dst_airport, src[2], src[3], dst[2], dst[3]
+
+    def get_airports_by_coordinates(self, lat_min: float, lat_max: float,
+                                    lon_min: float, lon_max: float) -> List[Airport]:
+        """
+        Поиск аэропортов в диапазоне географических координат
+        """
+        return self.locator.airports_in_box(lat_min, lat_max, lon_min, lon_max)
+
+    def get_airports_within_radius(self, lat: float, lon: float, radius_km: float) -> List[Airport]:
+        """
+        Поиск аэропортов в радиусе radius_km от точки (по большому кругу)
+        """
+        return self.locator.airports_within_radius(lat, lon, radius_km)
+
+    def get_nearest_airports(self, lat: float, lon: float, k: int = 10) -> List[Airport]:
+        """
+        Поиск k ближайших к точке аэропортов
+        """
+        return self.locator.nearest_airports(lat, lon, k)
+
+    def get_routes_by_distance(self, min_km: float = 0.0, max_km: float = None, limit: int = 100) -> List[Dict]:
+        """
+        Маршруты с длиной по большому кругу от min_km до max_km (км), от самых длинных
+        """
+        if self._route_lengths is None:
+            self._route_lengths = self._compute_route_lengths()
+        return routes_by_distance(self.routes, self._route_lengths, min_km, max_km, limit)
+
+    def _compute_route_lengths(self) -> np.ndarray:
+        return self.locator.route_lengths_km(self.routes)
+
+    def suggest_cities(self, text: str, limit: int = 10) -> List[Dict]:
+        """
+        Подсказки городов по началу или неточному написанию города, аэропорта, кода IATA/ICAO
+        """
+        return self.city_index().search(text, limit)
+
+    def city_index(self) -> CitySearchIndex:
+        """Индекс подсказок по городам, аэропортам и кодам (строится один раз)"""
+        if self._city_index is None:
+            self._city_index = CitySearchIndex.from_store(self)
+        return self._city_index
+
+    def find_airport_by_city_country(self, city: str, country: str) -> List[Airport]:
+        """
+        Поиск аэропорта по городу и стране
+        """
+        return [self._airport_row(index) for index in self._city_airports(city, country)]
+
+    def find_airports_by_cities(self, cities: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Airport]]:
+        """
+        Пакетный поиск аэропортов для списка пар (город, страна)
+        """
+        return {key: self.find_airport_by_city_country(*key) for key in cities}
+
+    def get_flights_by_city(self, city: str, country: str, flight_type: str = 'both') -> RouteBatch:
+        """
+        Поиск всех рейсов в или из заданного города
+        flight_type: 'departure', 'arrival', 'both'
+        """
+        return RouteBatch(FLIGHT_RESULT._fields, (self._flight_values(*match)
+                                                  for match in self._match_flights(city, country, flight_type)))
+
+    def _match_flights(self, city: str, country: str, flight_type: str) -> Iterator[Tuple[int, int, int]]:
+        """Тройки (маршрут, аэропорт вылета, аэропорт прилета) для рейсов по городу"""
+        flight_type = flight_type.lower()
+        city_airports = self._city_airports(city, country)
+        city_set = set(city_airports)
+
+        # Как и в SQL-запросе, любой тип кроме departure/arrival означает both
+        if flight_type != 'arrival':
+            for src_index in city_airports:
+                for route_index in self._routes_by_src.get(self.airports[src_index][4], []):
+                    dst_iata = self.routes[route_index][2]
+                    for dst_index in self._airports_by_iata.get(dst_iata, []):
+                        yield route_index, src_index, dst_index
+
+        if flight_type != 'departure':
+            for dst_index in city_airports:
+                for route_index in self._routes_by_dst.get(self.airports[dst_index][4], []):
+                    src_iata = self.routes[route_index][1]
+                    for src_index in self._airports_by_iata.get(src_iata, []):
+                        # Рейсы внутри города уже учтены как вылеты
+                        if flight_type != 'arrival' and src_index in city_set:
+                            continue
+                        yield route_index, src_index, dst_index
+
+    def iter_flights_by_city(self, city: str, country: str, flight_type: str = 'both',
+                             itersize: int = 2000) -> Iterator[Route]:
+        """
+        Потоковый поиск рейсов по городу (itersize оставлен для совместимости с airtravelDatabase)
+        """
+        for match in self._match_flights(city, country, flight_type):
+            yield FLIGHT_RESULT(self._flight_values(*match))
+
+    def get_flights_by_city_page(self, city: str, country: str, flight_type: str = 'both',
+                                 limit: int = 100, after: Tuple = None) -> Tuple[List[Route], Optional[Tuple]]:
+        """
+        Постраничный поиск рейсов по городу, ключ страницы как у airtravelDatabase.
+        Записи создаются только для рейсов страницы
+        """
+        keys, matches = self._flight_pages_index(city, country, flight_type)
+        start = bisect_right(keys, tuple(after)) if after is not None else 0
+        rows = [Route(self._flight_values(*match) + keys[position][3:])
+                for position, match in enumerate(matches[start:start + limit + 1], start)]
+        return paginate(rows, limit)
+
+    def _flight_pages_index(self, city: str, country: str, flight_type: str) -> Tuple[List[Tuple], List[Tuple]]:
+        """
+        Ключи страниц (FLIGHT_PAGE_KEY) рейсов по городу по возрастанию и тройки
+        рейсов в том же порядке. Данные хранилища не меняются, поэтому индекс
+        последних FLIGHT_PAGES_CACHE_SIZE поисков хранится: следующая страница -
+        двоичный поиск, а не новый перебор рейсов города
+        """
+        flight_type = flight_type.lower()
+        cache_key = (_key(city, country), flight_type if flight_type in ('departure', 'arrival') else 'both')
+        with self._flight_pages_lock:
+            index = self._flight_pages.get(cache_key)
+            if index is not None:
+                self._flight_pages.move_to_end(cache_key)
+                return index
+
+        routes, airports = self.routes, self.airports
+        airport_ids: Dict[int, str] = {}
+        flights = []
+        for match in self._match_flights(city, country, flight_type):
+            route_index, src_index, dst_index = match
+            for airport_index in (src_index, dst_index):
+                if airport_index not in airport_ids:
+                    airport_ids[airport_index] = airports[airport_index][0]
+            flights.append((tuple(routes[route_index]) + (airport_ids[src_index], airport_ids[dst_index]), match))
+        flights.sort(key=itemgetter(0))
+        index = [key for key, _ in flights], [match for _, match in flights]
+
+        with self._flight_pages_lock:
+            self._flight_pages[cache_key] = index
+            if len(self._flight_pages) > FLIGHT_PAGES_CACHE_SIZE:
+                self._flight_pages.popitem(last=False)
+        return index
+
+    def get_direct_flights(self, src_city: str, src_country: str,
+                           dst_city: str, dst_country: str) -> List[Route]:
+        """
+        Поиск прямых рейсов между двумя городами
+        """
+        results = []
+        dst_airports = self._city_airports(dst_city, dst_country)
+
+        for src_index in self._city_airports(src_city, src_country):
+            src_iata = self.airports[src_index][4]
+            for dst_index in dst_airports:
+                dst_iata = self.airports[dst_index][4]
+                for route_index in self._routes_by_pair.get((src_iata, dst_iata), []):
+                    airline, src_airport, dst_airport = self.routes[route_index]
+                    results.append(DIRECT_FLIGHT_RESULT((airline, src_airport, dst_airport,
+                                                         self.airports[src_index][0],
+                                                         self.airports[dst_index][0])))
+
+        return results
+
+    def get_direct_flights_bulk(self, pairs: List[Tuple[str, str, str, str]]) -> Dict[Tuple[str, str, str, str], List[Route]]:
+        """
+        Пакетный поиск прямых рейсов для списка пар городов
+        """
+        return {key: self.get_direct_flights(*key) for key in pairs}
+
+    def find_connections(self, src_city: str, src_country: str, dst_city: str, dst_country: str,
+                         max_stops: int = 2, rank_by: str = 'hops', limit: int = 5) -> List[Dict]:
+        """
+        Поиск маршрутов с пересадками между двумя городами
+        rank_by: 'hops', 'distance'
+        """
+        if self._planner is None:
+            self._planner = RoutePlanner(
+                ((a[4], a[2], a[3], a[6], a[7]) for a in self.airports), self.routes)
+        return self._planner.find_itineraries(src_city, src_country, dst_city, dst_country,
+                                              max_stops, rank_by, limit)
+
+    def _get_flights_between_airports(self, src_airport: str, dst_airport: str) -> List[Route]:
+        """Получение рейсов между двумя аэропортами"""
+        return [
+            ROUTE_RESULT(self.routes[index])
+            for index in self._routes_by_pair.get((src_airport, dst_airport), [])
+        ]
@@ -0,0 +1,436 @@
+import json
+import sys
+from typing import List, Dict, NamedTuple
+
+import psycopg2
+
+from city_routes import refresh_city_routes
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    up: str
+    down: str
+    # Необязательная миграция (например, требующая расширения) при ошибке пропускается
+    # и отмечается в schema_migrations как пропущенная, чтобы не повторять ее при каждом запуске
+    optional: bool = False
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1, "Функциональный индекс по lower(city), lower(country)",
+        """
+        CREATE INDEX IF NOT EXISTS airports_lower_city_country_idx
+            ON airports (LOWER(city), LOWER(country));
+        ANALYZE airports
+        """,
+        "DROP INDEX IF EXISTS airports_lower_city_country_idx",
+    ),
+    Migration(
+        2, "Индексы по аэропортам вылета и прилета в routes",
+        """
+        CREATE INDEX IF NOT EXISTS routes_src_airport_idx ON routes (src_airport);
+        CREATE INDEX IF NOT EXISTS routes_dst_airport_idx ON routes (dst_airport);
+        ANALYZE routes
+        """,
+        """
+        DROP INDEX IF EXISTS routes_src_airport_idx;
+        DROP INDEX IF EXISTS routes_dst_airport_idx
+        """,
+    ),
+    Migration(
+        3, "Индекс по коду IATA аэропорта",
+        "CREATE INDEX IF NOT EXISTS airports_iata_idx ON airports (iata)",
+        "DROP INDEX IF EXISTS airports_iata_idx",
+    ),
+    Migration(
+        4, "Триграммный индекс по lower(city) (расширение pg_trgm)",
+        """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS airports_lower_city_trgm_idx
+            ON airports USING gin (LOWER(city) gin_trgm_ops)
+        """,
+        "DROP INDEX IF EXISTS airports_lower_city_trgm_idx",
+        optional=True,
+    ),
+    Migration(
+        5, "Составной индекс по паре (вылет, прилет) в routes для пакетного поиска прямых рейсов",
+        """
+        CREATE INDEX IF NOT EXISTS routes_src_dst_airport_idx ON routes (src_airport, dst_airport);
+        ANALYZE routes
+        """,
+        "DROP INDEX IF EXISTS routes_src_dst_airport_idx",
+    ),
+    Migration(
+        6, "Материализованное представление city_routes: маршруты с городами вылета и прилета",
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS city_routes AS
+        SELECT r.airline, r.src_airport, r.dst_airport,
+               a1.id AS src_id, a2.id AS dst_id,
+               a1.city AS src_city, a1.country AS src_country,
+               a2.city AS dst_city, a2.country AS dst_country,
+               LOWER(a1.city) AS src_city_key, LOWER(a1.country) AS src_country_key,
+               LOWER(a2.city) AS dst_city_key, LOWER(a2.country) AS dst_country_key
+        FROM routes r
+        JOIN airports a1 ON r.src_airport = a1.iata
+        JOIN airports a2 ON r.dst_airport = a2.iata;
+        CREATE UNIQUE INDEX IF NOT EXISTS city_routes_key_idx
+            ON city_routes (airline, src_airport, dst_airport, src_id, dst_id);
+        CREATE INDEX IF NOT EXISTS city_routes_src_idx ON city_routes (src_city_key, src_country_key);
+        CREATE INDEX IF NOT EXISTS city_routes_dst_idx ON city_routes (dst_city_key, dst_country_key);
+        CREATE INDEX IF NOT EXISTS city_routes_pair_idx
+            ON city_routes (src_city_key, src_country_key, dst_city_key, dst_country_key);
+        ANALYZE city_routes
+        """,
+        "DROP MATERIALIZED VIEW IF EXISTS city_routes",
+    ),
+    Migration(
+        7, "Версии таблиц данных: триггеры увеличивают версию при изменении строк",
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name text PRIMARY KEY,
+            version bigint NOT NULL DEFAULT 1,
+            changed_at timestamptz NOT NULL DEFAULT now()
+        );
+        INSERT INTO table_versions (table_name)
+        VALUES ('airports'), ('airlines'), ('routes')
+        ON CONFLICT DO NOTHING;
+
+        -- Версия растет, только если оператор действительно изменил строки
+        -- (INSERT ... ON CONFLICT без изменений версию не трогает)
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            changed boolean := TG_OP = 'TRUNCATE';
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed := EXISTS (SELECT 1 FROM old_rows);
+            ELSIF TG_OP IN ('INSERT', 'UPDATE') THEN
+                changed := EXISTS (SELECT 1 FROM new_rows);
+            END IF;
+            IF changed THEN
+                UPDATE table_versions SET version = version + 1, changed_at = now()
+                WHERE table_name = TG_TABLE_NAME;
+            END IF;
+            RETURN NULL;
+        END
+        $$;
+        """ + "".join(f"""
+        DROP TRIGGER IF EXISTS {table}_version_insert ON {table};
+        CREATE TRIGGER {table}_version_insert AFTER INSERT ON {table}
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+        DROP TRIGGER IF EXISTS {table}_version_update ON {table};
+        CREATE TRIGGER {table}_version_update AFTER UPDATE ON {table}
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+        DROP TRIGGER IF EXISTS {table}_version_delete ON {table};
+        CREATE TRIGGER {table}_version_delete AFTER DELETE ON {table}
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+        DROP TRIGGER IF EXISTS {table}_version_truncate ON {table};
+        CREATE TRIGGER {table}_version_truncate AFTER TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+        """ for table in ('airports', 'airlines', 'routes')),
+        """
+        DROP TRIGGER IF EXISTS airports_version_insert ON airports;
+        DROP TRIGGER IF EXISTS airports_version_update ON airports;
+        DROP TRIGGER IF EXISTS airports_version_delete ON airports;
+        DROP TRIGGER IF EXISTS airports_version_truncate ON airports;
+        DROP TRIGGER IF EXISTS airlines_version_insert ON airlines;
+        DROP TRIGGER IF EXISTS airlines_version_update ON airlines;
+        DROP TRIGGER IF EXISTS airlines_version_delete ON airlines;
+        DROP TRIGGER IF EXISTS airlines_version_truncate ON airlines;
+        DROP TRIGGER IF EXISTS routes_version_insert ON routes;
+        DROP TRIGGER IF EXISTS routes_version_update ON routes;
+        DROP TRIGGER IF EXISTS routes_version_delete ON routes;
+        DROP TRIGGER IF EXISTS routes_version_truncate ON routes;
+        DROP FUNCTION IF EXISTS bump_table_version();
+        DROP TABLE IF EXISTS table_versions
+        """,
+    ),
+    Migration(
+        8, "Индексы city_routes для подготовленных запросов: оба индекса по паре городов",
+        # Общий план подготовленного запроса не знает значений параметров: при равной
+        # оценке для поиска прямых рейсов выбирался индекс только по городу прилета
+        # с отбором тысяч строк. Теперь оба индекса содержат все четыре ключа, а
+        # city_routes_src_idx не нужен: его заменяет начало city_routes_pair_idx
+        """
+        DROP INDEX IF EXISTS city_routes_dst_idx;
+        CREATE INDEX city_routes_dst_idx
+            ON city_routes (dst_city_key, dst_country_key, src_city_key, src_country_key);
+        DROP INDEX IF EXISTS city_routes_src_idx;
+        ANALYZE city_routes
+        """,
+        """
+        DROP INDEX IF EXISTS city_routes_dst_idx;
+        CREATE INDEX city_routes_dst_idx ON city_routes (dst_city_key, dst_country_key);
+        CREATE INDEX IF NOT EXISTS city_routes_src_idx ON city_routes (src_city_key, src_country_key);
+        ANALYZE city_routes
+        """,
+    ),
+]
+
+# Запросы, по которым строится отчет EXPLAIN ANALYZE
+EXPLAIN_QUERIES: List[Dict] = [
+    {
+        'name': 'find_airport_by_city_country',
+        'query': """
+        SELECT id, city, country, iata, icao, latitude, longitude
+        FROM airports
+        WHERE LOWER(city) = LOWER(%s) AND LOWER(country) = LOWER(%s)
+        """,
+        'params': ('London', 'United Kingdom'),
+    },
+    {
+        'name': 'get_flights_by_city (departure)',
+        'query': """
+        SELECT r.airline, r.src_airport, r.dst_airport
+        FROM routes r
+        JOIN airports a1 ON r.src_airport = a1.iata
+        JOIN airports a2 ON r.dst_airport = a2.iata
+        WHERE LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)
+        """,
+        'params': ('London', 'United Kingdom'),
+    },
+    {
+        'name': 'get_direct_flights',
+        'query': """
+        SELECT r.airline, r.src_airport, r.dst_airport
+        FROM routes r
+        JOIN airports a1 ON r.src_airport = a1.iata
+        JOIN airports a2 ON r.dst_airport = a2.iata
+        WHERE LOWER(a1.city) = LOWER(%s) AND LOWER(a1.country) = LOWER(%s)
+          AND LOWER(a2.city) = LOWER(%s) AND LOWER(a2.country) = LOWER(%s)
+        """,
+        'params': ('London', 'United Kingdom', 'Moscow', 'Russia'),
+    },
+]
+
+
+def _ensure_version_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer PRIMARY KEY,
+            description character varying NOT NULL,
+            applied_at timestamp with time zone NOT NULL DEFAULT now(),
+            skipped boolean NOT NULL DEFAULT false
+        )
+        """)
+        # Таблица, созданная до появления пропущенных миграций
+        cur.execute("ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS skipped boolean NOT NULL DEFAULT false")
+    conn.commit()
+
+
+def get_applied_versions(conn) -> List[int]:
+    """Список уже примененных (и пропущенных необязательных) версий схемы"""
+    _ensure_version_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+        versions = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    return versions
+
+
+def get_skipped_versions(conn) -> List[int]:
+    """Необязательные миграции, которые не удалось применить"""
+    _ensure_version_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations WHERE skipped ORDER BY version")
+        versions = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    return versions
+
+
+def apply_migrations(conn, target: int = None) -> List[int]:
+    """
+    Применение всех еще не примененных миграций (до версии target включительно).
+    Каждая миграция выполняется в своей транзакции. Возвращает примененные версии
+    """
+    applied = set(get_applied_versions(conn))
+    done = []
+
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        if target is not None and migration.version > target:
+            break
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(migration.up)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (migration.version, migration.description))
+            conn.commit()
+            done.append(migration.version)
+            print(f"Миграция {migration.version} применена: {migration.description}")
+        except psycopg2.Error as e:
+            conn.rollback()
+            if migration.optional:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, description, skipped) VALUES (%s, %s, true)",
+                        (migration.version, migration.description))
+                conn.commit()
+                print(f"Миграция {migration.version} пропущена: {str(e).strip()} "
+                      f"(повторить: python migrations.py retry {migration.version})")
+                continue
+            print(f"Ошибка применения миграции {migration.version}: {e}")
+            raise
+
+    return done
+
+
+def retry_migration(conn, version: int) -> List[int]:
+    """Повторное применение пропущенной необязательной миграции (например, после установки расширения)"""
+    if version not in get_skipped_versions(conn):
+        print(f"Миграция {version} не отмечена как пропущенная")
+        return []
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM schema_migrations WHERE version = %s", (version,))
+    conn.commit()
+    return apply_migrations(conn)
+
+
+def downgrade_migrations(conn, target: int = 0) -> List[int]:
+    """Откат примененных миграций с версией больше target"""
+    applied = set(get_applied_versions(conn))
+    skipped = set(get_skipped_versions(conn))
+    done = []
+
+    for migration in reversed(MIGRATIONS):
+        if migration.version <= target or migration.version not in applied:
+            continue
+
+        try:
+            with conn.cursor() as cur:
+                if migration.version not in skipped:
+                    cur.execute(migration.down)
+                cur.execute("DELETE FROM schema_migrations WHERE version = %s", (migration.version,))
+            conn.commit()
+            done.append(migration.version)
+            print(f"Миграция {migration.version} откатена")
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Ошибка отката миграции {migration.version}: {e}")
+            raise
+
+    return done
+
+
+def explain_queries(conn) -> List[Dict]:
+    """
+    EXPLAIN ANALYZE для типовых запросов приложения.
+    Для каждого запроса возвращается время планирования/выполнения и узлы плана
+    """
+    report = []
+
+    with conn.cursor() as cur:
+        for item in EXPLAIN_QUERIES:
+            cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + item['query'], item['params'])
+            plan = cur.fetchone()[0][0]
+            report.append({
+                'name': item['name'],
+                'planning_ms': plan.get('Planning Time'),
+                'execution_ms': plan.get('Execution Time'),
+                'nodes': sorted(set(_plan_nodes(plan['Plan']))),
+            })
+    conn.rollback()
+
+    return report
+
+
+def _plan_nodes(node: Dict) -> List[str]:
+    name = node['Node Type']
+    if node.get('Index Name'):
+        name += f" ({node['Index Name']})"
+    elif node.get('Relation Name'):
+        name += f" ({node['Relation Name']})"
+
+    nodes = [name]
+    for child in node.get('Plans', []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def print_explain_report(before: List[Dict], after: List[Dict]):
+    """Сравнение планов до и после применения миграций"""
+    print("\n" + "=" * 100)
+    print(f"{'Запрос':<35} {'До, мс':>12} {'После, мс':>12} {'Ускорение':>12}")
+    print("=" * 100)
+
+    for old, new in zip(before, after):
+        old_ms = old['execution_ms'] or 0.0
+        new_ms = new['execution_ms'] or 0.0
+        speedup = f"{old_ms / new_ms:.1f}x" if new_ms else "-"
+        print(f"{old['name']:<35} {old_ms:>12.3f} {new_ms:>12.3f} {speedup:>12}")
+        print(f"    до:    {', '.join(old['nodes'])}")
+        print(f"    после: {', '.join(new['nodes'])}")
+
+
+def main(argv: List[str] = None):
+    """
+    Командная строка:
+        python migrations.py status            - примененные [x], пропущенные [-] и ожидающие миграции
+        python migrations.py apply [версия]    - применить миграции
+        python migrations.py retry версия      - повторить пропущенную необязательную миграцию
+        python migrations.py downgrade [версия] - откатить миграции до версии (по умолчанию 0)
+        python migrations.py report [--json]   - EXPLAIN ANALYZE до и после применения миграций
+        python migrations.py refresh           - пересчитать city_routes после перезагрузки данных
+    """
+    from airtravel import airtravelDatabase
+
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'status'
+
+    db = airtravelDatabase()
+    if not db.connect():
+        return 1
+
+    try:
+        # Сеанс по умолчанию только читает: команды идут в транзакции с записью
+        with db.session.transaction(readonly=False) as conn:
+            if command == 'status':
+                applied = set(get_applied_versions(conn))
+                skipped = set(get_skipped_versions(conn))
+                for migration in MIGRATIONS:
+                    mark = "-" if migration.version in skipped else "x" if migration.version in applied else " "
+                    print(f"[{mark}] {migration.version:>3}  {migration.description}")
+            elif command == 'apply':
+                target = int(argv[1]) if len(argv) > 1 else None
+                apply_migrations(conn, target)
+            elif command == 'retry' and len(argv) > 1:
+                retry_migration(conn, int(argv[1]))
+            elif command == 'downgrade':
+                target = int(argv[1]) if len(argv) > 1 else 0
+                downgrade_migrations(conn, target)
+            elif command == 'report':
+                before = explain_queries(conn)
+                if not apply_migrations(conn):
+                    print("Нет новых миграций: планы до и после совпадают "
+                          "(для сравнения выполните сначала 'downgrade 0')")
+                after = explain_queries(conn)
+                if '--json' in argv:
+                    print(json.dumps({'before': before, 'after': after}, ensure_ascii=False, indent=2))
+                else:
+                    print_explain_report(before, after)
+            elif command == 'refresh':
+                refresh_city_routes(conn)
+                print("Представление city_routes пересчитано")
+            else:
+                print(main.__doc__)
+                return 1
+    except psycopg2.Error as e:
+        print(f"Ошибка выполнения команды {command}: {e}")
+        return 1
+    finally:
+        db.disconnect()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+from typing import Dict, List, Optional, Tuple
+
+# Ключ пагинации рейсов: первичный ключ routes плюс id аэропортов
+# (один код IATA может встречаться у нескольких аэропортов)
+FLIGHT_PAGE_KEY = ('airline', 'src_airport', 'dst_airport', 'src_id', 'dst_id')
+
+
+def page_key(row: Dict, key_columns: Tuple[str, ...] = FLIGHT_PAGE_KEY) -> Tuple:
+    return tuple(row[column] for column in key_columns)
+
+
+def paginate(rows: List[Dict], limit: int,
+             key_columns: Tuple[str, ...] = FLIGHT_PAGE_KEY) -> Tuple[List[Dict], Optional[Tuple]]:
+    """
+    Разбор выборки из limit + 1 строк: сама страница и ключ следующей страницы.
+    Лишняя строка только показывает, что данные еще есть
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, page_key(rows[-1], key_columns)
+
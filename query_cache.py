@@ -0,0 +1,180 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+def normalize_value(value: Any) -> Hashable:
+    """
+    Нормализация аргумента для ключа кэша.
+    Строки приводятся к нижнему регистру (поиск в БД идет через LOWER),
+    списки и кортежи - к кортежам нормализованных значений
+    """
+    if isinstance(value, str):
+        return value.lower()
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_value(item) for item in value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def make_key(name: str, args: Tuple, kwargs: Dict) -> Tuple:
+    return (name,
+            tuple(normalize_value(arg) for arg in args),
+            tuple(sorted((key, normalize_value(value)) for key, value in kwargs.items())))
+
+
+class QueryCache:
+    """
+    Потокобезопасный кэш результатов запросов с ограничением размера (LRU)
+    и временем жизни записей (TTL). Ведет счетчики попаданий, промахов и вытеснений
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, name: Optional[str] = None):
+        """Сброс кэша целиком или только записей одного запроса (например, после перезагрузки данных)"""
+        with self._lock:
+            if name is None:
+                self._data.clear()
+            else:
+                for key in [key for key in self._data if key[0] == name]:
+                    del self._data[key]
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+def _copy(value):
+    """
+    Копия закэшированного результата для вызывающего: список можно менять,
+    кэш от этого не пострадает. Пакет рейсов (records.RouteBatch) после
+    создания не меняется и возвращается как есть, без распаковки в записи
+    """
+    return list(value) if isinstance(value, list) else value
+
+
+def _lookup(cache: QueryCache, name: str, args: Tuple, kwargs: Dict, call: Callable):
+    key = make_key(name, args, kwargs)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return _copy(value)
+
+    result = call()
+    # Пустой результат не кэшируется: методы возвращают [] и при ошибке запроса
+    if result:
+        cache.set(key, result)
+        return _copy(result)
+    return result
+
+
+async def _async_lookup(cache: QueryCache, name: str, args: Tuple, kwargs: Dict, call: Callable):
+    key = make_key(name, args, kwargs)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return _copy(value)
+
+    result = await call()
+    if result:
+        cache.set(key, result)
+        return _copy(result)
+    return result
+
+
+def cached(cache: QueryCache, name: str = None):
+    """Декоратор для функций: результат кэшируется по нормализованным аргументам"""
+    def decorator(func: Callable) -> Callable:
+        query_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return _lookup(cache, query_name, args, kwargs, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def cached_method(func: Callable) -> Callable:
+    """Декоратор для методов: используется кэш экземпляра self.cache (None - без кэша)"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        cache = getattr(self, 'cache', None)
+        if cache is None:
+            return func(self, *args, **kwargs)
+        return _lookup(cache, func.__name__, args, kwargs, lambda: func(self, *args, **kwargs))
+
+    return wrapper
+
+
+def async_cached_method(func: Callable) -> Callable:
+    """То же, что cached_method, для методов-корутин"""
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        cache = getattr(self, 'cache', None)
+        if cache is None:
+            return await func(self, *args, **kwargs)
+        return await _async_lookup(cache, func.__name__, args, kwargs, lambda: func(self, *args, **kwargs))
+
+    return wrapper
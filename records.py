@@ -0,0 +1,239 @@
+"""
+Компактные записи результатов поиска: Airport, Airline, Route и RouteBatch.
+
+Запись - кортеж (tuple) без __dict__ (__slots__ = ()), поэтому строка
+результата занимает столько же, сколько кортеж из psycopg2, а не словарь
+плюс DictRow. Значения читаются и по номеру (row[0], как кортеж из
+fetchall() в app.py), и по имени колонки (row['city'], row.city,
+row.get('city'), как словарь в airtravelDatabase): keys() и items() есть,
+поэтому dict(row) и {**row} тоже работают.
+
+Набор колонок у запросов разный (рейсы с городами, с id аэропортов, прямые
+рейсы без городов), поэтому у каждого типа есть варианты с нужными
+колонками - подклассы, которые создаются один раз на набор колонок
+(Route.with_columns(...)); isinstance(row, Route) для них верно.
+
+Курсоры AirportCursor, AirlineCursor и RouteCursor создают записи прямо из
+строк выборки (колонки - по cursor.description). RouteBatchCursor.fetchall()
+возвращает RouteBatch - результат по колонкам для больших выборок рейсов:
+каждая колонка - массив номеров значений (4 байта на ячейку), одинаковые
+значения (коды, города, страны) хранятся один раз.
+"""
+import operator
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from instrumentation import InstrumentedCursor
+
+
+class Record(tuple):
+    """Кортеж с доступом к значениям по имени колонки"""
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _positions: Dict[str, int] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._positions = {name: position for position, name in enumerate(cls._fields)}
+        for position, name in enumerate(cls._fields):
+            setattr(cls, name, property(operator.itemgetter(position)))
+        # Тип, объявленный в модуле, - основа своих вариантов с другим набором колонок
+        if '_base' not in cls.__dict__:
+            cls._base = cls
+            cls._variants = {}
+
+    @classmethod
+    def with_columns(cls, columns: Iterable[str]) -> type:
+        """Вариант типа с колонками columns (создается один раз на набор колонок)"""
+        base = cls._base
+        columns = tuple(columns)
+        if columns == base._fields:
+            return base
+        variant = base._variants.get(columns)
+        if variant is None:
+            variant = base._variants[columns] = type(base.__name__, (base,), {
+                '__slots__': (), '_fields': columns, '_base': base, '__module__': base.__module__,
+                '__qualname__': base.__qualname__})
+        return variant
+
+    @classmethod
+    def from_values(cls, **values) -> 'Record':
+        """Запись по именованным значениям: Airport.from_values(id=..., city=...)"""
+        return cls.with_columns(values)(values.values())
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                return tuple.__getitem__(self, self._positions[key])
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        position = self._positions.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def values(self) -> Tuple:
+        return tuple(self)
+
+    def items(self) -> Iterator[Tuple[str, object]]:
+        return zip(self._fields, self)
+
+    def without(self, columns: Iterable[str]) -> 'Record':
+        """Та же запись без колонок columns (служебных колонок пакетного запроса)"""
+        positions = [position for position, name in enumerate(self._fields) if name not in columns]
+        record = self.with_columns(self._fields[position] for position in positions)
+        return record(tuple.__getitem__(self, position) for position in positions)
+
+    def _asdict(self) -> Dict:
+        return dict(zip(self._fields, self))
+
+    def __repr__(self) -> str:
+        values = ', '.join(f"{name}={value!r}" for name, value in zip(self._fields, self))
+        return f"{type(self).__name__}({values})"
+
+    def __reduce__(self):
+        # Варианты создаются динамически: при передаче в другой процесс
+        # восстанавливаются по основному типу и набору колонок
+        return _rebuild, (self._base, self._fields, tuple(self))
+
+
+def _rebuild(base: type, columns: Tuple[str, ...], values: Tuple) -> Record:
+    return base.with_columns(columns)(values)
+
+
+class Airport(Record):
+    __slots__ = ()
+    _fields = ('id', 'airport', 'city', 'country', 'iata', 'icao', 'latitude', 'longitude')
+
+
+class Airline(Record):
+    __slots__ = ()
+    _fields = ('id', 'name', 'alt_name', 'iata', 'icao', 'callsign', 'country', 'active')
+
+
+class Route(Record):
+    """Рейс: маршрут с городами аэропортов и id аэропортов (в выборках - часть колонок)"""
+    __slots__ = ()
+    _fields = ('airline', 'src_airport', 'dst_airport', 'src_city', 'src_country',
+               'dst_city', 'dst_country', 'src_id', 'dst_id')
+
+
+# Варианты с колонками результатов поиска (те же наборы колонок, что в выборках airtravelDatabase)
+AIRPORT_RESULT = Airport.with_columns(('id', 'city', 'country', 'iata', 'icao', 'latitude', 'longitude'))
+FLIGHT_RESULT = Route.with_columns(Route._fields[:7])
+DIRECT_FLIGHT_RESULT = Route.with_columns(('airline', 'src_airport', 'dst_airport', 'src_id', 'dst_id'))
+ROUTE_RESULT = Route.with_columns(('airline', 'src_airport', 'dst_airport'))
+# Аэропорт с расстоянием до точки поиска (поиск по радиусу и ближайших)
+AIRPORT_DISTANCE_RESULT = Airport.with_columns(AIRPORT_RESULT._fields + ('distance_km',))
+
+
+class RouteBatch(Sequence):
+    """
+    Рейсы по колонкам. Элементы - записи Route (создаются при обращении),
+    len(), срезы и итерация - как у списка. column(name) - значения одной колонки
+    """
+
+    __slots__ = ('columns', '_record', '_codes', '_values', '_value_codes')
+
+    def __init__(self, columns: Iterable[str] = Route._fields, rows: Iterable[Tuple] = ()):
+        self.columns = tuple(columns)
+        self._record = Route.with_columns(self.columns)
+        self._codes = [array('I') for _ in self.columns]
+        # Различные значения всех колонок и их номера
+        self._values: List = []
+        self._value_codes: Dict = {}
+        self.extend(rows)
+
+    def extend(self, rows: Iterable[Tuple]):
+        values, value_codes = self._values, self._value_codes
+
+        def code(value) -> int:
+            number = value_codes.get(value)
+            if number is None:
+                number = value_codes[value] = len(values)
+                values.append(value)
+            return number
+
+        rows = list(rows)
+        for codes, column in zip(self._codes, zip(*rows) if rows else ()):
+            codes.extend([code(value) for value in column])
+
+    def __len__(self) -> int:
+        return len(self._codes[0]) if self._codes else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        values = self._values
+        return self._record([values[codes[index]] for codes in self._codes])
+
+    def __iter__(self) -> Iterator[Route]:
+        record, values = self._record, self._values
+        columns = [[values[code] for code in codes] for codes in self._codes]
+        return map(record, zip(*columns))
+
+    def column(self, name: str) -> List:
+        values = self._values
+        return [values[code] for code in self._codes[self.columns.index(name)]]
+
+    def __reduce__(self):
+        return RouteBatch, (self.columns, [tuple(row) for row in self])
+
+    def __repr__(self) -> str:
+        return f"RouteBatch({len(self)} рейсов, колонки: {', '.join(self.columns)})"
+
+
+class RecordCursor(InstrumentedCursor):
+    """Курсор, строки которого - записи record_type с колонками выборки"""
+
+    record_type = Record
+
+    def _record(self) -> type:
+        return self.record_type.with_columns(column.name for column in self.description)
+
+    def fetchone(self):
+        row = super().fetchone()
+        return self._record()(row) if row is not None else None
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size)
+        record = self._record()
+        return [record(row) for row in rows]
+
+    def fetchall(self):
+        rows = super().fetchall()
+        record = self._record()
+        return [record(row) for row in rows]
+
+    def __iter__(self):
+        record = None
+        for row in super().__iter__():
+            if record is None:
+                # У серверного курсора описание колонок появляется после первой порции строк
+                record = self._record()
+            yield record(row)
+
+
+class AirportCursor(RecordCursor):
+    record_type = Airport
+
+
+class AirlineCursor(RecordCursor):
+    record_type = Airline
+
+
+class RouteCursor(RecordCursor):
+    record_type = Route
+
+
+class RouteBatchCursor(InstrumentedCursor):
+    """Курсор, fetchall() которого возвращает RouteBatch"""
+
+    def fetchall(self):
+        return RouteBatch((column.name for column in self.description), super().fetchall())
@@ -0,0 +1,193 @@
+"""
+Единый слой доступа к данным для консоли (airtravel.py), окон (app.py) и
+командной строки (cli.py): интерфейсы вызывают методы AirtravelRepository и
+сами SQL не пишут.
+
+Источник данных выбирается при запуске - аргументом open_repository() или
+DATA_BACKEND в .env:
+    postgres - запросы к БД через airtravelDatabase (подготовленные запросы,
+               кэш результатов, представление city_routes, замеры запросов)
+    memory   - данные БД один раз загружаются в память (InMemoryAirtravelStore)
+    snapshot - файл снимка данных (SnapshotStore), БД не нужна
+У всех источников одни и те же методы поиска и одни и те же записи результатов
+(records.py), поэтому оптимизация источника сразу действует во всех
+интерфейсах. Окна ищут в нескольких потоках и открывают источник с
+pooled=True: запросы к БД идут по пулу соединений (statements.PooledStatementSession).
+
+После загрузки новых данных (ingest.py) или перезаписи снимка интерфейсы
+вызывают AirtravelRepository.refresh(): источник сбрасывает кэш и индексы,
+если изменились версии таблиц в БД (table_versions) или файл снимка.
+"""
+import os
+import time
+from typing import Dict, Optional
+
+import psycopg2
+from dotenv import load_dotenv
+
+from analytics import table_versions
+from memory_store import InMemoryAirtravelStore
+from snapshot import SnapshotStore, snapshot_path
+
+BACKENDS = ('postgres', 'memory', 'snapshot')
+
+# Методы поиска, одинаковые у всех источников
+METHODS = frozenset({
+    'get_airports_by_coordinates', 'get_airports_within_radius', 'get_nearest_airports',
+    'get_routes_by_distance', 'suggest_cities', 'city_index',
+    'find_airport_by_city_country', 'find_airports_by_cities',
+    'get_flights_by_city', 'iter_flights_by_city', 'get_flights_by_city_page',
+    'get_direct_flights', 'get_direct_flights_bulk', 'find_connections',
+})
+
+# Не чаще раза в столько секунд refresh() проверяет, не изменились ли данные
+DATA_VERSION_TTL = 1.0
+
+
+class AirtravelRepository:
+    """
+    Открытый источник данных. Методы поиска (METHODS) - методы самого
+    источника: airtravelDatabase, InMemoryAirtravelStore или SnapshotStore
+    """
+
+    def __init__(self, kind: str, source, db=None):
+        self.kind = kind
+        self.source = source
+        # airtravelDatabase, если поиск идет по БД
+        self.db = db
+        self._version = None
+        self._version = self._data_version()
+        self._checked = time.monotonic()
+
+    def __getattr__(self, name: str):
+        if name in METHODS:
+            return getattr(self.source, name)
+        raise AttributeError(f"{type(self).__name__} не содержит {name!r}")
+
+    def statistics(self, analytics) -> Dict:
+        """Сводная статистика (analytics.NetworkAnalytics): по БД - SQL-запросами, по данным в памяти - на месте"""
+        if self.db is None:
+            return analytics.report(self.source)
+        with self.db.session.transaction() as connection:
+            return analytics.report(connection)
+
+    def invalidate_cache(self):
+        """Сброс кэша и индексов источника после перезагрузки данных в БД"""
+        if self.db is not None:
+            self.db.invalidate_cache()
+
+    def refresh(self) -> bool:
+        """
+        Проверка, не изменились ли данные с прошлого вызова (не чаще раза в
+        DATA_VERSION_TTL секунд). По БД сравниваются версии таблиц, при
+        изменении сбрасываются кэш и индексы airtravelDatabase; измененный
+        снимок открывается заново. Копия в памяти - снимок БД на момент
+        загрузки и не обновляется. True - данные изменились
+        """
+        now = time.monotonic()
+        if now - self._checked < DATA_VERSION_TTL:
+            return False
+        self._checked = now
+
+        version = self._data_version()
+        if version == self._version:
+            return False
+        self._version = version
+        if self.kind == 'snapshot':
+            try:
+                store = SnapshotStore.open(self.source.snapshot.path)
+            except (OSError, ValueError) as e:
+                print(f"Не удалось открыть снимок данных {self.source.snapshot.path}: {e}")
+                return False
+            # Старый снимок не закрывается: по нему могут еще искать другие потоки,
+            # отображение файла освободится вместе с объектом
+            self.source = store
+        else:
+            self.invalidate_cache()
+        return True
+
+    def _data_version(self):
+        if self.db is not None:
+            try:
+                with self.db.session.transaction() as connection:
+                    return table_versions(connection)
+            except psycopg2.Error as e:
+                print(f"Ошибка проверки версий данных: {e}")
+                return self._version
+        if self.kind == 'snapshot':
+            try:
+                return os.stat(self.source.snapshot.path).st_mtime_ns
+            except OSError:
+                return self._version
+        return None
+
+    def close(self):
+        if self.db is not None:
+            self.db.disconnect()
+        elif isinstance(self.source, SnapshotStore):
+            self.source.close()
+
+
+def backend_kind(kind: str = None) -> str:
+    """Источник из аргумента или DATA_BACKEND; без них IN_MEMORY_STORE=1 выбирает memory, иначе postgres"""
+    kind = (kind or os.environ.get("DATA_BACKEND") or '').strip().lower()
+    if not kind:
+        kind = 'memory' if os.environ.get("IN_MEMORY_STORE") == "1" else 'postgres'
+    if kind not in BACKENDS:
+        raise ValueError(f"Неизвестный источник данных {kind!r}, допустимы: {', '.join(BACKENDS)}")
+    return kind
+
+
+def open_repository(kind: str = None, db_params: Dict[str, str] = None, snapshot: str = None,
+                    pooled: bool = False, migrate: bool = False,
+                    fallback: bool = False) -> Optional[AirtravelRepository]:
+    """
+    Открытие источника данных; None - открыть не удалось (причина уже выведена).
+    snapshot - путь к снимку (по умолчанию SNAPSHOT_PATH), pooled - пул
+    соединений для поиска из нескольких потоков, migrate - применить миграции
+    схемы после подключения, fallback - если БД недоступна, искать по снимку
+    """
+    load_dotenv()
+    try:
+        kind = backend_kind(kind)
+    except ValueError as e:
+        print(e)
+        return None
+
+    if kind == 'snapshot':
+        return _open_snapshot(snapshot)
+
+    # airtravel.py сам открывает источник через этот модуль
+    from airtravel import airtravelDatabase
+    db = airtravelDatabase(db_params, pooled=pooled)
+    if not db.connect():
+        if not fallback or not os.path.exists(snapshot or snapshot_path()):
+            return None
+        repository = _open_snapshot(snapshot)
+        if repository is not None:
+            print("Автономный режим: поиск по снимку данных, только чтение")
+        return repository
+
+    if migrate:
+        db.apply_migrations()
+    if kind == 'memory':
+        try:
+            with db.session.transaction() as connection:
+                store = InMemoryAirtravelStore.from_connection(connection)
+        except psycopg2.Error as e:
+            # Поиск продолжается по БД
+            print(f"Не удалось загрузить данные в память: {e}")
+        else:
+            db.disconnect()
+            return AirtravelRepository('memory', store)
+    return AirtravelRepository('postgres', db, db)
+
+
+def _open_snapshot(path: str = None) -> Optional[AirtravelRepository]:
+    path = path or snapshot_path()
+    try:
+        store = SnapshotStore.open(path)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось открыть снимок данных {path}: {e}")
+        return None
+    return AirtravelRepository('snapshot', store)
@@ -0,0 +1,161 @@
+import heapq
+import itertools
+from collections import defaultdict, deque
+from typing import List, Dict, Tuple, Iterable
+
+from spatial import haversine_km
+
+RANK_BY_HOPS = 'hops'
+RANK_BY_DISTANCE = 'distance'
+
+
+def _key(city: str, country: str) -> Tuple[str, str]:
+    return (city or '').lower(), (country or '').lower()
+
+
+class RoutePlanner:
+    """
+    Поиск маршрутов с пересадками по графу routes.
+
+    Граф строится один раз: вершины - коды IATA аэропортов, ребра - пары
+    (вылет, прилет) со списком авиакомпаний. Лучшие маршруты ищутся алгоритмом A*
+    по частичным путям: обратный BFS от аэропортов назначения дает точную
+    нижнюю оценку числа перелетов, а расстояние по большому кругу до ближайшего
+    аэропорта назначения - нижнюю оценку оставшегося пути. Пути извлекаются из
+    очереди в порядке ранжирования, поэтому поиск останавливается на первых limit.
+    """
+
+    def __init__(self, airports: Iterable[Tuple], routes: Iterable[Tuple[str, str, str]]):
+        """
+        airports: (iata, city, country, latitude, longitude)
+        routes: (airline, src_airport, dst_airport)
+        """
+        self.coordinates: Dict[str, Tuple[float, float]] = {}
+        self.city_airports: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        self.airport_city: Dict[str, Tuple[str, str]] = {}
+
+        for iata, city, country, latitude, longitude in airports:
+            if not iata or latitude is None or longitude is None:
+                continue
+            if iata not in self.coordinates:
+                self.coordinates[iata] = (latitude, longitude)
+                self.airport_city[iata] = (city, country)
+            if iata not in self.city_airports[_key(city, country)]:
+                self.city_airports[_key(city, country)].append(iata)
+
+        adjacency = defaultdict(lambda: defaultdict(list))
+        for airline, src, dst in routes:
+            # Как и JOIN в SQL-запросах: учитываются только известные аэропорты
+            if src in self.coordinates and dst in self.coordinates and src != dst:
+                adjacency[src][dst].append(airline)
+
+        self.adjacency: Dict[str, Dict[str, List[str]]] = {
+            src: {dst: sorted(airlines) for dst, airlines in targets.items()}
+            for src, targets in adjacency.items()
+        }
+        self.reverse: Dict[str, List[str]] = defaultdict(list)
+        for src, targets in self.adjacency.items():
+            for dst in targets:
+                self.reverse[dst].append(src)
+
+        self.edge_count = sum(len(targets) for targets in self.adjacency.values())
+
+    @classmethod
+    def from_connection(cls, connection) -> 'RoutePlanner':
+        """Построение графа по двум выборкам из БД"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT iata, city, country, latitude, longitude FROM airports")
+            airports = cursor.fetchall()
+            cursor.execute("SELECT airline, src_airport, dst_airport FROM routes")
+            routes = cursor.fetchall()
+        return cls(airports, routes)
+
+    def _leg_distance(self, src: str, dst: str) -> float:
+        return haversine_km(*self.coordinates[src], *self.coordinates[dst])
+
+    def _hops_to_targets(self, targets: List[str], max_legs: int) -> Dict[str, int]:
+        """Обратный BFS: минимальное число перелетов от аэропорта до назначения"""
+        hops = {target: 0 for target in targets}
+        queue = deque(targets)
+        while queue:
+            node = queue.popleft()
+            if hops[node] >= max_legs:
+                continue
+            for prev in self.reverse.get(node, ()):
+                if prev not in hops:
+                    hops[prev] = hops[node] + 1
+                    queue.append(prev)
+        return hops
+
+    def find_itineraries(self, src_city: str, src_country: str, dst_city: str, dst_country: str,
+                         max_stops: int = 2, rank_by: str = RANK_BY_HOPS, limit: int = 5) -> List[Dict]:
+        """
+        Лучшие маршруты между городами с не более чем max_stops пересадками.
+        rank_by: 'hops' (число перелетов, затем расстояние) или 'distance'
+        """
+        sources = self.city_airports.get(_key(src_city, src_country), [])
+        targets = self.city_airports.get(_key(dst_city, dst_country), [])
+        if not sources or not targets or limit <= 0:
+            return []
+
+        max_legs = max_stops + 1
+        target_set = set(targets)
+        hops = self._hops_to_targets(targets, max_legs)
+        nearest_target: Dict[str, float] = {}
+
+        def distance_estimate(node: str) -> float:
+            if node not in nearest_target:
+                nearest_target[node] = min(self._leg_distance(node, target) for target in targets)
+            return nearest_target[node]
+
+        def priority(legs: int, node: str, distance: float) -> Tuple:
+            estimate = distance + distance_estimate(node)
+            if rank_by == RANK_BY_DISTANCE:
+                return (estimate, legs + hops[node])
+            return (legs + hops[node], estimate)
+
+        counter = itertools.count()
+        queue = []
+        for source in sources:
+            if source in hops and source not in target_set:
+                heapq.heappush(queue, (priority(0, source, 0.0), next(counter), (source,), 0.0))
+
+        results = []
+        while queue and len(results) < limit:
+            _, _, path, distance = heapq.heappop(queue)
+            node = path[-1]
+
+            if node in target_set:
+                results.append(self._itinerary(path, distance))
+                continue
+
+            legs = len(path) - 1
+            for nxt in self.adjacency.get(node, {}):
+                # Отсекаем вершины, из которых назначение недостижимо за оставшиеся перелеты
+                if nxt in path or nxt not in hops or legs + 1 + hops[nxt] > max_legs:
+                    continue
+                new_distance = distance + self._leg_distance(node, nxt)
+                heapq.heappush(queue, (priority(legs + 1, nxt, new_distance), next(counter),
+                                       path + (nxt,), new_distance))
+
+        return results
+
+    def _itinerary(self, path: Tuple[str, ...], distance: float) -> Dict:
+        legs = []
+        for src, dst in zip(path, path[1:]):
+            src_city, src_country = self.airport_city[src]
+            dst_city, dst_country = self.airport_city[dst]
+            legs.append({
+                'src_airport': src, 'dst_airport': dst,
+                'src_city': src_city, 'src_country': src_country,
+                'dst_city': dst_city, 'dst_country': dst_country,
+                'airlines': list(self.adjacency[src][dst]),
+                'distance_km': round(self._leg_distance(src, dst), 1),
+            })
+
+        return {
+            'airports': list(path),
+            'stops': len(path) - 2,
+            'distance_km': round(distance, 1),
+            'legs': legs,
+        }
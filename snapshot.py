@@ -0,0 +1,461 @@
+"""
+Снимок данных airtravel в компактном бинарном файле.
+
+Таблицы airports, airlines и routes хранятся по колонкам: строковые колонки -
+номера в общей таблице строк (каждая строка записана один раз в UTF-8),
+координаты - массивы double. В файл сразу записаны индексы, которые
+InMemoryAirtravelStore строит при загрузке (аэропорты по городу и по IATA,
+маршруты по аэропорту вылета и прилета), в виде отсортированных ключей и
+списков номеров строк.
+
+SnapshotStore открывает файл через mmap и читает значения прямо из
+отображенных страниц: открытие занимает миллисекунды, а страницы файла
+общие для всех процессов, открывших один и тот же снимок. Поиск идет теми же
+методами и с тем же форматом результатов, что у airtravelDatabase, поэтому
+приложение может работать по снимку без PostgreSQL (только чтение).
+
+Формат файла:
+    MAGIC (8 байт), версия и длина заголовка (uint32), заголовок JSON
+    (число строк в таблицах и смещения секций), затем секции, выровненные
+    по 8 байтам. Порядок байт - как у машины, на которой снимок записан.
+
+Командная строка:
+    python snapshot.py export [файл]               - снимок из БД (параметры из .env)
+    python snapshot.py export [файл] --from-dump   - снимок прямо из airtravel_dump.sql
+    python snapshot.py info [файл]
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from memory_store import InMemoryAirtravelStore, AIRPORT_COLUMNS, AIRLINE_COLUMNS, ROUTE_COLUMNS
+from records import Airport, Airline, ROUTE_RESULT
+from spatial import AirportLocator
+
+MAGIC = b'ATSNAP\x00\x01'
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+
+# Номер строки для NULL в строковых колонках
+NONE_ID = 0xFFFFFFFF
+# Сколько раскодированных строк держать в памяти процесса
+STRING_CACHE_SIZE = 1 << 16
+# Разделитель города и страны в ключе индекса airports_by_city
+_KEY_SEPARATOR = '\x00'
+
+FLOAT_COLUMNS = ('latitude', 'longitude')
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airtravel.snapshot")
+
+
+def snapshot_path() -> str:
+    """Путь к снимку: SNAPSHOT_PATH из .env или airtravel.snapshot рядом с приложением"""
+    return os.environ.get("SNAPSHOT_PATH") or DEFAULT_SNAPSHOT_PATH
+
+
+def _city_key_text(key: Tuple[str, str]) -> str:
+    return _KEY_SEPARATOR.join(key)
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+# =====================================================================
+# Запись снимка
+# =====================================================================
+
+class _StringTable:
+    """Общая таблица строк: каждая различная строка хранится один раз"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NONE_ID
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def sections(self) -> Dict[str, array]:
+        offsets = array('I', [0])
+        blob = bytearray()
+        for value in self.strings:
+            blob += value.encode('utf-8')
+            offsets.append(len(blob))
+        return {'strings.offsets': offsets, 'strings.blob': array('B', blob)}
+
+
+def _index_sections(name: str, groups: Dict[str, List[int]], strings: _StringTable) -> Dict[str, array]:
+    """Индекс ключ -> номера строк: отсортированные ключи, границы групп и номера подряд"""
+    keys = array('I')
+    offsets = array('I', [0])
+    items = array('I')
+    for key in sorted(groups):
+        keys.append(strings.intern(key))
+        items.extend(groups[key])
+        offsets.append(len(items))
+    return {f'index.{name}.keys': keys, f'index.{name}.offsets': offsets, f'index.{name}.items': items}
+
+
+def write_snapshot(store: InMemoryAirtravelStore, path: str) -> Dict:
+    """
+    Запись загруженного InMemoryAirtravelStore в файл снимка.
+    Файл сначала пишется рядом и затем заменяется атомарно, поэтому процессы,
+    уже открывшие старый снимок, продолжают работать со своей копией.
+    Возвращает заголовок записанного файла
+    """
+    strings = _StringTable()
+    sections: Dict[str, array] = {}
+
+    tables = (('airports', AIRPORT_COLUMNS, store.airports),
+              ('airlines', AIRLINE_COLUMNS, store.airlines),
+              ('routes', ROUTE_COLUMNS, store.routes))
+    for table, columns, rows in tables:
+        for position, column in enumerate(columns):
+            if column in FLOAT_COLUMNS:
+                values = (row[position] for row in rows)
+                sections[f'{table}.{column}'] = array(
+                    'd', (math.nan if value is None else value for value in values))
+            else:
+                sections[f'{table}.{column}'] = array('I', (strings.intern(row[position]) for row in rows))
+
+    indexes = {
+        'airports_by_city': {_city_key_text(key): group for key, group in store._airports_by_city.items()},
+        'airports_by_iata': store._airports_by_iata,
+        'routes_by_src': store._routes_by_src,
+        'routes_by_dst': store._routes_by_dst,
+    }
+    for name, groups in indexes.items():
+        sections.update(_index_sections(name, groups, strings))
+
+    # Таблица строк - последней: в нее попадают и ключи индексов
+    sections.update(strings.sections())
+
+    header = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'counts': {'airports': len(store.airports), 'airlines': len(store.airlines),
+                   'routes': len(store.routes), 'strings': len(strings.strings)},
+        'sections': {},
+    }
+    offset = 0
+    for name, values in sections.items():
+        offset = _align(offset)
+        header['sections'][name] = [offset, values.typecode, len(values)]
+        offset += len(values) * values.itemsize
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(header_bytes))
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        for name, values in sections.items():
+            file.write(b'\x00' * (data_start + header['sections'][name][0] - file.tell()))
+            values.tofile(file)
+    os.replace(temp_path, path)
+    return header
+
+
+def export_snapshot(connection, path: str) -> Dict:
+    """Снимок текущего содержимого БД (все таблицы читаются в одной транзакции)"""
+    return write_snapshot(InMemoryAirtravelStore.from_connection(connection), path)
+
+
+# =====================================================================
+# Чтение снимка
+# =====================================================================
+
+class Snapshot:
+    """Отображенный в память файл снимка: заголовок, колонки и таблица строк"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._sections: Dict[str, memoryview] = {}
+        # Одни и те же города, страны и коды IATA раскодируются при поиске многократно
+        self.string = lru_cache(maxsize=STRING_CACHE_SIZE)(self._decode_string)
+
+        try:
+            magic, version, header_size = _PREAMBLE.unpack_from(self._mmap)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path}: не файл снимка airtravel версии {FORMAT_VERSION}")
+            self.header = json.loads(bytes(self._view[_PREAMBLE.size:_PREAMBLE.size + header_size]))
+            if self.header['byteorder'] != sys.byteorder:
+                raise ValueError(f"{path}: снимок записан с порядком байт {self.header['byteorder']}")
+            self._data_start = _align(_PREAMBLE.size + header_size)
+
+            self._string_offsets = self.section('strings.offsets')
+            self._string_blob = self.section('strings.blob')
+        except (struct.error, KeyError, ValueError):
+            self.close()
+            raise
+
+    def section(self, name: str) -> memoryview:
+        """Секция файла как типизированный memoryview (без копирования)"""
+        view = self._sections.get(name)
+        if view is None:
+            if name not in self.header['sections']:
+                raise ValueError(f"{self.path}: в снимке нет секции {name}")
+            offset, typecode, length = self.header['sections'][name]
+            start = self._data_start + offset
+            view = self._view[start:start + length * array(typecode).itemsize].cast(typecode)
+            self._sections[name] = view
+        return view
+
+    def count(self, table: str) -> int:
+        return self.header['counts'][table]
+
+    def _decode_string(self, string_id: int) -> Optional[str]:
+        if string_id == NONE_ID:
+            return None
+        return str(self._string_blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]],
+                   'utf-8')
+
+    def close(self):
+        """Освобождение отображения (после этого колонки снимка недоступны)"""
+        for view in self._sections.values():
+            view.release()
+        self._sections = {}
+        self.string.cache_clear()
+        self._view.release()
+        self._mmap.close()
+
+
+class _TableView(Sequence):
+    """Строки таблицы снимка в виде записей record (records.py), как InMemoryAirtravelStore.airports/airlines/routes"""
+
+    def __init__(self, snapshot: Snapshot, table: str, columns: Tuple[str, ...], record: type = tuple):
+        self._length = snapshot.count(table)
+        self._record = record
+        self._columns: List[Tuple[memoryview, Callable]] = []
+        for column in columns:
+            if column in FLOAT_COLUMNS:
+                self._columns.append((snapshot.section(f'{table}.{column}'), _float_value))
+            else:
+                self._columns.append((snapshot.section(f'{table}.{column}'), snapshot.string))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Tuple:
+        if not -self._length <= index < self._length:
+            raise IndexError("номер строки вне таблицы")
+        return self._record([decode(values[index]) for values, decode in self._columns])
+
+
+def _float_value(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+class _SortedIndex:
+    """Индекс снимка ключ -> номера строк; поиск ключа двоичным поиском по таблице строк"""
+
+    def __init__(self, snapshot: Snapshot, name: str, key_text: Callable = None):
+        self._snapshot = snapshot
+        self._keys = snapshot.section(f'index.{name}.keys')
+        self._offsets = snapshot.section(f'index.{name}.offsets')
+        self._items = snapshot.section(f'index.{name}.items')
+        self._key_text = key_text
+
+    def _position(self, key: str) -> int:
+        low, high = 0, len(self._keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self._snapshot.string(self._keys[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._keys) and self._snapshot.string(self._keys[low]) == key:
+            return low
+        return -1
+
+    def get(self, key, default=None) -> Optional[List[int]]:
+        if key is None:
+            return default
+        position = self._position(self._key_text(key) if self._key_text else key)
+        if position < 0:
+            return default
+        return self._items[self._offsets[position]:self._offsets[position + 1]].tolist()
+
+
+class _RoutePairIndex:
+    """Маршруты по паре (вылет, прилет): маршруты из аэропорта вылета с нужным аэропортом прилета"""
+
+    def __init__(self, snapshot: Snapshot, routes_by_src: _SortedIndex):
+        self._snapshot = snapshot
+        self._routes_by_src = routes_by_src
+        self._dst = snapshot.section('routes.dst_airport')
+
+    def get(self, key: Tuple[str, str], default=None) -> Optional[List[int]]:
+        src, dst = key
+        found = [index for index in self._routes_by_src.get(src, [])
+                 if self._snapshot.string(self._dst[index]) == dst]
+        return found or default
+
+
+class SnapshotStore(InMemoryAirtravelStore):
+    """
+    Хранилище только для чтения поверх отображенного файла снимка.
+    Таблицы и индексы не загружаются в память процесса: строки собираются из
+    колонок при обращении. Пространственный индекс и граф маршрутов строятся
+    при первом поиске по координатам и с пересадками
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        # Поля заполняются из снимка, поэтому InMemoryAirtravelStore.__init__ не вызывается
+        self.snapshot = snapshot
+        self.airports = _TableView(snapshot, 'airports', AIRPORT_COLUMNS, Airport)
+        self.airlines = _TableView(snapshot, 'airlines', AIRLINE_COLUMNS, Airline)
+        self.routes = _TableView(snapshot, 'routes', ROUTE_COLUMNS, ROUTE_RESULT)
+
+        self._airports_by_city = _SortedIndex(snapshot, 'airports_by_city', _city_key_text)
+        self._airports_by_iata = _SortedIndex(snapshot, 'airports_by_iata')
+        self._routes_by_src = _SortedIndex(snapshot, 'routes_by_src')
+        self._routes_by_dst = _SortedIndex(snapshot, 'routes_by_dst')
+        self._routes_by_pair = _RoutePairIndex(snapshot, self._routes_by_src)
+        self._locator: Optional[AirportLocator] = None
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_pages = OrderedDict()
+        self._flight_pages_lock = threading.Lock()
+
+        self.load_time = 0.0
+        self.is_loaded = True
+
+    @classmethod
+    def open(cls, path: str) -> 'SnapshotStore':
+        started = time.perf_counter()
+        store = cls(Snapshot(path))
+        store.load_time = time.perf_counter() - started
+        print(f"Снимок {path} от {store.snapshot.header['created']} открыт за {store.load_time * 1000:.1f} мс: "
+              f"{len(store.airports)} аэропортов, {len(store.airlines)} авиакомпаний, "
+              f"{len(store.routes)} маршрутов")
+        return store
+
+    @property
+    def locator(self) -> AirportLocator:
+        if self._locator is None:
+            self._locator = AirportLocator([self._airport_row(index) for index in range(len(self.airports))])
+        return self._locator
+
+    def _compute_route_lengths(self) -> np.ndarray:
+        # Код IATA в маршруте и у аэропорта - один и тот же номер в таблице строк,
+        # поэтому номера аэропортов маршрутов находятся без раскодирования строк
+        strings = self.snapshot.count('strings')
+        iata = np.asarray(self.snapshot.section('airports.iata')).astype(np.int64)
+        lengths = np.diff(np.asarray(self.snapshot.section('strings.offsets')))
+        known = np.flatnonzero(iata != NONE_ID)
+        known = known[lengths[iata[known]] > 0]
+
+        # Номер строки кода -> первый аэропорт с этим кодом (как AirportArrays.positions)
+        airport_by_string = np.full(strings + 1, -1, dtype=np.int64)
+        codes, first = np.unique(iata[known], return_index=True)
+        airport_by_string[codes] = known[first]
+
+        def positions(column: str) -> np.ndarray:
+            ids = np.asarray(self.snapshot.section(column)).astype(np.int64)
+            return airport_by_string[np.where(ids == NONE_ID, strings, ids)]
+
+        return self.locator.arrays.route_lengths_km(positions('routes.src_airport'),
+                                                    positions('routes.dst_airport'))
+
+    def load(self, connection):
+        raise TypeError("SnapshotStore только для чтения: новый снимок записывается export_snapshot")
+
+    def close(self):
+        self._locator = None
+        self._planner = None
+        self._route_lengths = None
+        self._city_index = None
+        self._flight_pages.clear()
+        self.is_loaded = False
+        self.snapshot.close()
+
+
+# =====================================================================
+# Командная строка
+# =====================================================================
+
+def print_info(header: Dict, path: str):
+    counts = header['counts']
+    print(f"Снимок {path} ({os.path.getsize(path) / 1024 / 1024:.1f} МБ), создан {header['created']}")
+    print(f"{counts['airports']} аэропортов, {counts['airlines']} авиакомпаний, "
+          f"{counts['routes']} маршрутов, {counts['strings']} различных строк")
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Снимок данных airtravel для работы без PostgreSQL")
+    parser.add_argument('command', choices=('export', 'info'))
+    parser.add_argument('path', nargs='?', default=snapshot_path(), help="файл снимка (по умолчанию SNAPSHOT_PATH)")
+    parser.add_argument('--from-dump', nargs='?', const='', metavar='DUMP',
+                        help="собрать снимок из дампа (по умолчанию airtravel_dump.sql), без PostgreSQL")
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        try:
+            snapshot = Snapshot(args.path)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось открыть снимок: {e}")
+            return 1
+        print_info(snapshot.header, args.path)
+        snapshot.close()
+        return 0
+
+    started = time.perf_counter()
+    try:
+        if args.from_dump is not None:
+            from benchmark import DUMP_PATH, store_from_dump
+            header = write_snapshot(store_from_dump(args.from_dump or DUMP_PATH), args.path)
+        else:
+            import psycopg2
+            from airtravel import airtravelDatabase
+
+            db = airtravelDatabase()
+            if not db.connect():
+                return 1
+            try:
+                header = export_snapshot(db.connection, args.path)
+            except psycopg2.Error as e:
+                print(f"Ошибка чтения данных из БД: {e}")
+                return 1
+            finally:
+                db.disconnect()
+    except OSError as e:
+        print(f"Ошибка записи снимка: {e}")
+        return 1
+
+    print_info(header, args.path)
+    print(f"Снимок записан за {time.perf_counter() - started:.2f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
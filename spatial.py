@@ -0,0 +1,216 @@
+import math
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from records import AIRPORT_DISTANCE_RESULT, AIRPORT_RESULT, Airport
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу между двумя точками (в километрах)"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def longitude_ranges(lon_min: float, lon_max: float) -> List[Tuple[float, float]]:
+    """
+    Диапазоны долготы для прямоугольника.
+    Если lon_min > lon_max, прямоугольник пересекает 180-й меридиан и делится на два
+    """
+    if lon_min <= lon_max:
+        return [(lon_min, lon_max)]
+    return [(lon_min, 180.0), (-180.0, lon_max)]
+
+
+class AirportArrays:
+    """
+    Таблица аэропортов в массивах NumPy.
+
+    Широта и долгота - массивы float64 (NaN, если координат нет), город,
+    страна и IATA - массивы целых кодов. Фильтр по прямоугольнику, расстояния
+    до точки и длины маршрутов считаются одной векторной операцией над всей
+    таблицей, без циклов Python по строкам. Методы возвращают номера строк
+    в исходной последовательности аэропортов.
+    """
+
+    def __init__(self, airports: Sequence[Dict]):
+        self.size = len(airports)
+        self.latitude = np.array([_coordinate(a.get('latitude')) for a in airports], dtype=np.float64)
+        self.longitude = np.array([_coordinate(a.get('longitude')) for a in airports], dtype=np.float64)
+        self.has_coordinates = ~(np.isnan(self.latitude) | np.isnan(self.longitude))
+        # Радианы и косинусы широт считаются один раз, а не в каждом запросе
+        self._phi = np.radians(self.latitude)
+        self._lambda = np.radians(self.longitude)
+        self._cos_phi = np.cos(self._phi)
+
+        self.city_codes, self._city_ids = _encode(
+            [((a.get('city') or '').lower(), (a.get('country') or '').lower()) for a in airports])
+        self.country_codes, self._country_ids = _encode([(a.get('country') or '').lower() for a in airports])
+        self.iata_codes, self._iata_ids = _encode([a.get('iata') or '' for a in airports])
+
+        # Номер строки по коду IATA (первый аэропорт с этим кодом)
+        self._iata_positions: Dict[str, int] = {}
+        for position, airport in enumerate(airports):
+            if airport.get('iata'):
+                self._iata_positions.setdefault(airport['iata'], position)
+
+        # Порядок выдачи прямоугольника: страна, город, id (как ORDER BY в SQL)
+        order = sorted(range(self.size), key=lambda i: (airports[i].get('country') or '',
+                                                        airports[i].get('city') or '',
+                                                        airports[i].get('id') or ''))
+        self._rank = np.empty(self.size, dtype=np.int64)
+        self._rank[order] = np.arange(self.size)
+
+    def box_mask(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """Маска аэропортов в прямоугольнике (границы включительно)"""
+        mask = (self.latitude >= lat_min) & (self.latitude <= lat_max)
+        lon_mask = np.zeros(self.size, dtype=bool)
+        for lon_lo, lon_hi in longitude_ranges(lon_min, lon_max):
+            lon_mask |= (self.longitude >= lon_lo) & (self.longitude <= lon_hi)
+        return mask & lon_mask
+
+    def query_box(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """
+        Номера аэропортов внутри прямоугольника в порядке страна, город, id.
+        lon_min > lon_max означает прямоугольник через 180-й меридиан
+        """
+        found = np.flatnonzero(self.box_mask(lat_min, lat_max, lon_min, lon_max))
+        return found[np.argsort(self._rank[found])]
+
+    def distances_km(self, lat: float, lon: float) -> np.ndarray:
+        """Расстояния от точки до всех аэропортов (NaN для аэропортов без координат)"""
+        return self._haversine(math.radians(lat), math.radians(lon), math.cos(math.radians(lat)),
+                               self._phi, self._lambda, self._cos_phi)
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Аэропорты не дальше radius_km от точки: (расстояния, номера) по возрастанию расстояния"""
+        distances = self.distances_km(lat, lon)
+        found = np.flatnonzero(distances <= radius_km)
+        return self._by_distance(distances, found)
+
+    def query_nearest(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k ближайших аэропортов: (расстояния, номера) по возрастанию расстояния"""
+        distances = self.distances_km(lat, lon)
+        found = np.flatnonzero(self.has_coordinates)
+        if k <= 0:
+            found = found[:0]
+        elif k < len(found):
+            # Отбор k ближайших за линейное время, сортируется только отобранное
+            nearest = np.argpartition(distances[found], k - 1)[:k]
+            found = found[nearest]
+        return self._by_distance(distances, found)
+
+    @staticmethod
+    def _by_distance(distances: np.ndarray, found: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # При равных расстояниях - в порядке номеров строк
+        found = found[np.lexsort((found, distances[found]))]
+        return distances[found], found
+
+    def city_mask(self, city: str, country: str) -> np.ndarray:
+        """Маска аэропортов города (без учета регистра)"""
+        code = self._city_ids.get(((city or '').lower(), (country or '').lower()), -1)
+        return self.city_codes == code
+
+    def country_mask(self, country: str) -> np.ndarray:
+        """Маска аэропортов страны (без учета регистра)"""
+        return self.country_codes == self._country_ids.get((country or '').lower(), -1)
+
+    def positions(self, iata_codes: Sequence[str]) -> np.ndarray:
+        """Номера аэропортов по кодам IATA (-1, если аэропорта с таким кодом нет)"""
+        get = self._iata_positions.get
+        return np.fromiter((get(code, -1) for code in iata_codes), dtype=np.int64, count=len(iata_codes))
+
+    def route_lengths_km(self, src_positions: np.ndarray, dst_positions: np.ndarray) -> np.ndarray:
+        """Длины маршрутов по большому кругу для пар номеров аэропортов (NaN, если аэропорт неизвестен)"""
+        known = (src_positions >= 0) & (dst_positions >= 0)
+        lengths = self._haversine(self._phi[src_positions], self._lambda[src_positions], self._cos_phi[src_positions],
+                                  self._phi[dst_positions], self._lambda[dst_positions], self._cos_phi[dst_positions])
+        lengths[~known] = np.nan
+        return lengths
+
+    @staticmethod
+    def _haversine(phi1, lambda1, cos_phi1, phi2, lambda2, cos_phi2) -> np.ndarray:
+        a = np.sin((phi2 - phi1) / 2) ** 2 + cos_phi1 * cos_phi2 * np.sin((lambda2 - lambda1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def _coordinate(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _encode(values: List) -> Tuple[np.ndarray, Dict]:
+    """Целые коды значений и словарь значение -> код"""
+    ids: Dict = {}
+    codes = np.fromiter((ids.setdefault(value, len(ids)) for value in values), dtype=np.int32, count=len(values))
+    return codes, ids
+
+
+class AirportLocator:
+    """
+    Пространственный поиск по списку аэропортов с полями id, city, country,
+    iata, icao, latitude, longitude (записи или словари). Аэропорты хранятся
+    записями AIRPORT_RESULT (records.py) и возвращаются без копирования; для
+    запросов по расстоянию - записи AIRPORT_DISTANCE_RESULT с distance_km
+    """
+
+    def __init__(self, airports: Sequence):
+        fields = AIRPORT_RESULT._fields
+        self.airports: List[Airport] = [
+            airport if type(airport) is AIRPORT_RESULT else AIRPORT_RESULT(tuple(airport[name] for name in fields))
+            for airport in airports
+        ]
+        self.arrays = AirportArrays(self.airports)
+
+    def _records(self, indexes: np.ndarray) -> List[Airport]:
+        airports = self.airports
+        return [airports[i] for i in indexes.tolist()]
+
+    def _with_distance(self, found: Tuple[np.ndarray, np.ndarray]) -> List[Airport]:
+        airports = self.airports
+        return [AIRPORT_DISTANCE_RESULT(airports[index] + (round(distance, 1),))
+                for distance, index in zip(*(values.tolist() for values in found))]
+
+    def airports_in_box(self, lat_min: float, lat_max: float,
+                        lon_min: float, lon_max: float) -> List[Airport]:
+        """Аэропорты в прямоугольнике, упорядоченные по стране и городу"""
+        return self._records(self.arrays.query_box(lat_min, lat_max, lon_min, lon_max))
+
+    def airports_within_radius(self, lat: float, lon: float, radius_km: float) -> List[Airport]:
+        """Аэропорты в радиусе radius_km от точки, по возрастанию расстояния"""
+        return self._with_distance(self.arrays.query_radius(lat, lon, radius_km))
+
+    def nearest_airports(self, lat: float, lon: float, k: int = 10) -> List[Airport]:
+        """k ближайших к точке аэропортов"""
+        return self._with_distance(self.arrays.query_nearest(lat, lon, k))
+
+    def route_lengths_km(self, routes: Sequence[Tuple[str, str, str]]) -> np.ndarray:
+        """Длины маршрутов (airline, src_airport, dst_airport) по большому кругу"""
+        return self.arrays.route_lengths_km(self.arrays.positions([route[1] for route in routes]),
+                                            self.arrays.positions([route[2] for route in routes]))
+
+
+def routes_by_distance(routes: Sequence[Tuple[str, str, str]], lengths: np.ndarray,
+                       min_km: float = 0.0, max_km: float = None, limit: int = 100) -> List[Dict]:
+    """
+    Маршруты с длиной от min_km до max_km, от самых длинных к коротким.
+    lengths - длины маршрутов routes (см. AirportLocator.route_lengths_km)
+    """
+    mask = lengths >= min_km
+    if max_km is not None:
+        mask &= lengths <= max_km
+    found = np.flatnonzero(mask)
+    found = found[np.argsort(-lengths[found], kind='stable')][:max(limit, 0)]
+
+    results = []
+    for index, length in zip(found.tolist(), lengths[found].tolist()):
+        airline, src_airport, dst_airport = routes[index]
+        results.append({'airline': airline, 'src_airport': src_airport, 'dst_airport': dst_airport,
+                        'distance_km': round(length, 1)})
+    return results
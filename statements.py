@@ -0,0 +1,260 @@
+"""
+Сеанс работы с PostgreSQL для airtravelDatabase: подготовленные запросы,
+режим autocommit/read-only и восстановление соединения.
+
+Каждый текст запроса подготавливается (PREPARE) один раз на соединение и
+дальше выполняется по имени (EXECUTE): сервер не разбирает SQL заново, а после
+нескольких выполнений переходит на общий план и не планирует запрос при каждом
+вызове. Соединение работает в режиме autocommit и только на чтение, поэтому
+ошибка запроса не оставляет сеанс в прерванной транзакции. При потере
+соединения (перезапуск сервера, разрыв сети) запрос повторяется один раз на
+новом соединении, подготовленные запросы создаются на нем заново.
+
+Запись (миграции, пересчет city_routes, загрузка данных) выполняется внутри
+transaction(readonly=False): на это время соединение переходит в обычный
+транзакционный режим.
+
+PooledStatementSession - то же для нескольких потоков (окна app.py): запросы
+идут по соединениям пула db_pool.ConnectionPool, каждое соединение помнит
+свои подготовленные запросы.
+"""
+import itertools
+import re
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+
+from db_pool import ConnectionPool
+from instrumentation import InstrumentedConnection, query_wrapper
+
+# Префикс имен подготовленных запросов
+STATEMENT_PREFIX = "airtravel_"
+
+# Ошибки, после которых соединение считается потерянным (проверяется и connection.closed)
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+_PLACEHOLDER_RE = re.compile(r"%s")
+
+
+def numbered(query: str) -> Tuple[str, int]:
+    """Запрос с параметрами %s -> текст с $1, $2, ... для PREPARE и число параметров"""
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        count += 1
+        return f"${count}"
+
+    return _PLACEHOLDER_RE.sub(replace, query), count
+
+
+# Номера имен подготовленных запросов (общие для всех сеансов и соединений)
+_statement_numbers = itertools.count(1)
+
+
+@query_wrapper
+def _statement_name(cursor, prepared: Dict[str, str], query: str) -> str:
+    """Имя подготовленного запроса на соединении курсора; при первом вызове - PREPARE"""
+    name = prepared.get(query)
+    if name is None:
+        name = f"{STATEMENT_PREFIX}{next(_statement_numbers)}"
+        statement, _ = numbered(query)
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        prepared[query] = name
+    return name
+
+
+@query_wrapper
+def execute_prepared(connection: psycopg2.extensions.connection, prepared: Dict[str, str], query: str,
+                     params: Tuple, cursor_factory) -> List:
+    """EXECUTE имя (параметры) на соединении; prepared - подготовленные на нем запросы"""
+    with connection.cursor(cursor_factory=cursor_factory) as cursor:
+        name = _statement_name(cursor, prepared, query)
+        placeholders = ', '.join(['%s'] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+        return cursor.fetchall()
+
+
+def deallocate(connection: psycopg2.extensions.connection, prepared: Dict[str, str], query: str):
+    name = prepared.pop(query, None)
+    if name is not None and not connection.closed:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DEALLOCATE {name}")
+
+
+class StatementSession:
+    """Соединение с подготовленными запросами и повторным подключением при разрыве"""
+
+    def __init__(self, db_params: Dict[str, str]):
+        self.db_params = db_params
+        self.connection: Optional[psycopg2.extensions.connection] = None
+        # Текст запроса -> имя подготовленного запроса на текущем соединении
+        self._prepared: Dict[str, str] = {}
+        self._in_transaction = False
+        self.reconnects = 0
+
+    def connect(self) -> psycopg2.extensions.connection:
+        # Каждый запрос замеряется (см. instrumentation.METRICS)
+        connection = psycopg2.connect(**self.db_params, connection_factory=InstrumentedConnection)
+        connection.set_session(readonly=True, autocommit=True)
+        self.connection = connection
+        self._prepared = {}
+        self._in_transaction = False
+        return connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def is_open(self) -> bool:
+        return self.connection is not None
+
+    def is_lost(self) -> bool:
+        """Соединение было открыто, но закрылось (сервер перезапущен или сеть разорвана)"""
+        return self.connection is not None and self.connection.closed != 0
+
+    def reconnect(self) -> psycopg2.extensions.connection:
+        print("Соединение с PostgreSQL потеряно, повторное подключение")
+        self.close()
+        self.reconnects += 1
+        return self.connect()
+
+    def ensure_connected(self) -> psycopg2.extensions.connection:
+        """Текущее соединение; потерянное открывается заново (вне транзакции)"""
+        if self.is_lost() and not self._in_transaction:
+            self.reconnect()
+        return self.connection
+
+    @query_wrapper
+    def fetch(self, query: str, params: Tuple = (), cursor_factory=psycopg2.extras.DictCursor) -> List:
+        """
+        Выполнение запроса с параметрами %s как подготовленного: EXECUTE имя (параметры).
+        При потере соединения запрос повторяется один раз на новом соединении
+        """
+        for attempt in range(2):
+            connection = self.ensure_connected()
+            try:
+                return execute_prepared(connection, self._prepared, query, params, cursor_factory)
+            except psycopg2.errors.FeatureNotSupported:
+                # "cached plan must not change result type": таблица изменилась после
+                # PREPARE (миграция). Запрос подготавливается заново
+                if attempt or self._in_transaction:
+                    raise
+                deallocate(connection, self._prepared, query)
+            except CONNECTION_ERRORS:
+                if attempt or self._in_transaction or not self.is_lost():
+                    raise
+
+    @contextmanager
+    def transaction(self, readonly: bool = True) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Обычный транзакционный режим на время блока: для серверных курсоров
+        (readonly=True) и записи (readonly=False). Незафиксированные изменения
+        откатываются, затем соединение возвращается в autocommit/read-only
+        """
+        connection = self.ensure_connected()
+        if self._in_transaction:
+            yield connection
+            return
+
+        connection.set_session(readonly=readonly, autocommit=False)
+        self._in_transaction = True
+        try:
+            yield connection
+        finally:
+            self._in_transaction = False
+            if not connection.closed:
+                connection.rollback()
+                connection.set_session(readonly=True, autocommit=True)
+
+
+class PooledStatementSession:
+    """
+    Сеанс с подготовленными запросами для нескольких потоков: каждый запрос
+    берет соединение пула на время выполнения, блок transaction() - на время
+    блока. Методы как у StatementSession; потерянное соединение пул заменяет
+    новым, запрос при этом повторяется один раз
+    """
+
+    def __init__(self, db_params: Dict[str, str], maxconn: int = 5):
+        self.db_params = db_params
+        self.maxconn = maxconn
+        self.pool: Optional[ConnectionPool] = None
+        # Соединение пула -> его подготовленные запросы (текст запроса -> имя)
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Соединение блока transaction() текущего потока
+        self._local = threading.local()
+
+    def connect(self) -> ConnectionPool:
+        # Пул сразу открывает одно соединение: недоступная БД видна при подключении
+        self.pool = ConnectionPool(self.db_params, minconn=1, maxconn=self.maxconn)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+
+    def is_open(self) -> bool:
+        return self.pool is not None
+
+    def _getconn(self) -> Tuple[psycopg2.extensions.connection, Dict[str, str]]:
+        """Соединение пула и его подготовленные запросы; новое соединение переводится в autocommit/read-only"""
+        connection = self.pool.getconn()
+        with self._lock:
+            prepared = self._prepared.get(connection)
+            if prepared is None:
+                connection.set_session(readonly=True, autocommit=True)
+                prepared = self._prepared[connection] = {}
+        return connection, prepared
+
+    @query_wrapper
+    def fetch(self, query: str, params: Tuple = (), cursor_factory=psycopg2.extras.DictCursor) -> List:
+        """Выполнение запроса как подготовленного на свободном соединении пула"""
+        current = getattr(self._local, 'connection', None)
+        if current is not None:
+            return execute_prepared(current, self._prepared[current], query, params, cursor_factory)
+
+        for attempt in range(2):
+            connection, prepared = self._getconn()
+            try:
+                return execute_prepared(connection, prepared, query, params, cursor_factory)
+            except psycopg2.errors.FeatureNotSupported:
+                if attempt:
+                    raise
+                deallocate(connection, prepared, query)
+            except CONNECTION_ERRORS:
+                if attempt or not connection.closed:
+                    raise
+            finally:
+                self.pool.putconn(connection, close=connection.closed != 0)
+
+    @contextmanager
+    def transaction(self, readonly: bool = True) -> Iterator[psycopg2.extensions.connection]:
+        """Соединение пула в обычном транзакционном режиме на время блока (как у StatementSession)"""
+        current = getattr(self._local, 'connection', None)
+        if current is not None:
+            yield current
+            return
+
+        connection, _ = self._getconn()
+        connection.set_session(readonly=readonly, autocommit=False)
+        self._local.connection = connection
+        broken = False
+        try:
+            yield connection
+        finally:
+            self._local.connection = None
+            try:
+                if not connection.closed:
+                    connection.rollback()
+                    connection.set_session(readonly=True, autocommit=True)
+            except psycopg2.Error:
+                broken = True
+            self.pool.putconn(connection, close=broken or connection.closed != 0)
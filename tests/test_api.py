@@ -0,0 +1,217 @@
+import asyncio
+import base64
+import json
+
+import asyncpg
+import pytest
+
+from api import AirtravelApi, ApiError, accepts_gzip, decode_page_key, encode_page_key
+
+
+def token(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+# ----------------------------------------------------------------------
+# Разбор параметров и заголовков
+
+def test_page_key_round_trip():
+    key = ('SU', 'SVO', 'LED', '4029', '2948')
+    assert decode_page_key(encode_page_key(key)) == key
+    assert encode_page_key(None) is None
+
+
+@pytest.mark.parametrize("value", [
+    "not base64 json!",
+    token({'airline': 'SU'}),
+    token(['SU', 'SVO', 'LED', '4029']),
+    token(['SU', 'SVO', 'LED', '4029', '2948', 'extra']),
+    token(['SU', 'SVO', 'LED', 4029, 2948]),
+    token(['SU', 'SVO', 'LED', None, '2948']),
+])
+def test_malformed_page_key_is_rejected(value):
+    with pytest.raises(ApiError) as error:
+        decode_page_key(value)
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", True),
+    ("deflate;q=1.0, GZIP;q=0.5", True),
+    ("*", True),
+    ("gzip;q=0", False),
+    ("gzip;q=0.0", False),
+    ("deflate, br", False),
+    ("", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_parse_request():
+    request = AirtravelApi.parse_request(
+        b"get /flights/?city=%D0%9F%D0%B5%D1%80%D0%BC%D1%8C&type=arrival HTTP/1.1\r\n"
+        b"Host: localhost\r\nAccept-Encoding:  gzip \r\n\r\n")
+    assert request.method == 'GET'
+    assert request.path == '/flights'
+    assert request.target == '/flights/?city=%D0%9F%D0%B5%D1%80%D0%BC%D1%8C&type=arrival'
+    assert request.params == {'city': 'Пермь', 'type': 'arrival'}
+    assert request.headers['accept-encoding'] == 'gzip'
+    assert 'connection' not in request.headers
+
+
+def test_parse_request_http10_closes_connection_by_default():
+    assert AirtravelApi.parse_request(b"GET / HTTP/1.0\r\n\r\n").headers['connection'] == 'close'
+    keep_alive = AirtravelApi.parse_request(b"GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n")
+    assert keep_alive.headers['connection'] == 'keep-alive'
+
+
+@pytest.mark.parametrize("head, status", [
+    (b"GET /\r\n\r\n", 400),
+    (b"GET / HTTP/2.0\r\n\r\n", 505),
+])
+def test_parse_request_errors(head, status):
+    with pytest.raises(ApiError) as error:
+        AirtravelApi.parse_request(head)
+    assert error.value.status == status
+
+
+# ----------------------------------------------------------------------
+# Кэш ответов и ошибки БД
+
+class FakePool:
+    def __init__(self):
+        self.version = 1
+
+    async def fetch(self, query):
+        return [{'table_name': 'routes', 'version': self.version}]
+
+
+class FakeDatabase:
+    """Источник поиска для AirtravelApi без БД: считает вызовы и умеет падать"""
+
+    def __init__(self):
+        self.pool = FakePool()
+        self.calls = []
+        self.error = None
+        self.invalidated = 0
+
+    def invalidate_cache(self):
+        self.invalidated += 1
+
+    async def find_airport_by_city_country(self, city, country):
+        self.calls.append((city, country))
+        if self.error is not None:
+            raise self.error
+        return [{'id': '1', 'city': city, 'country': country}]
+
+    async def get_flights_by_city_page(self, city, country, flight_type, limit, after):
+        self.calls.append((city, country, flight_type, limit, after))
+        return [{'airline': 'SU'}], ('SU', 'SVO', 'LED', '1', '2')
+
+
+def make_api(**options):
+    api = AirtravelApi(FakeDatabase(), max_age=60, version_ttl=0, cache_size=16, **options)
+    return api, api.db
+
+
+def get(api, target, **headers):
+    head = f"GET {target} HTTP/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return asyncio.run(api.respond(AirtravelApi.parse_request((head + "\r\n").encode())))
+
+
+CITY = '/airports/city?city=Perm&country=Russia'
+
+
+def test_api_turns_on_database_errors():
+    api, db = make_api()
+    assert db.raise_errors is True
+
+
+def test_repeated_request_is_served_from_response_cache():
+    api, db = make_api()
+    status, headers, body = get(api, CITY)
+    assert status == 200
+    assert json.loads(body) == {'count': 1, 'results': [{'id': '1', 'city': 'Perm', 'country': 'Russia'}]}
+    assert get(api, CITY) == (status, headers, body)
+    assert len(db.calls) == 1 and api.cache_hits == 1
+
+    etag = dict(headers)['ETag']
+    assert get(api, CITY, **{'If-None-Match': etag})[0] == 304
+
+
+def test_data_version_change_drops_cached_responses():
+    api, db = make_api()
+    etag = dict(get(api, CITY)[1])['ETag']
+    db.pool.version = 2
+    status, headers, _ = get(api, CITY)
+    assert status == 200 and dict(headers)['ETag'] != etag
+    assert len(db.calls) == 2 and db.invalidated == 1
+
+
+def test_database_error_is_not_cached():
+    api, db = make_api()
+    db.error = asyncpg.InterfaceError("connection lost")
+    with pytest.raises(asyncpg.InterfaceError):
+        get(api, CITY)
+    assert not api._responses
+
+    db.error = None
+    assert get(api, CITY)[0] == 200
+    assert len(db.calls) == 2
+
+
+def test_flights_page_token_is_validated_before_query():
+    api, db = make_api()
+    body = json.loads(get(api, '/flights?city=Perm&country=Russia&limit=1')[2])
+    assert decode_page_key(body['next']) == ('SU', 'SVO', 'LED', '1', '2')
+
+    get(api, f"/flights?city=Perm&country=Russia&limit=1&after={body['next']}")
+    assert db.calls[-1][-1] == ('SU', 'SVO', 'LED', '1', '2')
+
+    calls = len(db.calls)
+    with pytest.raises(ApiError) as error:
+        get(api, f"/flights?city=Perm&country=Russia&after={token(['SU', 1])}")
+    assert error.value.status == 400 and len(db.calls) == calls
+
+
+# ----------------------------------------------------------------------
+# Ответы соединения: 400 на неверный запрос, 503 на ошибку БД
+
+async def exchange(api, raw: bytes) -> bytes:
+    server = await asyncio.start_server(api.handle_connection, '127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(raw)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def status_line(response: bytes) -> str:
+    return response.split(b'\r\n', 1)[0].decode()
+
+
+def test_bad_page_key_gets_400_response():
+    api, _ = make_api()
+    raw = f"GET /flights?city=Perm&country=Russia&after={token(['SU', 'SVO', 'LED', '1'])} HTTP/1.1\r\n" \
+          f"Connection: close\r\n\r\n".encode()
+    assert status_line(asyncio.run(exchange(api, raw))) == 'HTTP/1.1 400 Bad Request'
+
+
+def test_database_error_gets_503_without_caching_headers():
+    api, db = make_api()
+    db.error = asyncpg.InterfaceError("connection lost")
+    response = asyncio.run(exchange(api, f"GET {CITY} HTTP/1.1\r\nConnection: close\r\n\r\n".encode()))
+    assert status_line(response) == 'HTTP/1.1 503 Service Unavailable'
+    assert b'Cache-Control: no-store' in response
+
+
+def test_bad_content_length_closes_connection():
+    api, _ = make_api()
+    response = asyncio.run(exchange(api, f"GET {CITY} HTTP/1.1\r\nContent-Length: x\r\n\r\n".encode()))
+    assert response == b''
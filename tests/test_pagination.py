@@ -0,0 +1,85 @@
+import memory_store
+from memory_store import InMemoryAirtravelStore
+from pagination import FLIGHT_PAGE_KEY, page_key, paginate
+
+# Москва - два аэропорта (рейс между ними - внутренний), у Берлина один
+AIRPORTS = [
+    ['1', 'Sheremetyevo', 'Moscow', 'Russia', 'SVO', 'UUEE', '55.97', '37.41'],
+    ['2', 'Vnukovo', 'Moscow', 'Russia', 'VKO', 'UUWW', '55.59', '37.26'],
+    ['3', 'Pulkovo', 'Saint Petersburg', 'Russia', 'LED', 'ULLI', '59.80', '30.26'],
+    ['4', 'Brandenburg', 'Berlin', 'Germany', 'BER', 'EDDB', '52.36', '13.50'],
+]
+ROUTES = [
+    ['SU', 'SVO', 'LED'], ['SU', 'LED', 'SVO'], ['FV', 'VKO', 'LED'], ['UT', 'VKO', 'SVO'],
+    ['SU', 'SVO', 'BER'], ['LH', 'BER', 'SVO'], ['AB', 'BER', 'VKO'], ['S7', 'LED', 'VKO'],
+    ['ZZ', 'SVO', 'XXX'],
+]
+
+
+def make_store():
+    store = InMemoryAirtravelStore()
+    store.build(AIRPORTS, [], ROUTES)
+    return store
+
+
+def walk(store, flight_type, limit):
+    rows, after, pages = [], None, 0
+    while True:
+        page, after = store.get_flights_by_city_page('moscow', 'RUSSIA', flight_type, limit, after)
+        assert len(page) <= limit
+        rows += page
+        pages += 1
+        if after is None:
+            return rows, pages
+        assert after == page_key(page[-1])
+
+
+def test_paginate_splits_off_the_extra_row():
+    rows = [{'airline': str(n), 'src_airport': 'A', 'dst_airport': 'B', 'src_id': '1', 'dst_id': '2'}
+            for n in range(4)]
+    assert paginate(rows[:3], 3) == (rows[:3], None)
+    assert paginate(rows, 3) == (rows[:3], ('2', 'A', 'B', '1', '2'))
+
+
+def test_pages_cover_every_flight_once_in_key_order():
+    store = make_store()
+    for flight_type, count in (('departure', 4), ('arrival', 5), ('both', 8)):
+        expected = sorted(tuple(row) for row in store.get_flights_by_city('Moscow', 'Russia', flight_type))
+        assert len(expected) == count
+        for limit in (1, 2, 3, 100):
+            rows, pages = walk(store, flight_type, limit)
+            assert [page_key(row) for row in rows] == sorted(page_key(row) for row in rows)
+            assert sorted(tuple(row)[:7] for row in rows) == expected
+            assert pages == max(1, -(-count // limit))
+
+
+def test_internal_flight_counted_once():
+    rows, _ = walk(make_store(), 'both', 100)
+    internal = [row for row in rows if row.src_city == row.dst_city == 'Moscow']
+    assert [(row.airline, row.src_airport, row.dst_airport) for row in internal] == [('UT', 'VKO', 'SVO')]
+
+
+def test_page_rows_carry_airport_ids_for_the_key():
+    rows, _ = make_store().get_flights_by_city_page('Moscow', 'Russia', 'arrival', limit=1)
+    assert rows[0]._fields[-2:] == FLIGHT_PAGE_KEY[-2:]
+    assert page_key(rows[0]) == ('AB', 'BER', 'VKO', '4', '2')
+
+
+def test_after_key_between_rows_and_past_the_end():
+    store = make_store()
+    rows, after = store.get_flights_by_city_page('Moscow', 'Russia', 'departure', 10, after=('SU', 'A', '', '', ''))
+    assert [row.airline for row in rows] == ['SU', 'SU', 'UT']
+    assert after is None
+    assert store.get_flights_by_city_page('Moscow', 'Russia', 'departure', 10, after=('ZZZ',) * 5) == ([], None)
+    assert store.get_flights_by_city_page('Nowhere', 'Russia', 'both') == ([], None)
+
+
+def test_unknown_flight_type_pages_like_both_and_index_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(memory_store, 'FLIGHT_PAGES_CACHE_SIZE', 2)
+    store = make_store()
+    assert walk(store, 'BOTH', 3)[0] == walk(store, 'anything', 3)[0] == walk(store, 'both', 3)[0]
+    assert len(store._flight_pages) == 1
+
+    for city, country in (('Berlin', 'Germany'), ('Saint Petersburg', 'Russia'), ('Moscow', 'Russia')):
+        store.get_flights_by_city_page(city, country, 'departure')
+    assert len(store._flight_pages) == 2
@@ -0,0 +1,80 @@
+import pytest
+
+import query_cache
+from query_cache import QueryCache, cached, make_key
+
+
+class Clock:
+    """Подменяет time.monotonic в query_cache: время двигается вручную"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_key_ignores_case_sequence_type_and_kwargs_order():
+    assert make_key('q', ('Moscow', ['SVO', 'VKO']), {'type': 'Arrival', 'limit': 10}) == \
+        make_key('q', ('MOSCOW', ('svo', 'vko')), {'limit': 10.0, 'type': 'arrival'})
+    assert make_key('q', (55.5,), {}) != make_key('q', (55,), {})
+    assert make_key('q', ('a',), {}) != make_key('other', ('a',), {})
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = QueryCache(maxsize=4, ttl=10)
+    cache.set('key', [1])
+    clock.now += 10
+    assert cache.get('key') == [1]
+    clock.now += 0.5
+    assert cache.get('key', 'missing') == 'missing'
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1 and cache.stats()['hits'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+    disabled = QueryCache(maxsize=0)
+    disabled.set('a', 1)
+    assert len(disabled) == 0
+
+
+def test_invalidate_one_query_keeps_the_others():
+    cache = QueryCache()
+    cache.set(make_key('flights', ('Perm',), {}), [1])
+    cache.set(make_key('airports', ('Perm',), {}), [2])
+    cache.invalidate('flights')
+    assert cache.get(make_key('flights', ('Perm',), {})) is None
+    assert cache.get(make_key('airports', ('Perm',), {})) == [2]
+
+
+def test_cached_function_returns_copies_and_skips_empty_results():
+    calls = []
+
+    @cached(QueryCache())
+    def search(city, country=None):
+        calls.append(city)
+        return [city] if city != 'Nowhere' else []
+
+    first = search('Perm', country='Russia')
+    first.append('changed')
+    assert search('PERM', country='russia') == ['Perm']
+    assert calls == ['Perm']
+
+    search('Nowhere')
+    search('Nowhere')
+    assert calls == ['Perm', 'Nowhere', 'Nowhere']
@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+
+import repository
+from repository import AirtravelRepository
+
+
+class FakeSession:
+    @contextmanager
+    def transaction(self):
+        yield None
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.session = FakeSession()
+        self.versions = {'routes': 1}
+        self.invalidated = 0
+
+    def invalidate_cache(self):
+        self.invalidated += 1
+
+
+def test_refresh_drops_database_caches_when_table_versions_change(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(repository, 'table_versions', lambda connection: dict(db.versions))
+    monkeypatch.setattr(repository, 'DATA_VERSION_TTL', 0)
+    source = AirtravelRepository('postgres', db, db)
+
+    assert source.refresh() is False
+    db.versions['routes'] = 2
+    assert source.refresh() is True
+    assert source.refresh() is False
+    assert db.invalidated == 1
+
+
+def test_refresh_checks_versions_at_most_once_per_ttl(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(repository, 'table_versions', lambda connection: dict(db.versions))
+    source = AirtravelRepository('postgres', db, db)
+
+    db.versions['routes'] = 2
+    assert source.refresh() is False
+    monkeypatch.setattr(repository, 'DATA_VERSION_TTL', 0)
+    assert source.refresh() is True
@@ -0,0 +1,83 @@
+"""
+Маршруты с пересадками на сети из семи аэропортов у экватора: расстояния
+считаются в уме (градус долготы ~111 км), порядок маршрутов известен заранее
+"""
+import pytest
+
+from route_planner import RANK_BY_DISTANCE, RANK_BY_HOPS, RoutePlanner, _key
+
+#   W1 ---------------- E1 -- E2      прямой рейс, 10°
+#   W2 -- H1 ---------- E1            через Hub, ~9°
+#         H1 -- H3 ---- E1            через Hub и Mid, чуть длиннее (H3 севернее)
+#   W1 ------------ H2 (20°) -- E1    через Far, 30°
+AIRPORTS = [
+    ("W1", "West", "Land", 0.0, 0.0), ("W2", "West", "Land", 0.5, 1.0),
+    ("E1", "East", "Land", 0.0, 10.0), ("E2", "East", "Land", 0.0, 11.0),
+    ("H1", "Hub", "Land", 0.0, 5.0), ("H2", "Far", "Land", 0.0, 20.0), ("H3", "Mid", "Land", 1.0, 6.0),
+    ("NC", "Nowhere", "Land", None, None),
+]
+ROUTES = [
+    ("SU", "W1", "E1"), ("AF", "W1", "E1"), ("LH", "W2", "H1"), ("LH", "H1", "E1"),
+    ("SU", "W1", "H2"), ("SU", "H2", "E1"), ("AF", "H1", "H3"), ("AF", "H3", "E1"),
+    ("UT", "W1", "W2"), ("UT", "E1", "E2"),
+    # Петля, неизвестный аэропорт и аэропорт без координат в граф не входят
+    ("SU", "E1", "E1"), ("SU", "W1", "XXX"), ("SU", "W1", "NC"),
+]
+
+DIRECT = (["W1", "E1"], 1112.0)
+VIA_HUB = (["W2", "H1", "E1"], 1004.2)
+VIA_FAR = (["W1", "H2", "E1"], 3335.9)
+VIA_HUB_MID = (["W2", "H1", "H3", "E1"], 1063.9)
+VIA_WEST_HUB = (["W1", "W2", "H1", "E1"], 1128.5)
+
+
+@pytest.fixture(scope="module")
+def planner():
+    return RoutePlanner(AIRPORTS, ROUTES)
+
+
+def itineraries(planner, max_stops, rank_by, limit=10):
+    return [(route['airports'], route['distance_km'])
+            for route in planner.find_itineraries("West", "Land", "East", "Land", max_stops, rank_by, limit)]
+
+
+@pytest.mark.parametrize("max_stops, rank_by, expected", [
+    (0, RANK_BY_HOPS, [DIRECT]),
+    (1, RANK_BY_HOPS, [DIRECT, VIA_HUB, VIA_FAR]),
+    (2, RANK_BY_HOPS, [DIRECT, VIA_HUB, VIA_FAR, VIA_HUB_MID, VIA_WEST_HUB]),
+    (1, RANK_BY_DISTANCE, [VIA_HUB, DIRECT, VIA_FAR]),
+    (2, RANK_BY_DISTANCE, [VIA_HUB, VIA_HUB_MID, DIRECT, VIA_WEST_HUB, VIA_FAR]),
+])
+def test_itineraries_in_rank_order(planner, max_stops, rank_by, expected):
+    assert itineraries(planner, max_stops, rank_by) == expected
+
+
+def test_limit_keeps_the_best_routes(planner):
+    assert itineraries(planner, 2, RANK_BY_DISTANCE, limit=2) == [VIA_HUB, VIA_HUB_MID]
+
+
+def test_route_stops_at_first_destination_airport(planner):
+    # E2 достижим только через E1, который уже в городе назначения
+    assert all(path[-1] == "E1" for path, _ in itineraries(planner, 2, RANK_BY_HOPS))
+
+
+def test_legs_carry_airlines_and_cities(planner):
+    direct, via_hub = planner.find_itineraries("West", "Land", "East", "Land", 1, limit=2)
+    assert direct['stops'] == 0
+    assert [leg['airlines'] for leg in direct['legs']] == [["AF", "SU"]]
+
+    assert via_hub['stops'] == 1
+    assert [(leg['src_airport'], leg['dst_airport'], leg['airlines']) for leg in via_hub['legs']] == \
+        [("W2", "H1", ["LH"]), ("H1", "E1", ["LH"])]
+    assert via_hub['legs'][0]['dst_city'] == "Hub"
+    assert sum(leg['distance_km'] for leg in via_hub['legs']) == pytest.approx(via_hub['distance_km'], abs=0.1)
+
+
+def test_unknown_city_and_case_insensitive_lookup(planner):
+    assert planner.find_itineraries("Atlantis", "Land", "East", "Land") == []
+    assert planner.find_itineraries("West", "Land", "Nowhere", "Land") == []
+    assert planner.find_itineraries("west", "LAND", "East", "Land", limit=0) == []
+    assert itineraries(planner, 0, RANK_BY_HOPS) == [DIRECT]
+    assert planner.city_airports[_key("WEST", "land")] == ["W1", "W2"]
+    # W1 -> E1 у двух авиакомпаний - одно ребро
+    assert planner.edge_count == 9
@@ -0,0 +1,81 @@
+"""
+Поиск аэропортов по координатам на десятке реальных аэропортов Тихого
+океана и Северной Атлантики: прямоугольники через 180-й меридиан и
+ближайшие аэропорты с заранее известными ответами
+"""
+import pytest
+
+from records import AIRPORT_DISTANCE_RESULT, AIRPORT_RESULT
+from spatial import AirportLocator, haversine_km, longitude_ranges
+
+AIRPORTS = [AIRPORT_RESULT(row) for row in [
+    ('1', 'Nadi', 'Fiji', 'NAN', 'NFFN', -17.75, 177.44),
+    ('2', 'Apia', 'Samoa', 'APW', 'NSFA', -13.83, -171.77),
+    ('3', "Nuku'alofa", 'Tonga', 'TBU', 'NFTF', -21.24, -175.15),
+    ('4', 'Auckland', 'New Zealand', 'AKL', 'NZAA', -37.0, 174.79),
+    ('5', 'Honolulu', 'United States', 'HNL', 'PHNL', 21.32, -157.92),
+    ('6', 'London', 'United Kingdom', 'LHR', 'EGLL', 51.47, -0.45),
+    ('7', 'Reykjavik', 'Iceland', 'KEF', 'BIKF', 63.98, -22.61),
+    # Одна и та же точка на меридиане с двух сторон и аэропорт без координат
+    ('8', 'Date Line', 'Kiribati', 'E18', None, 0.0, 180.0),
+    ('9', 'Date Line', 'Kiribati', 'W18', None, 0.0, -180.0),
+    ('10', 'Unknown', 'Nowhere', 'NUL', None, None, None),
+]]
+
+
+@pytest.fixture(scope="module")
+def locator():
+    return AirportLocator(AIRPORTS)
+
+
+def ids(airports):
+    return [airport.id for airport in airports]
+
+
+def test_longitude_ranges():
+    assert longitude_ranges(-10, 20) == [(-10, 20)]
+    assert longitude_ranges(170, -170) == [(170, 180.0), (-180.0, -170)]
+
+
+@pytest.mark.parametrize("box, expected", [
+    # Весь мир: без аэропорта без координат, по стране и городу
+    ((-90, 90, -180, 180), ['1', '7', '8', '9', '4', '2', '3', '6', '5']),
+    # Через 180-й меридиан: Фиджи с запада, Самоа и Тонга с востока, Окленд южнее
+    ((-30, 0, 170, -170), ['1', '8', '9', '2', '3']),
+    ((-90, 90, 180, -180), ['8', '9']),
+    ((40, 70, -30, 10), ['7', '6']),
+    ((50, 40, 0, 10), []),
+])
+def test_airports_in_box(locator, box, expected):
+    found = locator.airports_in_box(*box)
+    assert ids(found) == expected
+    assert all(type(airport) is AIRPORT_RESULT for airport in found)
+
+
+def test_box_keeps_the_stored_records(locator):
+    found = locator.airports_in_box(-20, -15, 177, 178)
+    assert found == [AIRPORTS[0]] and found[0] is AIRPORTS[0]
+
+
+def test_dict_rows_are_converted_to_records():
+    locator = AirportLocator([airport._asdict() for airport in AIRPORTS])
+    assert locator.airports_in_box(40, 70, -30, 10) == [AIRPORTS[6], AIRPORTS[5]]
+
+
+def test_radius_and_nearest_across_the_antimeridian(locator):
+    # Точка между Фиджи и Тонга: ближайшие аэропорты по обе стороны меридиана
+    assert [(a.id, a.distance_km) for a in locator.airports_within_radius(-15, 179, 1000)] == \
+        [('1', 348.1), ('3', 929.0)]
+
+    nearest = locator.nearest_airports(-15, 179, 4)
+    assert [(a.id, a.distance_km) for a in nearest] == [('1', 348.1), ('3', 929.0), ('2', 1002.4), ('8', 1671.5)]
+    assert all(type(airport) is AIRPORT_DISTANCE_RESULT for airport in nearest)
+    assert nearest[0][:len(AIRPORT_RESULT._fields)] == tuple(AIRPORTS[0])
+
+
+def test_distances_agree_with_haversine(locator):
+    london, reykjavik = locator.nearest_airports(55, -10, 2)
+    assert (london.iata, reykjavik.iata) == ('LHR', 'KEF')
+    assert london.distance_km == round(haversine_km(55, -10, 51.47, -0.45), 1) == 746.1
+    # 15° по меридиану - около 1668 км
+    assert haversine_km(0, 0, 15, 0) == pytest.approx(1668, abs=1)
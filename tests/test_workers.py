@@ -0,0 +1,86 @@
+"""
+workers.py на двух сетях с очевидными ответами: цепочка из пяти аэропортов
+и кольцо длиннее SOURCES_PER_PASS, которое обходится несколькими блоками
+источников и в пуле процессов
+"""
+import pytest
+
+from workers import NetworkWorkers, RouteNetwork, SOURCES_PER_PASS
+
+#   A -> B -> C -> D,  C -> A;  E без рейсов
+CHAIN_AIRPORTS = [
+    ("AAA", "Alpha", "Land", 0.0, 0.0), ("BBB", "Beta", "Land", 0.0, 2.0), ("CCC", "Gamma", "Land", 0.0, 4.0),
+    ("DDD", "Delta", "Land", 0.0, 6.0), ("EEE", "Epsilon", "Land", 0.0, 8.0),
+]
+CHAIN_ROUTES = [
+    ("SU", "AAA", "BBB"), ("AF", "AAA", "BBB"), ("SU", "BBB", "CCC"), ("LH", "CCC", "DDD"), ("LH", "CCC", "AAA"),
+    # Петля и маршрут в неизвестный аэропорт ребрами не становятся
+    ("SU", "DDD", "DDD"), ("SU", "DDD", "XXX"),
+]
+
+# Кольцо R00 -> R01 -> ... -> R69 -> R00: из каждого аэропорта достижимы все остальные
+RING_SIZE = SOURCES_PER_PASS + 6
+RING_AIRPORTS = [(f"R{node:02d}", f"Ring{node}", "Land", 0.0, node * 0.5) for node in range(RING_SIZE)]
+RING_ROUTES = [("SU", f"R{node:02d}", f"R{(node + 1) % RING_SIZE:02d}") for node in range(RING_SIZE)]
+
+
+@pytest.fixture(scope="module")
+def chain():
+    return RouteNetwork(CHAIN_AIRPORTS, CHAIN_ROUTES)
+
+
+@pytest.fixture(scope="module")
+def ring():
+    return RouteNetwork(RING_AIRPORTS, RING_ROUTES)
+
+
+def test_duplicate_routes_and_loops_are_not_edges(chain):
+    assert chain.node_count == 5
+    assert chain.edge_count == 4
+
+
+@pytest.mark.parametrize("max_legs, expected", [
+    # (достижимо, сумма перелетов, наибольшее число перелетов) для A, B, C, D, E
+    (None, [(3, 6, 3), (3, 5, 2), (3, 4, 2), (0, 0, 0), (0, 0, 0)]),
+    (2, [(2, 3, 2), (3, 5, 2), (3, 4, 2), (0, 0, 0), (0, 0, 0)]),
+    (1, [(1, 1, 1), (1, 1, 1), (2, 2, 1), (0, 0, 0), (0, 0, 0)]),
+    (0, [(0, 0, 0)] * 5),
+])
+def test_chain_reachability(chain, max_legs, expected):
+    assert chain.reachability(range(chain.node_count), max_legs) == expected
+    # Отдельный источник дает тот же ответ, что и в общем блоке
+    assert chain.reachability([2], max_legs) == [expected[2]]
+
+
+def test_ring_reachability_spans_several_source_blocks(ring):
+    with NetworkWorkers(ring, processes=1) as workers:
+        report = workers.reachability()
+    assert report['summary'] == {
+        'airports': RING_SIZE, 'edges': RING_SIZE,
+        'reachable_pairs': RING_SIZE * (RING_SIZE - 1), 'reachable_share': 1.0,
+        'avg_legs': RING_SIZE / 2, 'diameter': RING_SIZE - 1,
+    }
+    assert {row['reachable'] for row in report['airports']} == {RING_SIZE - 1}
+
+    with NetworkWorkers(ring, processes=1) as workers:
+        three_legs = workers.reachability(max_legs=3)
+    assert three_legs['summary']['reachable_pairs'] == RING_SIZE * 3
+    assert three_legs['summary']['avg_legs'] == 2.0
+
+
+def test_process_pool_gives_the_same_report(ring):
+    with NetworkWorkers(ring, processes=1) as workers:
+        expected = workers.reachability(max_legs=5)
+    with NetworkWorkers(ring, processes=2) as workers:
+        assert workers.reachability(max_legs=5) == expected
+
+
+def test_find_connections_bulk_in_process_pool(chain):
+    pairs = [("Alpha", "Land", "Delta", "Land"), ("Beta", "Land", "Alpha", "Land"),
+             ("Delta", "Land", "Alpha", "Land"), ("Alpha", "Land", "Epsilon", "Land")]
+    for processes in (1, 2):
+        with NetworkWorkers(chain, processes=processes) as workers:
+            found = workers.find_connections_bulk(pairs)
+        assert [[route['airports'] for route in routes] for routes in found] == [
+            [["AAA", "BBB", "CCC", "DDD"]], [["BBB", "CCC", "AAA"]], [], []]
+        assert found[0][0]['legs'][0]['airlines'] == ["AF", "SU"]
@@ -0,0 +1,406 @@
+"""
+Многопроцессный режим для расчетов по всей сети маршрутов.
+
+Поиск маршрутов с пересадками и обход графа - чистый Python и упираются в
+одно ядро (GIL). NetworkWorkers делит пакетную задачу (список пар городов,
+список аэропортов-источников) на порции и выполняет их в пуле процессов,
+затем собирает результаты в исходном порядке.
+
+Данные сети передаются процессам один раз, а не с каждой порцией:
+RouteNetwork хранит аэропорты и маршруты компактными массивами (номера
+вершин int32, координаты float64, граф - в формате CSR). Там, где есть fork
+(Linux, macOS), процессы пула наследуют массивы родителя без копирования;
+при запуске через spawn (Windows) сеть передается каждому процессу один раз
+при его старте. В порции попадают только параметры задач.
+
+Командная строка:
+    python workers.py reachability [--max-legs N] [--workers N] [--limit N] [--json]
+    python workers.py degrees [--limit N] [--json]
+    (--snapshot [PATH] или --memory - источник данных, как в cli.py)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from repository import AirtravelRepository
+from route_planner import RoutePlanner, RANK_BY_HOPS
+
+# Порций на процесс: мелкие порции выравнивают нагрузку, когда задачи разной длины
+CHUNKS_PER_PROCESS = 4
+# Источников в одном обходе достижимости: по биту uint64 на источник
+SOURCES_PER_PASS = 64
+
+AIRPORTS_QUERY = "SELECT iata, city, country, latitude, longitude FROM airports"
+ROUTES_QUERY = "SELECT airline, src_airport, dst_airport FROM routes"
+
+
+class RouteNetwork:
+    """
+    Аэропорты и маршруты в виде массивов, общих для процессов пула.
+
+    Вершины - коды IATA аэропортов с координатами (как в RoutePlanner), ребра
+    графа - различные пары (вылет, прилет): indices[indptr[v]:indptr[v + 1]] -
+    вершины, куда есть рейсы из v. Те же ребра, упорядоченные по вершине прилета
+    (in_sources, in_targets, in_starts), - для обхода достижимости. Маршруты с
+    авиакомпаниями хранятся отдельно для построения RoutePlanner в процессе пула.
+    """
+
+    def __init__(self, airports: Iterable[Tuple], routes: Iterable[Tuple[str, str, str]]):
+        """
+        airports: (iata, city, country, latitude, longitude)
+        routes: (airline, src_airport, dst_airport)
+        """
+        self.codes: List[str] = []
+        nodes: Dict[str, int] = {}
+        latitudes, longitudes = [], []
+        # Строки аэропортов (вершина, город, страна) - для поиска по городу
+        airport_nodes = []
+        self.airport_cities: List[Tuple[str, str]] = []
+
+        for iata, city, country, latitude, longitude in airports:
+            if not iata or latitude is None or longitude is None:
+                continue
+            node = nodes.get(iata)
+            if node is None:
+                node = nodes[iata] = len(self.codes)
+                self.codes.append(iata)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+            airport_nodes.append(node)
+            self.airport_cities.append((city, country))
+
+        self.latitude = np.array(latitudes, dtype=np.float64)
+        self.longitude = np.array(longitudes, dtype=np.float64)
+        self.airport_node = np.array(airport_nodes, dtype=np.int32)
+
+        # Как и JOIN в SQL-запросах: учитываются только маршруты между известными аэропортами
+        self.airlines: List[str] = []
+        airline_ids: Dict[str, int] = {}
+        route_airline, route_src, route_dst = [], [], []
+        for airline, src, dst in routes:
+            if src in nodes and dst in nodes:
+                if airline not in airline_ids:
+                    airline_ids[airline] = len(self.airlines)
+                    self.airlines.append(airline)
+                route_airline.append(airline_ids[airline])
+                route_src.append(nodes[src])
+                route_dst.append(nodes[dst])
+        self.route_airline = np.array(route_airline, dtype=np.int32)
+        self.route_src = np.array(route_src, dtype=np.int32)
+        self.route_dst = np.array(route_dst, dtype=np.int32)
+
+        # CSR по различным ребрам без петель
+        loops = self.route_src == self.route_dst
+        edges = np.unique(self.route_src[~loops].astype(np.int64) * len(self.codes) + self.route_dst[~loops])
+        edge_src = (edges // max(len(self.codes), 1)).astype(np.int32)
+        self.indices = (edges % max(len(self.codes), 1)).astype(np.int32)
+        self.indptr = np.zeros(len(self.codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_src, minlength=len(self.codes)), out=self.indptr[1:])
+
+        # Ребра по вершине прилета: in_sources[in_starts[i]:in_starts[i + 1]] - откуда есть рейсы в in_targets[i]
+        order = np.argsort(self.indices, kind='stable')
+        self.in_sources = edge_src[order]
+        self.in_targets, self.in_starts = np.unique(self.indices[order], return_index=True)
+
+        self._planner: Optional[RoutePlanner] = None
+
+    @classmethod
+    def from_connection(cls, connection) -> 'RouteNetwork':
+        with connection.cursor() as cursor:
+            cursor.execute(AIRPORTS_QUERY)
+            airports = cursor.fetchall()
+            cursor.execute(ROUTES_QUERY)
+            routes = cursor.fetchall()
+        return cls(airports, routes)
+
+    @classmethod
+    def from_store(cls, store) -> 'RouteNetwork':
+        """Сеть по InMemoryAirtravelStore (или SnapshotStore)"""
+        return cls(((a[4], a[2], a[3], a[6], a[7]) for a in store.airports), store.routes)
+
+    @classmethod
+    def from_backend(cls, backend) -> 'RouteNetwork':
+        """Сеть по источнику repository.py, airtravelDatabase (его соединению) или хранилищу в памяти"""
+        if isinstance(backend, AirtravelRepository):
+            backend = backend.source
+        session = getattr(backend, 'session', None)
+        if session is not None:
+            with session.transaction() as connection:
+                return cls.from_connection(connection)
+        return cls.from_store(backend)
+
+    def __getstate__(self) -> Dict:
+        # Граф RoutePlanner каждый процесс строит сам, по массивам
+        state = self.__dict__.copy()
+        state['_planner'] = None
+        return state
+
+    @property
+    def node_count(self) -> int:
+        return len(self.codes)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    def planner(self) -> RoutePlanner:
+        """RoutePlanner по массивам сети; строится один раз в каждом процессе"""
+        if self._planner is None:
+            latitudes, longitudes = self.latitude.tolist(), self.longitude.tolist()
+            self._planner = RoutePlanner(
+                ((self.codes[node], city, country, latitudes[node], longitudes[node])
+                 for node, (city, country) in zip(self.airport_node.tolist(), self.airport_cities)),
+                zip([self.airlines[airline] for airline in self.route_airline.tolist()],
+                    [self.codes[node] for node in self.route_src.tolist()],
+                    [self.codes[node] for node in self.route_dst.tolist()]))
+        return self._planner
+
+    def node_cities(self) -> List[Tuple[str, str]]:
+        """Город и страна каждой вершины (первого аэропорта с этим кодом IATA)"""
+        cities: List[Optional[Tuple[str, str]]] = [None] * self.node_count
+        for node, city in zip(self.airport_node.tolist(), self.airport_cities):
+            if cities[node] is None:
+                cities[node] = city
+        return cities
+
+    def reachability(self, sources: Sequence[int], max_legs: int = None) -> List[Tuple[int, int, int]]:
+        """
+        Обход в ширину сразу из нескольких (до SOURCES_PER_PASS) вершин: бит i
+        каждой вершины - достигнута ли она из sources[i]. Для каждого источника:
+        число достижимых аэропортов, сумма минимальных чисел перелетов до них и
+        наибольшее из этих чисел
+        """
+        count = len(sources)
+        frontier = np.zeros(self.node_count, dtype=np.uint64)
+        frontier[np.asarray(sources, dtype=np.int64)] = np.uint64(1) << np.arange(count, dtype=np.uint64)
+        visited = frontier.copy()
+        reached = np.zeros(count, dtype=np.int64)
+        total_legs = np.zeros(count, dtype=np.int64)
+        eccentricity = np.zeros(count, dtype=np.int64)
+
+        legs = 0
+        while len(self.in_sources) and (max_legs is None or legs < max_legs):
+            # Вершина достигнута на этом шаге теми источниками, которые достигли
+            # на прошлом шаге хотя бы одну вершину с рейсом в нее
+            incoming = np.bitwise_or.reduceat(frontier[self.in_sources], self.in_starts)
+            frontier = np.zeros(self.node_count, dtype=np.uint64)
+            frontier[self.in_targets] = incoming & ~visited[self.in_targets]
+            if not frontier.any():
+                break
+            legs += 1
+            visited |= frontier
+            bits = np.unpackbits(frontier.astype('<u8').view(np.uint8), bitorder='little')
+            new = bits.reshape(self.node_count, 64).sum(axis=0, dtype=np.int64)[:count]
+            reached += new
+            total_legs += legs * new
+            eccentricity[new > 0] = legs
+        return list(zip(reached.tolist(), total_legs.tolist(), eccentricity.tolist()))
+
+
+# ----------------------------------------------------------------------
+# Задачи для процессов пула: функция(сеть, порция, *параметры) -> результат на каждый элемент порции
+
+def _reachability_task(network: RouteNetwork, blocks: List[List[int]], max_legs: Optional[int]) -> List[List[Tuple]]:
+    return [network.reachability(sources, max_legs) for sources in blocks]
+
+
+def _itineraries_task(network: RouteNetwork, pairs: List[Tuple[str, str, str, str]],
+                      max_stops: int, rank_by: str, limit: int) -> List[List[Dict]]:
+    planner = network.planner()
+    return [planner.find_itineraries(*pair, max_stops, rank_by, limit) for pair in pairs]
+
+
+TASKS: Dict[str, Callable] = {
+    'reachability': _reachability_task,
+    'itineraries': _itineraries_task,
+}
+
+# Сеть в процессе пула: унаследована от родителя (fork) или получена при старте (spawn)
+_network: Optional[RouteNetwork] = None
+
+
+def _init_worker(network: Optional[RouteNetwork]):
+    global _network
+    if network is not None:
+        _network = network
+
+
+def _run_task(task: str, chunk: List, options: Tuple) -> List:
+    return TASKS[task](_network, chunk, *options)
+
+
+class NetworkWorkers:
+    """
+    Пул процессов над одной RouteNetwork. processes=1 - задачи выполняются
+    в текущем процессе теми же функциями (без пула). Пул один на сеть: при
+    создании второго NetworkWorkers с fork процессы получат сеть последнего
+    """
+
+    def __init__(self, network: RouteNetwork, processes: int = None):
+        global _network
+        self.network = network
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = None
+        if self.processes > 1:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                # Процессы пула видят массивы родителя: страницы общие, пока их никто не меняет
+                _network = network
+                context, initargs = multiprocessing.get_context('fork'), (None,)
+            else:
+                context, initargs = multiprocessing.get_context(), (network,)
+            self.pool = context.Pool(self.processes, _init_worker, initargs)
+
+    def __enter__(self) -> 'NetworkWorkers':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def map(self, task: str, items: Sequence, *options) -> List:
+        """Задача task для каждого элемента items; результаты в порядке items"""
+        items = list(items)
+        if not items:
+            return []
+        if self.pool is None:
+            return TASKS[task](self.network, items, *options)
+
+        size = max(1, -(-len(items) // (self.processes * CHUNKS_PER_PROCESS)))
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+        results = []
+        for chunk_results in self.pool.starmap(_run_task, [(task, chunk, options) for chunk in chunks]):
+            results.extend(chunk_results)
+        return results
+
+    def find_connections_bulk(self, pairs: Sequence[Tuple[str, str, str, str]], max_stops: int = 2,
+                              rank_by: str = RANK_BY_HOPS, limit: int = 5) -> List[List[Dict]]:
+        """Маршруты с пересадками для каждой пары городов (формат RoutePlanner.find_itineraries)"""
+        return self.map('itineraries', pairs, max_stops, rank_by, limit)
+
+    def reachability(self, max_legs: int = None) -> Dict:
+        """
+        Достижимость для всех пар аэропортов: для каждого аэропорта - сколько
+        аэропортов достижимо из него (не более чем за max_legs перелетов),
+        среднее и наибольшее минимальное число перелетов
+        """
+        sources = range(self.network.node_count)
+        blocks = [list(sources[start:start + SOURCES_PER_PASS])
+                  for start in range(0, len(sources), SOURCES_PER_PASS)]
+        results = [result for block in self.map('reachability', blocks, max_legs) for result in block]
+        cities = self.network.node_cities()
+
+        airports = []
+        reachable_pairs = total_legs = diameter = 0
+        for node, (reached, legs_sum, eccentricity) in zip(sources, results):
+            reachable_pairs += reached
+            total_legs += legs_sum
+            diameter = max(diameter, eccentricity)
+            city, country = cities[node]
+            airports.append({'iata': self.network.codes[node], 'city': city, 'country': country,
+                             'reachable': reached,
+                             'avg_legs': round(legs_sum / reached, 3) if reached else None,
+                             'max_legs': eccentricity})
+        airports.sort(key=lambda row: (-row['reachable'], row['iata']))
+
+        count = self.network.node_count
+        return {
+            'summary': {
+                'airports': count,
+                'edges': self.network.edge_count,
+                'reachable_pairs': reachable_pairs,
+                'reachable_share': round(reachable_pairs / (count * (count - 1)), 4) if count > 1 else 0.0,
+                'avg_legs': round(total_legs / reachable_pairs, 3) if reachable_pairs else None,
+                'diameter': diameter,
+            },
+            'airports': airports,
+        }
+
+
+def airport_degrees(network: RouteNetwork) -> List[Dict]:
+    """
+    Степени аэропортов: различные направления вылета и прилета и число маршрутов.
+    Считается целиком на массивах в одном процессе - быстрее, чем раздача по пулу
+    """
+    count = network.node_count
+    destinations = np.diff(network.indptr)
+    origins = np.bincount(network.indices, minlength=count)
+    departures = np.bincount(network.route_src, minlength=count)
+    arrivals = np.bincount(network.route_dst, minlength=count)
+    cities = network.node_cities()
+
+    order = np.lexsort((np.arange(count), -(departures + arrivals)))
+    return [{'iata': network.codes[node], 'city': cities[node][0], 'country': cities[node][1],
+             'destinations': int(destinations[node]), 'origins': int(origins[node]),
+             'departures': int(departures[node]), 'arrivals': int(arrivals[node]),
+             'routes': int(departures[node] + arrivals[node])}
+            for node in order.tolist()]
+
+
+def print_table(rows: List[Dict], columns: Tuple[str, ...]):
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join('' if row[column] is None else str(row[column]) for column in columns))
+
+
+def main(argv: List[str] = None) -> int:
+    from cli import open_backend
+
+    parser = argparse.ArgumentParser(description="Расчеты по всей сети маршрутов в нескольких процессах")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--snapshot', nargs='?', const='', metavar='PATH',
+                        help="данные из снимка (по умолчанию SNAPSHOT_PATH), без БД")
+    source.add_argument('--memory', action='store_true', help="загрузить данные из БД в память")
+    parser.add_argument('job', choices=('reachability', 'degrees'))
+    parser.add_argument('--workers', type=int, default=None,
+                        help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument('--max-legs', type=int, default=None, help="наибольшее число перелетов")
+    parser.add_argument('--limit', type=int, default=20, help="строк в таблице аэропортов")
+    parser.add_argument('--json', action='store_true', help="вывод в JSON")
+    args = parser.parse_args(argv)
+
+    # Сообщения о подключении к БД - в stderr, stdout занят отчетом
+    with redirect_stdout(sys.stderr):
+        backend = open_backend(args)
+        if backend is None:
+            return 1
+        try:
+            network = RouteNetwork.from_backend(backend)
+        finally:
+            backend.close()
+
+    started = time.perf_counter()
+    if args.job == 'degrees':
+        report = {'airports': airport_degrees(network)}
+        columns = ('iata', 'city', 'country', 'routes', 'departures', 'arrivals', 'destinations', 'origins')
+    else:
+        with NetworkWorkers(network, args.workers) as workers:
+            report = workers.reachability(args.max_legs)
+        columns = ('iata', 'city', 'country', 'reachable', 'avg_legs', 'max_legs')
+    elapsed = time.perf_counter() - started
+
+    report['airports'] = report['airports'][:args.limit]
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    for name, value in report.get('summary', {}).items():
+        print(f"{name}: {value}")
+    print_table(report['airports'], columns)
+    print(f"Время расчета: {elapsed:.2f} с", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())